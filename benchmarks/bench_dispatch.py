@@ -0,0 +1,61 @@
+"""Micro-benchmark of the per-call cost of sad.sin for each argument type
+
+The "before" column replays the dispatch used before the registry was introduced:
+a chain of comparisons of type(x).__name__ with string literals, followed by a
+try/except AttributeError that detects constants by raising on every call.
+
+Run with: python benchmarks/bench_dispatch.py
+"""
+import timeit
+import numpy as np
+import superautodiff as sad
+from superautodiff import functions
+
+
+def legacy_sin(x):
+    """sad.sin with the string comparison dispatch it used to have"""
+    implementations = functions._DISPATCH['sin']
+    name = type(x).__name__
+    if name == 'AutoDiffVector':
+        return implementations[sad.AutoDiffVector](x)
+    elif name == 'AutoDiffReverse':
+        return implementations[sad.AutoDiffReverse](x)
+    elif name == 'AutoDiffBatch':
+        return implementations[sad.AutoDiffBatch](x)
+    elif name == 'AutoDiffDense':
+        return implementations[sad.AutoDiffDense](x)
+    elif name == 'Dual':
+        return implementations[sad.Dual](x)
+    try:
+        x.var
+        return implementations[sad.AutoDiff](x)
+    except AttributeError:
+        return np.sin(x)
+
+
+def per_call(function, x, number):
+    """Returns the best time of a single call of function(x) in microseconds"""
+    return min(timeit.repeat(lambda: function(x), number=number, repeat=5)) / number * 1e6
+
+
+def main(number=20000):
+    with sad.tape():
+        arguments = [
+            ('float', 0.5),
+            ('AutoDiff', sad.AutoDiff('x', 0.5)),
+            ('Dual', sad.Dual(0.5)),
+            ('AutoDiffDense', sad.AutoDiffDense('x', 0.5, registry=sad.VariableRegistry())),
+            ('AutoDiffBatch', sad.AutoDiffBatch('x', [0.5, 0.6])),
+            ('AutoDiffVector', sad.vectorize(['x', 'y'], [0.5, 0.6])),
+            ('AutoDiffReverse', sad.AutoDiffReverse(0.5, 'x')),
+        ]
+        print('{:<16} {:>12} {:>12} {:>12}'.format('argument', 'before (us)', 'after (us)', 'dispatch (us)'))
+        for name, x in arguments:
+            before = per_call(legacy_sin, x, number)
+            after = per_call(sad.sin, x, number)
+            lookup = per_call(lambda x: functions._dispatch('sin', x), x, number)
+            print('{:<16} {:>12.3f} {:>12.3f} {:>12.3f}'.format(name, before, after, lookup))
+
+
+if __name__ == '__main__':
+    main()
@@ -13,13 +13,14 @@ setuptools.setup(
                  long_description_content_type="text/markdown",
                  url="https://github.com/Team-Gillet/cs207-FinalProject",
                  packages=setuptools.find_packages(),
-                 install_requires=['numpy', 'pandas', 'pytest'],
+                 install_requires=['numpy', 'pytest'],
+                 extras_require={'sparse': ['scipy'], 'table': ['pandas']},
                  classifiers=[
 			        "Programming Language :: Python :: 3",
 			        "License :: OSI Approved :: MIT License",
 			        "Operating System :: OS Independent",
 			    ],
-			    python_requires='>=3.6',
+			    python_requires='>=3.8',
 			)
 # import setuptools
 
@@ -41,5 +42,5 @@ setuptools.setup(
 #         "License :: OSI Approved :: MIT License",
 #         "Operating System :: OS Independent",
 #     ],
-#     python_requires='>=3.6',
+#     python_requires='>=3.8',
 # )
\ No newline at end of file
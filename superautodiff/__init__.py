@@ -1,7 +1,23 @@
-import pandas as pd
 from superautodiff.autodiff import AutoDiff
 from superautodiff.autodiff import AutoDiffVector
+from superautodiff.autodiff import AutoDiffBatch
+from superautodiff.autodiff import Dual
+from superautodiff.autodiff import Taylor
+from superautodiff.autodiff import taylor
+from superautodiff.autodiff import AutoDiffDense
+from superautodiff.autodiff import VariableRegistry
 from superautodiff.autodiff import vectorize
 from superautodiff.autodiffreverse import AutoDiffReverse
 from superautodiff.autodiffreverse import reversepass
+from superautodiff.autodiffreverse import grad
+from superautodiff.autodiffreverse import value_and_grad
+from superautodiff.autodiffreverse import tape
+from superautodiff.autodiffreverse import current_tape
+from superautodiff.tapes import MappedTape, load_tape
 from superautodiff.functions import *
+from superautodiff.sparse import sparse_jacobian, jacobian_sparsity, color_columns
+from superautodiff.hessian import hvp, hessian
+from superautodiff.compiled import compile, CompiledFunction, ControlFlowError, differentiable, DifferentiableFunction
+from superautodiff.codegen import generate, generate_source, load_generated
+from superautodiff.parallel import batch_jacobian
+from superautodiff.checkpointing import checkpoint, checkpoint_loop
@@ -1,7 +1,45 @@
 from collections import Counter
 import math
+import numpy as np
 
-class AutoDiff():
+class ArrayDispatch():
+    """Implements the NumPy dispatch protocols for the autodifferentiation objects
+
+    NumPy ufuncs such as np.sin or np.multiply and functions such as np.sum are routed
+    to the functions in functions.py and to the operators of the object, so NumPy
+    model code can be differentiated unchanged. On object arrays NumPy calls the
+    method named after the ufunc on every element, e.g. x.sin().
+    """
+
+    __slots__ = ()
+
+    # Whether the operators accept NumPy arrays element by element
+    _array_operands = False
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        from superautodiff import functions
+        return functions.array_ufunc(self, ufunc, method, inputs, kwargs)
+
+    def __array_function__(self, func, types, args, kwargs):
+        from superautodiff import functions
+        return functions.array_function(self, func, types, args, kwargs)
+
+
+def _ufunc_method(name):
+    """Returns a method applying the function name of functions.py to the object"""
+    def method(self):
+        from superautodiff import functions
+        return functions.UFUNC_METHODS[name](self)
+    method.__name__ = name
+    method.__doc__ = "Returns the {} of the object".format(name)
+    return method
+
+for _name in ['sin', 'cos', 'tan', 'arcsin', 'arccos', 'arctan', 'exp', 'log', 'log10', 'log2',
+              'sinh', 'cosh', 'tanh', 'sqrt']:
+    setattr(ArrayDispatch, _name, _ufunc_method(_name))
+
+
+class AutoDiff(ArrayDispatch):
     """Creates an object for autodifferentiation
 
     ATTRIBUTES
@@ -78,9 +116,9 @@ class AutoDiff():
             return AutoDiff(self.var, self.val - other, self.der)
 
     def __rsub__(self, other):
-        """Performs subtraction on two AutoDiff objects"""
+        """Performs subtraction of an AutoDiff object from a scalar"""
 
-        return self.__sub__(other)
+        return (-self) + other
 
     def __mul__(self, other):
         """Performs multiplication of an AutoDiff object with scalars and other AutoDiff objects"""
@@ -196,128 +234,911 @@ class AutoDiff():
         except:
             return self.val > other
 
-class AutoDiffVector():
+class Dual(ArrayDispatch):
+    """Creates a dual number for forward mode autodifferentiation in a single variable
+
+    Dual objects hold just two floats in __slots__; results of operations are built
+    with the trusted constructor Dual._make, which skips validation.
+
+    ATTRIBUTES
+    ==========
+    val : the value of the object
+    der : the derivative of the object with respect to the variable
+
+    EXAMPLES
+    ========
+    >>> x = Dual(2)
+    >>> f = x * x + 3 * x
+    >>> f.val, f.der
+    (10.0, 7.0)
+    """
+
+    __slots__ = ('val', 'der')
+
+    def __init__(self, val, der=1.0):
+        if type(val) == list or type(val) == str:
+            raise ValueError("Input value should be integer or float")
+        if type(der) == list or type(der) == str:
+            raise ValueError("Input derivative should be integer or float")
+        self.val = float(val)
+        self.der = float(der)
+
+    @staticmethod
+    def _make(val, der):
+        """Creates a Dual object without validating the inputs"""
+        obj = _new(Dual)
+        obj.val = val
+        obj.der = der
+        return obj
+
+    def __add__(self, other):
+        """Performs addition on two Dual objects"""
+        if type(other) is Dual:
+            return _dual(self.val + other.val, self.der + other.der)
+        return _dual(self.val + other, self.der)
+
+    def __radd__(self, other):
+        """Performs addition on two Dual objects"""
+        return _dual(other + self.val, self.der)
+
+    def __sub__(self, other):
+        """Performs subtraction on two Dual objects"""
+        if type(other) is Dual:
+            return _dual(self.val - other.val, self.der - other.der)
+        return _dual(self.val - other, self.der)
+
+    def __rsub__(self, other):
+        """Performs subtraction on two Dual objects"""
+        return _dual(other - self.val, -self.der)
+
+    def __mul__(self, other):
+        """Performs multiplication of a Dual object with scalars and other Dual objects"""
+        if type(other) is Dual:
+            return _dual(self.val * other.val, self.der * other.val + self.val * other.der)
+        return _dual(self.val * other, self.der * other)
+
+    def __rmul__(self, other):
+        """Performs multiplication of a Dual object with scalars and other Dual objects"""
+        return _dual(other * self.val, other * self.der)
+
+    def __neg__(self):
+        """Returns the negation of a Dual object"""
+        return _dual(-self.val, -self.der)
+
+    def reciprocal(self):
+        """Returns the reciprocal of a Dual object"""
+        inverse = 1 / self.val
+        return _dual(inverse, -self.der * inverse * inverse)
+
+    def __truediv__(self, other):
+        """Performs division of a Dual object with scalars and other Dual objects"""
+        if type(other) is Dual:
+            val = self.val / other.val
+            return _dual(val, (self.der - val * other.der) / other.val)
+        return _dual(self.val / other, self.der / other)
+
+    def __rtruediv__(self, other):
+        """Performs division of a Dual object with scalars and other Dual objects"""
+        val = other / self.val
+        return _dual(val, -val * self.der / self.val)
+
+    def __pow__(self, power):
+        """Performs exponentiation of a Dual object with scalars values e.g x**3 """
+        return _dual(self.val ** power, power * self.val ** (power - 1) * self.der)
+
+    def __rpow__(self, power):
+        """Performs exponentiation of a Dual object with scalars values e.g. 3**x"""
+        value = power ** self.val
+        return _dual(value, value * math.log(power) * self.der)
+
+    def __eq__(self, other):
+        """Assesses the equality of two Dual objects"""
+        if type(other) is Dual:
+            return self.val == other.val and self.der == other.der
+        return False
+
+    def __ne__(self, other):
+        """Assesses the equality of two Dual objects"""
+        return not self.__eq__(other)
+
+    def __lt__(self, other):
+        """Assesses whether a Dual object value is less than that of another Dual object/given value"""
+        return self.val < (other.val if type(other) is Dual else other)
+
+    def __le__(self, other):
+        """Assesses whether a Dual object value is less than or equal to that of another Dual object/given value"""
+        return self.val <= (other.val if type(other) is Dual else other)
+
+    def __ge__(self, other):
+        """Assesses whether a Dual object value is greater than or equal to that of another Dual object/given value"""
+        return self.val >= (other.val if type(other) is Dual else other)
+
+    def __gt__(self, other):
+        """Assesses whether a Dual object value is greater than that of another Dual object/given value"""
+        return self.val > (other.val if type(other) is Dual else other)
+
+
+_new = object.__new__
+_dual = Dual._make
+
+
+def _series_mul(a, b):
+    """Returns the truncated product of two Taylor coefficient arrays"""
+    return np.convolve(a, b)[:len(a)]
+
+def _series_div(a, b):
+    """Returns the truncated quotient of two Taylor coefficient arrays"""
+    c = np.zeros(len(a))
+    c[0] = a[0] / b[0]
+    for k in range(1, len(a)):
+        c[k] = (a[k] - np.dot(b[1:k + 1], c[k - 1::-1])) / b[0]
+    return c
+
+def _series_pow(a, r):
+    """Returns the Taylor coefficients of a ** r for a scalar exponent r"""
+    if a[0] == 0:
+        if r != int(r) or r < 0:
+            raise ValueError("Only non-negative integer powers are defined for series with a zero value")
+        y = np.zeros(len(a))
+        y[0] = 1.0
+        for _ in range(int(r)):
+            y = _series_mul(y, a)
+        return y
+    y = np.zeros(len(a))
+    y[0] = a[0] ** r
+    j = np.arange(len(a))
+    for k in range(1, len(a)):
+        y[k] = np.dot((r * j[1:k + 1] - (k - j[1:k + 1])) * a[1:k + 1], y[k - 1::-1]) / (k * a[0])
+    return y
+
+def _series_exp(a):
+    """Returns the Taylor coefficients of exp(a), using y' = y a'"""
+    y = np.zeros(len(a))
+    y[0] = np.exp(a[0])
+    ja = np.arange(len(a)) * a
+    for k in range(1, len(a)):
+        y[k] = np.dot(ja[1:k + 1], y[k - 1::-1]) / k
+    return y
+
+
+class Taylor(ArrayDispatch):
+    """Creates a truncated Taylor polynomial for derivatives of any order in a single variable
+
+    The coefficients c[k] = f^(k)(x0) / k! of the expansion around x0 are stored in a
+    NumPy array. Products, quotients and the elementary functions are computed with
+    the O(order^2) recurrences on the coefficients, so all the derivatives up to the
+    order come from one evaluation.
+
+    ATTRIBUTES
+    ==========
+    coef : array of the Taylor coefficients, from the value up to the given order
+    val : the value of the object
+    der : the first derivative of the object
+    order : the highest order of the coefficients
+
+    EXAMPLES
+    ========
+    >>> x = Taylor(2.0, order=3)
+    >>> f = x * x * x
+    >>> f.coef
+    array([ 8., 12.,  6.,  1.])
+    >>> f.derivatives()
+    array([ 8., 12., 12.,  6.])
+    """
+
+    def __init__(self, val, order=1, der=1.0):
+        if type(val) == list or type(val) == str:
+            raise ValueError("Input value should be integer or float")
+        if type(order) != int or order < 0:
+            raise ValueError("Order should be a non-negative integer")
+        self.coef = np.zeros(order + 1)
+        self.coef[0] = val
+        if order:
+            self.coef[1] = der
+
+    @classmethod
+    def _make(cls, coef):
+        """Creates a Taylor object from an array of coefficients without validating it"""
+        obj = cls.__new__(cls)
+        obj.coef = coef
+        return obj
+
+    @property
+    def val(self):
+        return self.coef[0]
+
+    @property
+    def der(self):
+        return self.coef[1] if len(self.coef) > 1 else 0.0
+
+    @property
+    def order(self):
+        return len(self.coef) - 1
+
+    def derivatives(self):
+        """Returns the derivatives of the object from order 0 up to its order"""
+        return self.coef * np.cumprod(np.r_[1.0, np.arange(1, len(self.coef))])
+
+    def _other(self, other):
+        """Returns the coefficients of another Taylor object, checking that its order matches"""
+        if len(other.coef) != len(self.coef):
+            raise ValueError("Taylor objects of different orders cannot be combined")
+        return other.coef
+
+    def __add__(self, other):
+        """Performs addition of a Taylor object with scalars and other Taylor objects"""
+        if type(other) is Taylor:
+            return Taylor._make(self.coef + self._other(other))
+        coef = self.coef.copy()
+        coef[0] += other
+        return Taylor._make(coef)
+
+    def __radd__(self, other):
+        """Performs addition of a Taylor object with scalars and other Taylor objects"""
+        return self.__add__(other)
+
+    def __sub__(self, other):
+        """Performs subtraction of a Taylor object with scalars and other Taylor objects"""
+        if type(other) is Taylor:
+            return Taylor._make(self.coef - self._other(other))
+        return self.__add__(-other)
+
+    def __rsub__(self, other):
+        """Performs subtraction of a Taylor object from a scalar"""
+        return (-self).__add__(other)
+
+    def __mul__(self, other):
+        """Performs multiplication of a Taylor object with scalars and other Taylor objects"""
+        if type(other) is Taylor:
+            return Taylor._make(_series_mul(self.coef, self._other(other)))
+        return Taylor._make(self.coef * other)
+
+    def __rmul__(self, other):
+        """Performs multiplication of a Taylor object with scalars and other Taylor objects"""
+        return self.__mul__(other)
+
+    def __neg__(self):
+        """Returns the negation of a Taylor object"""
+        return Taylor._make(-self.coef)
+
+    def reciprocal(self):
+        """Returns the reciprocal of a Taylor object"""
+        one = np.zeros(len(self.coef))
+        one[0] = 1.0
+        return Taylor._make(_series_div(one, self.coef))
+
+    def __truediv__(self, other):
+        """Performs division of a Taylor object with scalars and other Taylor objects"""
+        if type(other) is Taylor:
+            return Taylor._make(_series_div(self.coef, self._other(other)))
+        return Taylor._make(self.coef / other)
+
+    def __rtruediv__(self, other):
+        """Performs division of a scalar by a Taylor object"""
+        return self.reciprocal() * other
+
+    def __pow__(self, power):
+        """Performs exponentiation of a Taylor object with scalars values e.g x**3 """
+        return Taylor._make(_series_pow(self.coef, power))
+
+    def __rpow__(self, power):
+        """Performs exponentiation of a Taylor object with scalars values e.g. 3**x"""
+        return Taylor._make(_series_exp(self.coef * math.log(power)))
+
+    def __eq__(self, other):
+        """Assesses the equality of two Taylor objects"""
+        if type(other) is Taylor:
+            return len(self.coef) == len(other.coef) and bool((self.coef == other.coef).all())
+        return False
+
+    def __ne__(self, other):
+        """Assesses the equality of two Taylor objects"""
+        return not self.__eq__(other)
+
+    def __lt__(self, other):
+        """Assesses whether a Taylor object value is less than that of another Taylor object/given value"""
+        return self.val < (other.val if type(other) is Taylor else other)
+
+    def __le__(self, other):
+        """Assesses whether a Taylor object value is less than or equal to that of another Taylor object/given value"""
+        return self.val <= (other.val if type(other) is Taylor else other)
+
+    def __ge__(self, other):
+        """Assesses whether a Taylor object value is greater than or equal to that of another Taylor object/given value"""
+        return self.val >= (other.val if type(other) is Taylor else other)
+
+    def __gt__(self, other):
+        """Assesses whether a Taylor object value is greater than that of another Taylor object/given value"""
+        return self.val > (other.val if type(other) is Taylor else other)
+
+
+def taylor(f, x0, order=1):
+    """Returns the Taylor coefficients f^(k)(x0) / k! of the scalar function f for k = 0 up to order
+
+    EXAMPLES
+    ========
+    >>> taylor(np.exp, 0.0, order=4)
+    array([1.        , 1.        , 0.5       , 0.16666667, 0.04166667])
+    """
+    y = f(Taylor(x0, order))
+    if type(y) is Taylor:
+        return y.coef
+    coef = np.zeros(order + 1)
+    coef[0] = y
+    return coef
+
+
+class VariableRegistry():
+    """Interns variable names as integer slots of dense derivative arrays
+
+    ATTRIBUTES
+    ==========
+    names : list of the registered variable names, in slot order
+    slots : dictionary mapping each variable name to its slot
+
+    EXAMPLES
+    ========
+    >>> r = VariableRegistry()
+    >>> r.slot("x"), r.slot("y"), r.slot("x")
+    (0, 1, 0)
+    >>> len(r)
+    2
+    """
+
+    def __init__(self):
+        self.names = []
+        self.slots = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def slot(self, name):
+        """Returns the slot of the variable name, registering it if it is new"""
+        try:
+            return self.slots[name]
+        except KeyError:
+            self.slots[name] = len(self.names)
+            self.names.append(name)
+            return self.slots[name]
+
+
+# Registry used by AutoDiffDense objects created without an explicit registry
+default_registry = VariableRegistry()
+
+
+class AutoDiffDense(ArrayDispatch):
+    """Creates an object for forward mode autodifferentiation with dense derivatives
+
+    The derivatives are stored in a float64 array indexed by the slots of a
+    VariableRegistry, so arithmetic on functions of many variables is a handful of
+    vectorised array updates instead of dictionary merges.
+
+    ATTRIBUTES
+    ==========
+    var : name of variables
+    val : the value of the object
+    tangent : array of the derivatives with respect to each registered variable
+    registry : the VariableRegistry mapping variable names to slots of tangent
+    der : the derivative of the object as a Counter keyed by variable name
+
+    EXAMPLES
+    ========
+    >>> r = VariableRegistry()
+    >>> x = AutoDiffDense("x", 2, registry=r)
+    >>> y = AutoDiffDense("y", 3, registry=r)
+    >>> f = x * y + x
+    >>> f.val
+    8.0
+    >>> f.tangent
+    array([4., 2.])
+    >>> f.der['x']
+    4.0
+    """
+
+    def __init__(self, var, val, der=1.0, registry=None):
+
+        if type(var) != str:
+            raise ValueError("Input variable name should be a string")
+        self.var = var
+
+        if type(val) == list or type(val) == str:
+            raise ValueError("Input value should be integer or float")
+        self.val = float(val)
+
+        self.registry = default_registry if registry is None else registry
+        slot = self.registry.slot(var)
+        self.tangent = np.zeros(len(self.registry))
+        self.tangent[slot] = der
+
+    @classmethod
+    def _make(cls, var, val, tangent, registry):
+        """Creates an AutoDiffDense object without validating the inputs"""
+        obj = cls.__new__(cls)
+        obj.var = var
+        obj.val = val
+        obj.tangent = tangent
+        obj.registry = registry
+        return obj
+
+    @property
+    def der(self):
+        names = self.registry.names
+        return Counter({names[i]: float(v) for i, v in enumerate(self.tangent) if v != 0})
+
+    def _tangents(self, other):
+        """Returns the tangents of self and other padded to the same number of variables"""
+        if other.registry is not self.registry:
+            raise ValueError("AutoDiffDense objects with different registries cannot be combined")
+        t1, t2 = self.tangent, other.tangent
+        if len(t1) < len(t2):
+            t1 = np.concatenate([t1, np.zeros(len(t2) - len(t1))])
+        elif len(t2) < len(t1):
+            t2 = np.concatenate([t2, np.zeros(len(t1) - len(t2))])
+        return t1, t2
+
+    def __add__(self, other):
+        """Performs addition on two AutoDiffDense objects"""
+        if isinstance(other, AutoDiffDense):
+            t1, t2 = self._tangents(other)
+            return AutoDiffDense._make(self.var, self.val + other.val, t1 + t2, self.registry)
+        return AutoDiffDense._make(self.var, self.val + other, self.tangent, self.registry)
+
+    def __radd__(self, other):
+        """Performs addition on two AutoDiffDense objects"""
+        return self.__add__(other)
+
+    def __sub__(self, other):
+        """Performs subtraction on two AutoDiffDense objects"""
+        if isinstance(other, AutoDiffDense):
+            t1, t2 = self._tangents(other)
+            return AutoDiffDense._make(self.var, self.val - other.val, t1 - t2, self.registry)
+        return AutoDiffDense._make(self.var, self.val - other, self.tangent, self.registry)
+
+    def __rsub__(self, other):
+        """Performs subtraction on two AutoDiffDense objects"""
+        return AutoDiffDense._make(self.var, other - self.val, -self.tangent, self.registry)
+
+    def __mul__(self, other):
+        """Performs multiplication of an AutoDiffDense object with scalars and other AutoDiffDense objects"""
+        if isinstance(other, AutoDiffDense):
+            t1, t2 = self._tangents(other)
+            return AutoDiffDense._make(self.var, self.val * other.val, other.val * t1 + self.val * t2, self.registry)
+        return AutoDiffDense._make(self.var, self.val * other, other * self.tangent, self.registry)
+
+    def __rmul__(self, other):
+        """Performs multiplication of an AutoDiffDense object with scalars and other AutoDiffDense objects"""
+        return self.__mul__(other)
+
+    def __neg__(self):
+        """Returns the negation of an AutoDiffDense object"""
+        return AutoDiffDense._make(self.var, -self.val, -self.tangent, self.registry)
+
+    def reciprocal(self):
+        """Returns the reciprocal of an AutoDiffDense object"""
+        value = -1 / (self.val * self.val)
+        return AutoDiffDense._make(self.var, 1 / self.val, value * self.tangent, self.registry)
+
+    def __truediv__(self, other):
+        """Performs division of an AutoDiffDense object with scalars and other AutoDiffDense objects"""
+        if isinstance(other, AutoDiffDense):
+            t1, t2 = self._tangents(other)
+            inverse = 1 / other.val
+            val = self.val * inverse
+            return AutoDiffDense._make(self.var, val, inverse * (t1 - val * t2), self.registry)
+        return AutoDiffDense._make(self.var, self.val / other, self.tangent / other, self.registry)
+
+    def __rtruediv__(self, other):
+        """Performs division of an AutoDiffDense object with scalars and other AutoDiffDense objects"""
+        return other * self.reciprocal()
+
+    def __pow__(self, power):
+        """Performs exponentiation of an AutoDiffDense object with scalars values e.g x**3 """
+        value = power * self.val ** (power - 1)
+        return AutoDiffDense._make(self.var, self.val ** power, value * self.tangent, self.registry)
+
+    def __rpow__(self, power):
+        """Performs exponentiation of an AutoDiffDense object with scalars values e.g. 3**x"""
+        value = power ** self.val
+        return AutoDiffDense._make(self.var, value, value * math.log(power) * self.tangent, self.registry)
+
+    def __eq__(self, other):
+        """Assesses the equality of two AutoDiffDense objects"""
+        try:
+            t1, t2 = self._tangents(other)
+            return self.val == other.val and np.array_equal(t1, t2)
+        except (AttributeError, ValueError):
+            return False
+
+    def __ne__(self, other):
+        """Assesses the equality of two AutoDiffDense objects"""
+        return not self.__eq__(other)
+
+    def __lt__(self, other):
+        """Assesses whether an AutoDiffDense object value is less than that of another object/given value"""
+        return self.val < getattr(other, 'val', other)
+
+    def __le__(self, other):
+        """Assesses whether an AutoDiffDense object value is less than or equal to that of another object/given value"""
+        return self.val <= getattr(other, 'val', other)
+
+    def __ge__(self, other):
+        """Assesses whether an AutoDiffDense object value is greater than or equal to that of another object/given value"""
+        return self.val >= getattr(other, 'val', other)
+
+    def __gt__(self, other):
+        """Assesses whether an AutoDiffDense object value is greater than that of another object/given value"""
+        return self.val > getattr(other, 'val', other)
+
+
+class AutoDiffBatch(ArrayDispatch):
+    """Creates an object for forward mode autodifferentiation at a batch of points
+
+    The value and every derivative are NumPy arrays of shape (batch,), so each
+    operation is a single NumPy call per variable instead of one object per point.
+
+    ATTRIBUTES
+    ==========
+    var : name of variables
+    val : the values of the object at each point
+    der : dictionary of the derivatives of the object at each point
+
+    EXAMPLES
+    ========
+    >>> x = AutoDiffBatch("x", [1, 2, 3])
+    >>> x.val
+    array([1., 2., 3.])
+    >>> (x * x).der['x']
+    array([2., 4., 6.])
+    """
+
+    _array_operands = True
+
+    def __init__(self, var, val, der=1.0):
+
+        if type(var) != str:
+            raise ValueError("Input variable name should be a string")
+        self.var = var
+
+        if type(val) == str:
+            raise ValueError("Input values should be an array of integers or floats")
+        val = np.asarray(val, dtype=float)
+        if val.ndim != 1:
+            raise ValueError("Input values should be a one-dimensional array")
+        self.val = val
+
+        if type(der) == dict:
+            self.der = der
+        else:
+            self.der = {var: np.broadcast_to(np.asarray(der, dtype=float), val.shape).copy()}
+
+    @classmethod
+    def _make(cls, var, val, der):
+        """Creates an AutoDiffBatch object without validating the inputs"""
+        obj = cls.__new__(cls)
+        obj.var = var
+        obj.val = val
+        obj.der = der
+        return obj
+
+    def __add__(self, other):
+        """Performs addition on two AutoDiffBatch objects"""
+        if isinstance(other, AutoDiffBatch):
+            return AutoDiffBatch._make(self.var, self.val + other.val, _merge(self.der, other.der))
+        return AutoDiffBatch._make(self.var, self.val + other, self.der)
+
+    def __radd__(self, other):
+        """Performs addition on two AutoDiffBatch objects"""
+        return self.__add__(other)
+
+    def __sub__(self, other):
+        """Performs subtraction on two AutoDiffBatch objects"""
+        if isinstance(other, AutoDiffBatch):
+            return AutoDiffBatch._make(self.var, self.val - other.val, _merge(self.der, other.der, None, -1.0))
+        return AutoDiffBatch._make(self.var, self.val - other, self.der)
+
+    def __rsub__(self, other):
+        """Performs subtraction on two AutoDiffBatch objects"""
+        return AutoDiffBatch._make(self.var, other - self.val, _merge({}, self.der, None, -1.0))
+
+    def __mul__(self, other):
+        """Performs multiplication of an AutoDiffBatch object with scalars, arrays and other AutoDiffBatch objects"""
+        if isinstance(other, AutoDiffBatch):
+            der = _merge(self.der, other.der, other.val, self.val)
+            return AutoDiffBatch._make(self.var, self.val * other.val, der)
+        return AutoDiffBatch._make(self.var, self.val * other, _merge({}, self.der, None, other))
+
+    def __rmul__(self, other):
+        """Performs multiplication of an AutoDiffBatch object with scalars, arrays and other AutoDiffBatch objects"""
+        return self.__mul__(other)
+
+    def __neg__(self):
+        """Returns the negation of an AutoDiffBatch object"""
+        return AutoDiffBatch._make(self.var, -self.val, _merge({}, self.der, None, -1.0))
+
+    def reciprocal(self):
+        """Returns the reciprocal of an AutoDiffBatch object"""
+        value = -1 / (self.val * self.val)
+        return AutoDiffBatch._make(self.var, 1 / self.val, _merge({}, self.der, None, value))
+
+    def __truediv__(self, other):
+        """Performs division of an AutoDiffBatch object with scalars, arrays and other AutoDiffBatch objects"""
+        if isinstance(other, AutoDiffBatch):
+            inverse = 1 / other.val
+            val = self.val * inverse
+            der = _merge(self.der, other.der, inverse, -val * inverse)
+            return AutoDiffBatch._make(self.var, val, der)
+        return AutoDiffBatch._make(self.var, self.val / other, _merge({}, self.der, None, 1 / other))
+
+    def __rtruediv__(self, other):
+        """Performs division of an AutoDiffBatch object with scalars, arrays and other AutoDiffBatch objects"""
+        return other * self.reciprocal()
+
+    def __pow__(self, power):
+        """Performs exponentiation of an AutoDiffBatch object with scalars values e.g x**3 """
+        value = power * self.val ** (power - 1)
+        return AutoDiffBatch._make(self.var, self.val ** power, _merge({}, self.der, None, value))
+
+    def __rpow__(self, power):
+        """Performs exponentiation of an AutoDiffBatch object with scalars values e.g. 3**x"""
+        value = power ** self.val
+        return AutoDiffBatch._make(self.var, value, _merge({}, self.der, None, value * math.log(power)))
+
+    def __eq__(self, other):
+        """Assesses the equality of two AutoDiffBatch objects"""
+        try:
+            return (np.array_equal(self.val, other.val) and self.der.keys() == other.der.keys()
+                    and all(np.array_equal(v, other.der[k]) for k, v in self.der.items()))
+        except AttributeError:
+            return False
+
+    def __ne__(self, other):
+        """Assesses the equality of two AutoDiffBatch objects"""
+        return not self.__eq__(other)
+
+    def __lt__(self, other):
+        """Compares the values of an AutoDiffBatch object with those of another object point by point"""
+        return self.val < getattr(other, 'val', other)
+
+    def __le__(self, other):
+        """Compares the values of an AutoDiffBatch object with those of another object point by point"""
+        return self.val <= getattr(other, 'val', other)
+
+    def __ge__(self, other):
+        """Compares the values of an AutoDiffBatch object with those of another object point by point"""
+        return self.val >= getattr(other, 'val', other)
+
+    def __gt__(self, other):
+        """Compares the values of an AutoDiffBatch object with those of another object point by point"""
+        return self.val > getattr(other, 'val', other)
+
+
+def _merge(der1, der2, scale1=None, scale2=None):
+    """Returns the dictionary scale1 * der1 + scale2 * der2, treating missing keys as zero"""
+    der = dict(der1) if scale1 is None else {k: scale1 * v for k, v in der1.items()}
+    for k, v in der2.items():
+        if scale2 is not None:
+            v = scale2 * v
+        der[k] = der[k] + v if k in der else v
+    return der
+
+
+class AutoDiffVector(ArrayDispatch):
+    """Creates a vector of AutoDiff objects backed by NumPy arrays
+
+    The values of the elements are stored in a 1-D array and their derivatives in a
+    2-D (n_elements x n_vars) matrix whose columns are mapped to variable names by a
+    VariableRegistry, so arithmetic is vectorised over the whole vector. Operations
+    with scalars, arrays, AutoDiff objects and other AutoDiffVector objects are
+    applied element by element with NumPy broadcasting.
+
+    ATTRIBUTES
+    ==========
+    variables : list of the names of the elements
+    val : array of the values of the elements
+    der : matrix of the derivatives of the elements with respect to each variable
+    registry : VariableRegistry mapping variable names to columns of der
+    objects : dictionary of the elements as AutoDiff objects, keyed by name
+
+    EXAMPLES
+    ========
+    >>> v = vectorize(["x", "y"], [1, 2])
+    >>> w = v * v + 1
+    >>> w.val
+    array([2., 5.])
+    >>> w.der
+    array([[2., 0.],
+           [0., 4.]])
+    """
+
+    _array_operands = True
+
     def __init__(self, objects):
-        
-        self.objects = {}
+
         self.variables = []
-        
-        # Create dictionary of variables and the AutoDiff objects
+        self.registry = VariableRegistry()
+
+        # Register the names of the elements and of the variables they depend on
         for i in range(len(objects)):
-            if type(objects[i]).__name__ is not 'AutoDiff':
+            if type(objects[i]) is not AutoDiff:
                 raise ValueError('Variable inputs need to be AutoDiff objects!')
 
-            self.objects[objects[i].var] = objects[i]
             self.variables.append(objects[i].var)
-            
+            for name in objects[i].der:
+                self.registry.slot(name)
+
         if len(self.variables) != len(set(self.variables)):
             raise ValueError("Variable names cannot be the same")
-        
-        
-    def __add__(self, other):
-        """Performs addition of an AutoDiffVector object and either a scalar or an AutoDiff object"""
 
-        objects = []
-        for i in range(len(self.objects)):
-            new_object = self.objects[list(self.objects.keys())[i]] + other
-            objects.append(new_object)
+        self.val = np.array([obj.val for obj in objects], dtype=float)
+        self.der = np.zeros((len(objects), len(self.registry)))
+        for i, obj in enumerate(objects):
+            for name, value in obj.der.items():
+                self.der[i, self.registry.slots[name]] = value
+        self._objects = None
+
+    @classmethod
+    def _make(cls, variables, val, der, registry):
+        """Creates an AutoDiffVector object without validating the inputs"""
+        obj = cls.__new__(cls)
+        obj.variables = variables
+        obj.val = val
+        obj.der = der
+        obj.registry = registry
+        obj._objects = None
+        return obj
+
+    @property
+    def objects(self):
+        if self._objects is None:
+            names = self.registry.names
+            self._objects = {}
+            for i, var in enumerate(self.variables):
+                der = Counter({names[j]: float(v) for j, v in enumerate(self.der[i]) if v != 0})
+                self._objects[var] = AutoDiff(var, self.val[i], der)
+        return self._objects
+
+    def __len__(self):
+        return len(self.variables)
+
+    def __getitem__(self, index):
+        """Returns an element of an AutoDiffVector object as an AutoDiff object, or a slice of it as an AutoDiffVector object
+
+        Slices share the registry of the vector, so they can be combined with each other.
+        """
+        if isinstance(index, (int, np.integer)):
+            names = self.registry.names
+            der = Counter({names[j]: float(v) for j, v in enumerate(self.der[index]) if v != 0})
+            return AutoDiff(self.variables[index], self.val[index], der)
+        if isinstance(index, slice):
+            variables = self.variables[index]
+        else:
+            index = np.asarray(index)
+            if index.dtype == bool:
+                index = np.flatnonzero(index)
+            variables = [self.variables[i] for i in index.tolist()]
+        return AutoDiffVector._make(variables, self.val[index], self.der[index], self.registry)
+
+    def sum(self):
+        """Returns the sum of the elements of an AutoDiffVector object as an AutoDiff object"""
+        names = self.registry.names
+        der = Counter({names[j]: float(v) for j, v in enumerate(self.der.sum(axis=0)) if v != 0})
+        return AutoDiff(self.variables[0], self.val.sum(), der)
+
+    def _der(self, width):
+        """Returns der padded with zero columns to the given number of variables"""
+        if self.der.shape[1] == width:
+            return self.der
+        return np.concatenate([self.der, np.zeros((self.der.shape[0], width - self.der.shape[1]))], axis=1)
+
+    def _operands(self, other):
+        """Returns the values and derivatives of self and other over a common set of variables
+
+        The derivative of a constant other is None.
+        """
+        registry = self.registry
+        if type(other) is AutoDiffVector:
+            if other.registry is not registry:
+                columns = [registry.slot(name) for name in other.registry.names[:other.der.shape[1]]]
+                width = len(registry)
+                other_der = np.zeros((other.der.shape[0], width))
+                other_der[:, columns] = other.der
+            else:
+                width = len(registry)
+                other_der = other._der(width)
+            if len(self.variables) != len(other.variables) and 1 not in (len(self.variables), len(other.variables)):
+                raise ValueError("AutoDiffVector objects need to be of the same length")
+            return self.val, self._der(width), other.val, other_der
+        if type(other) is AutoDiff:
+            columns = [registry.slot(name) for name in other.der]
+            width = len(registry)
+            other_der = np.zeros((1, width))
+            other_der[0, columns] = list(other.der.values())
+            return self.val, self._der(width), other.val, other_der
+        return self.val, self.der, other, None
+
+    def _result(self, other, val, der):
+        """Returns the AutoDiffVector holding the result of an operation of self with other"""
+        variables = self.variables
+        if type(other) is AutoDiffVector and len(other.variables) > len(variables):
+            variables = other.variables
+        elif len(variables) != len(val):
+            # A single element broadcast against an array gets indexed names
+            variables = ['{}[{}]'.format(variables[0], i) for i in range(len(val))]
+        return AutoDiffVector._make(variables, val, der, self.registry)
+
+    def __add__(self, other):
+        """Performs addition of an AutoDiffVector object and either a scalar, an array, an AutoDiff or an AutoDiffVector object"""
+        a, da, b, db = self._operands(other)
+        der = da if db is None else da + db
+        return self._result(other, a + b, der)
 
-        return AutoDiffVector(objects)
-    
     def __radd__(self, other):
-        """Performs right addition of an AutoDiffVector object and either a scalar or an AutoDiff object"""
-        objects = []
-        for i in range(len(self.objects)):
-            new_object = self.objects[list(self.objects.keys())[i]] + other
-            objects.append(new_object)
-
-        return AutoDiffVector(objects)
+        """Performs right addition of an AutoDiffVector object and either a scalar, an array or an AutoDiff object"""
+        return self.__add__(other)
 
     def __sub__(self, other):
-        """Performs subtraction of an AutoDiffVector object and either a scalar or an AutoDiff object"""
-        objects = []
-        for i in range(len(self.objects)):
-            new_object = self.objects[list(self.objects.keys())[i]] - other
-            objects.append(new_object)
-            
-        return AutoDiffVector(objects)
-
-    def __rsub__(self,other):
-        """Performs right subtraction of an AutoDiffVector object and either a scalar or an AutoDiff object"""
-
-        objects = []
-        for i in range(len(self.objects)):
-            new_object = other - self.objects[list(self.objects.keys())[i]]
-            objects.append(new_object)
-            
-        return AutoDiffVector(objects)
+        """Performs subtraction of an AutoDiffVector object and either a scalar, an array, an AutoDiff or an AutoDiffVector object"""
+        a, da, b, db = self._operands(other)
+        der = da if db is None else da - db
+        return self._result(other, a - b, der)
 
-    def __mul__(self, other):
-        """Performs multiplication of an AutoDiffVector object and either a scalar or an AutoDiff object"""
+    def __rsub__(self, other):
+        """Performs right subtraction of an AutoDiffVector object and either a scalar, an array or an AutoDiff object"""
+        a, da, b, db = self._operands(other)
+        der = -da if db is None else db - da
+        return self._result(other, b - a, der)
 
-        objects = []
-        for i in range(len(self.objects)):
-            new_object = self.objects[list(self.objects.keys())[i]] * other
-            objects.append(new_object)
-            
-        return AutoDiffVector(objects)
+    def __mul__(self, other):
+        """Performs multiplication of an AutoDiffVector object and either a scalar, an array, an AutoDiff or an AutoDiffVector object"""
+        a, da, b, db = self._operands(other)
+        if db is None:
+            der = da * np.reshape(b, (-1, 1)) if np.ndim(b) else da * b
+        else:
+            der = da * np.reshape(b, (-1, 1)) + db * a[:, None]
+        return self._result(other, a * b, der)
 
     def __rmul__(self, other):
-        """Performs right multiplication of an AutoDiffVector object and either a scalar or an AutoDiff object"""
+        """Performs right multiplication of an AutoDiffVector object and either a scalar, an array or an AutoDiff object"""
         return self.__mul__(other)
 
     def __neg__(self):
-        """Performs negation of an AutoDiffVector object and either a scalar or an AutoDiff object"""
-
-        objects = []
-        for i in range(len(self.objects)):
-            new_object = -self.objects[list(self.objects.keys())[i]]
-            objects.append(new_object)
-            
-        return AutoDiffVector(objects)
+        """Performs negation of an AutoDiffVector object"""
+        return AutoDiffVector._make(self.variables, -self.val, -self.der, self.registry)
 
+    def reciprocal(self):
+        """Returns the reciprocal of each element of an AutoDiffVector object"""
+        val = 1 / self.val
+        return AutoDiffVector._make(self.variables, val, self.der * (-val * val)[:, None], self.registry)
 
     def __truediv__(self, other):
-        """Performs division of an AutoDiffVector object and either a scalar or an AutoDiff object"""
-
-        objects = []
-        for i in range(len(self.objects)):
-            new_object = (self.objects[list(self.objects.keys())[i]])/other
-            objects.append(new_object)
-            
-        return AutoDiffVector(objects)
+        """Performs division of an AutoDiffVector object and either a scalar, an array, an AutoDiff or an AutoDiffVector object"""
+        a, da, b, db = self._operands(other)
+        val = a / b
+        if db is None:
+            der = da / np.reshape(b, (-1, 1)) if np.ndim(b) else da / b
+        else:
+            b = np.reshape(b, (-1, 1))
+            der = (da - np.reshape(val, (-1, 1)) * db) / b
+        return self._result(other, val, der)
 
     def __rtruediv__(self, other):
-        """Performs right division of an AutoDiffVector object and either a scalar or an AutoDiff object"""
-        #raise NotImplementedError("Division of AutoDiff object with AutoDiffVector object not implemented")
-        
-        objects = []
-        for i in range(len(self.objects)):
-            new_object = (self.objects[list(self.objects.keys())[i]]).reciprocal() * other
-            objects.append(new_object)
-        return AutoDiffVector(objects)
-        #return other * self.reciprocal()
+        """Performs right division of an AutoDiffVector object and either a scalar, an array or an AutoDiff object"""
+        a, da, b, db = self._operands(other)
+        val = b / a
+        der = -(val / a)[:, None] * da
+        if db is not None:
+            der = der + db / a[:, None]
+        return self._result(other, val, der)
 
     def __pow__(self, other):
-        """Performs exponentiation of an AutoDiffVector object and either a scalar or an AutoDiff object"""
-
-        objects = []
-        for i in range(len(self.objects)):
-            new_object = (self.objects[list(self.objects.keys())[i]]) ** other
-            objects.append(new_object)
-            
-        return AutoDiffVector(objects)
+        """Performs exponentiation of an AutoDiffVector object with a scalar"""
+        value = other * self.val ** (other - 1)
+        return AutoDiffVector._make(self.variables, self.val ** other, self.der * value[:, None], self.registry)
 
     def __rpow__(self, other):
-        """Performs right exponentiation of an AutoDiffVector object and either a scalar or an AutoDiff object"""
-
-        objects = []
-        for i in range(len(self.objects)):
-            new_object = other ** (self.objects[list(self.objects.keys())[i]])
-            objects.append(new_object)
-
-        return AutoDiffVector(objects)
-
+        """Performs right exponentiation of an AutoDiffVector object with a scalar"""
+        val = other ** self.val
+        return AutoDiffVector._make(self.variables, val, self.der * (val * math.log(other))[:, None], self.registry)
 
 
 def vectorize(var, val, der=1.0):
@@ -347,13 +1168,16 @@ def vectorize(var, val, der=1.0):
     if len(var) != len(set(var)):
         raise ValueError("Variable names cannot be the same")
 
-    # If everything checks out, create AutoDiff objects and to convert into an AutoDiffVector object
-    objects = []
+    # Ensure that the variable names are strings
+    if any(type(name) != str for name in var):
+        raise ValueError("Input variable names should be strings")
+
+    # If everything checks out, build the values and the diagonal derivative matrix directly
+    registry = VariableRegistry()
+    for name in var:
+        registry.slot(name)
 
-    for i in range(len(var)):
-        objects.append(AutoDiff(var[i], val[i], der[i]))
-    
-    return AutoDiffVector(objects)
+    return AutoDiffVector._make(list(var), np.array(val, dtype=float), np.diag(np.array(der, dtype=float)), registry)
 
 # Helper function required for variable naming
 def round_3sf(x, sig=3):
@@ -1,18 +1,66 @@
-import pandas as pd
+import contextvars
+import functools
+from contextlib import contextmanager
 import numpy as np
+from superautodiff.tapes import Tape, OP_CODES
+from superautodiff.autodiff import ArrayDispatch
 
-forward_pass_index = 0
-forward_pass = pd.DataFrame(columns=['Node', 'd1', 'd1value', 'd2', 'd2value'])
+# Tape used outside of any tape() block; it is shared by every thread
+forward_pass = Tape()
+_current_tape = contextvars.ContextVar('superautodiff_tape', default=forward_pass)
 
+# Op codes of the operators
+_CUSTOM, _ADD, _SUB, _MUL, _DIV = (OP_CODES[name] for name in ('custom', 'add', 'sub', 'mul', 'div'))
+_ADDC, _SUBC, _RSUBC, _MULC, _DIVC, _RDIVC, _POWC, _RPOWC = (
+    OP_CODES[name] for name in ('addc', 'subc', 'rsubc', 'mulc', 'divc', 'rdivc', 'powc', 'rpowc'))
 
-class AutoDiffReverse():
-    """Creates an object for AutoDiffReverseerentiation
+
+def current_tape():
+    """Returns the Tape that new AutoDiffReverse variables are recorded on"""
+    return _current_tape.get()
+
+
+@contextmanager
+def tape(t=None):
+    """Records the AutoDiffReverse variables created inside the block on a new Tape, or on t
+
+    The tape is stored in a context variable, so every thread and every asyncio task
+    entering the block gets its own isolated tape and node counter. Gradients have to
+    be taken inside the block: the tape is released when the block exits. Passing a
+    MappedTape as t records graphs larger than memory.
+
+    EXAMPLES
+    ========
+    >>> with tape() as t:
+    ...     x = AutoDiffReverse(3, 'x')
+    ...     f = x * x
+    ...     len(t), f.backward()
+    (2, array([6.]))
+    >>> len(t)
+    0
+    """
+    t = Tape() if t is None else t
+    token = _current_tape.set(t)
+    try:
+        yield t
+    finally:
+        _current_tape.reset(token)
+        t.release()
+
+
+class AutoDiffReverse(ArrayDispatch):
+    """Creates an object for reverse mode automatic differentiation
+
+    Every AutoDiffReverse object is a node on a Tape; operations append new nodes
+    holding the ids of their parents and the local partial derivatives.
 
     ATTRIBUTES
     ==========
     var : name of variables
     val : the value of the object
-    der : the derivative of the object
+    der : the local derivatives of the object with respect to its parents
+    tape : the Tape the object is recorded on
+    id : the integer id of the object on its tape
 
     EXAMPLES
     ========
@@ -22,45 +70,77 @@ class AutoDiffReverse():
     >>> x.val
     4.0
     >>> x.der
-    {'x': 1}
+    {'x': 1.0}
     """
 
     def __init__(self, val, var=None, der=1.0):
-        global forward_pass
-        if not var:
-            global forward_pass_index
-            var = 'y' + str(forward_pass_index + 1)
-            forward_pass_index += 1
-            self.var = var
-        else:
-            self.var = var
         if type(val) == list or type(val) == str:
             raise ValueError("Input value should be integer or float")
-        else:
-            self.val = float(val)
+        self.val = float(val)
+        self.tape = _current_tape.get()
         if type(der) != float:
-            self.der = der
-            if len(list(der.keys())) > 1:
-                row = pd.DataFrame(
-                    [[var, list(der.keys())[0], list(der.values())[0], list(der.keys())[1], list(der.values())[1]]],
-                    columns=['Node', 'd1', 'd1value', 'd2', 'd2value'])
-                forward_pass = forward_pass.append(row)
+            # Local derivatives given as a dictionary of parent names
+            parents = [(self.tape.lookup(k), v) for k, v in der.items()]
+            if len(parents) > 1:
+                (p1, d1), (p2, d2) = parents[0], parents[1]
+                self.id = self.tape.record(self.val, p1, d1, p2, d2, name=var, op=_CUSTOM)
             else:
-                row = pd.DataFrame([[var, list(der.keys())[0], list(der.values())[0], '-', '-']],
-                                   columns=['Node', 'd1', 'd1value', 'd2', 'd2value'])
-                forward_pass = forward_pass.append(row)
+                self.id = self.tape.record(self.val, parents[0][0], parents[0][1], name=var, op=_CUSTOM)
         else:
-            self.der = {var: 1}
-            row = pd.DataFrame([[var, var, 1, '-', '-']], columns=['Node', 'd1', 'd1value', 'd2', 'd2value'])
-            forward_pass = forward_pass.append(row)
+            self.id = self.tape.record(self.val, name=var)
+
+    @classmethod
+    def _record(cls, tape, val, p1, d1, p2=-1, d2=0.0, op=0, c=0.0):
+        """Records a new node on tape without validating the inputs"""
+        node = cls.__new__(cls)
+        node.val = val
+        node.tape = tape
+        node.id = tape.record(val, p1, d1, p2, d2, None, op, c)
+        return node
+
+    @classmethod
+    def _leaves(cls, tape, values):
+        """Records one leaf per element of values on tape and returns them in an object array of the same shape"""
+        values = np.asarray(values, dtype=float)
+        first = tape.record_leaves(values)
+        nodes = np.empty(values.shape, dtype=object)
+        flat = nodes.reshape(-1)
+        new = cls.__new__
+        for k, val in enumerate(values.ravel().tolist()):
+            node = new(cls)
+            node.val = val
+            node.tape = tape
+            node.id = first + k
+            flat[k] = node
+        return nodes
+
+    def _check_tape(self, other):
+        """Raises a ValueError if other is recorded on a different tape"""
+        if other.tape is not self.tape:
+            raise ValueError("AutoDiffReverse objects recorded on different tapes cannot be combined")
+
+    @property
+    def var(self):
+        return self.tape.name(self.id)
+
+    @property
+    def der(self):
+        (p1, p2), (d1, d2) = self.tape.edges(self.id)
+        if p1 < 0:
+            return {self.var: 1.0}
+        der = {self.tape.name(p1): d1}
+        if p2 >= 0:
+            name = self.tape.name(p2)
+            der[name] = der.get(name, 0.0) + d2
+        return der
 
     def __add__(self, other):
         """Performs addition on two AutoDiffReverse objects"""
         try:
-            total = {self.var: 1, other.var: 1}
-            return AutoDiffReverse(self.val + other.val, None, der=total)
+            self._check_tape(other)
+            return AutoDiffReverse._record(self.tape, self.val + other.val, self.id, 1.0, other.id, 1.0, _ADD)
         except AttributeError:
-            return AutoDiffReverse(self.val + other, None, {self.var: 1})
+            return AutoDiffReverse._record(self.tape, self.val + other, self.id, 1.0, op=_ADDC, c=other)
 
     def __radd__(self, other):
         """Performs addition on two AutoDiffReverse objects"""
@@ -69,29 +149,25 @@ class AutoDiffReverse():
     def __sub__(self, other):
         """Performs subtraction on two AutoDiffReverse objects"""
         try:
-            total = {self.var: 1, other.var: -1}
-            return AutoDiffReverse(self.val - other.val, None, der=total)
+            self._check_tape(other)
+            return AutoDiffReverse._record(self.tape, self.val - other.val, self.id, 1.0, other.id, -1.0, _SUB)
         except AttributeError:
-            return AutoDiffReverse(self.val - other, None, {self.var: 1})
+            return AutoDiffReverse._record(self.tape, self.val - other, self.id, 1.0, op=_SUBC, c=other)
 
     def __rsub__(self, other):
         """Performs subtraction on two AutoDiffReverse objects"""
-        try:
-            total = {self.var: 1, other.var: -1}
-            return AutoDiffReverse(self.val - other.val, None, der=total)
-        except AttributeError:
-            return AutoDiffReverse(self.val - other, None, {self.var: -1})
+        return AutoDiffReverse._record(self.tape, other - self.val, self.id, -1.0, op=_RSUBC, c=other)
 
     def __mul__(self, other):
-        """Performs subtraction on two AutoDiffReverse objects"""
+        """Performs multiplication on two AutoDiffReverse objects"""
         try:
-            total = {self.var: other.val, other.var: self.val}
-            return AutoDiffReverse(self.val * other.val, None, total)
+            self._check_tape(other)
+            return AutoDiffReverse._record(self.tape, self.val * other.val, self.id, other.val, other.id, self.val, _MUL)
         except AttributeError:
-            return AutoDiffReverse(self.val * other, None, {self.var: other})
+            return AutoDiffReverse._record(self.tape, self.val * other, self.id, other, op=_MULC, c=other)
 
     def __rmul__(self, other):
-        """Performs subtraction on two AutoDiffReverse objects"""
+        """Performs multiplication on two AutoDiffReverse objects"""
         return self.__mul__(other)
 
     def __neg__(self):
@@ -101,59 +177,168 @@ class AutoDiffReverse():
     def __pow__(self, power):
         """Performs exponentiation of an AutoDiffReverse object with scalars values e.g x**3 """
         value = power * (self.val) ** (power - 1)
-        der = {k: value * v for k, v in self.der.items()}
-        return AutoDiffReverse(self.val ** power, None, der)
+        return AutoDiffReverse._record(self.tape, self.val ** power, self.id, value, op=_POWC, c=power)
 
     def __rpow__(self, power):
         """Performs exponentiation of an AutoDiffReverse object with scalars values e.g. 3**x"""
         value = power ** self.val
-        der = {k: value * v * np.log(power) for k, v in self.der.items()}
-        return AutoDiffReverse(value, None, der)
+        return AutoDiffReverse._record(self.tape, value, self.id, value * np.log(power), op=_RPOWC, c=power)
 
     def __truediv__(self, other):
         """Performs division of an AutoDiffReverse object with scalars and other AutoDiffReverse objects"""
         try:
+            self._check_tape(other)
             value = -1 / (other.val * other.val)
-            total = {self.var: 1 / other.val, other.var: value * self.val}
-            return AutoDiffReverse(self.val / other.val, None, total)
+            return AutoDiffReverse._record(self.tape, self.val / other.val, self.id, 1 / other.val,
+                                           other.id, value * self.val, _DIV)
         except AttributeError:
-            total = {self.var: 1 / other}
-            return AutoDiffReverse(self.val / other, None, total)
+            return AutoDiffReverse._record(self.tape, self.val / other, self.id, 1 / other, op=_DIVC, c=other)
 
     def __rtruediv__(self, other):
         """Performs division of an AutoDiffReverse object with scalars and other AutoDiffReverse objects"""
         value = -1 / (self.val * self.val)
-        total = {self.var: other * value}
-        return AutoDiffReverse(other / self.val, None, total)
-    
+        return AutoDiffReverse._record(self.tape, other / self.val, self.id, other * value, op=_RDIVC, c=other)
+
+    def _compare(self, other, op, outcome):
+        """Returns the outcome of a comparison of the object with other, recording it on a tape that is traced"""
+        if isinstance(other, AutoDiffReverse):
+            self._check_tape(other)
+            if self.tape.tracing:
+                self.tape.guards.append((op, self.id, other.id, 0.0, outcome))
+        elif self.tape.tracing:
+            self.tape.guards.append((op, self.id, -1, float(other), outcome))
+        return outcome
+
+    def __lt__(self, other):
+        """Assesses whether the value of an AutoDiffReverse object is less than that of another AutoDiffReverse object/given value"""
+        return self._compare(other, 'lt', self.val < getattr(other, 'val', other))
+
+    def __le__(self, other):
+        """Assesses whether the value of an AutoDiffReverse object is less than or equal to that of another AutoDiffReverse object/given value"""
+        return self._compare(other, 'le', self.val <= getattr(other, 'val', other))
+
+    def __gt__(self, other):
+        """Assesses whether the value of an AutoDiffReverse object is greater than that of another AutoDiffReverse object/given value"""
+        return self._compare(other, 'gt', self.val > getattr(other, 'val', other))
+
+    def __ge__(self, other):
+        """Assesses whether the value of an AutoDiffReverse object is greater than or equal to that of another AutoDiffReverse object/given value"""
+        return self._compare(other, 'ge', self.val >= getattr(other, 'val', other))
+
+    def backward(self, wrt=None):
+        """Returns the gradient of the object with respect to wrt as a NumPy array
+
+        wrt is a list of variable names or AutoDiffReverse objects and defaults to every
+        named variable recorded before the object, in order of creation.
+        """
+        adjoints = self.tape.sweep(self.id)
+        if wrt is None:
+            ids = self.tape.leaves(self.id + 1)
+        else:
+            ids = [w.id if isinstance(w, AutoDiffReverse) else self.tape.lookup(w) for w in wrt]
+        gradient = np.zeros(len(ids))
+        for k, i in enumerate(ids):
+            if i <= self.id:
+                gradient[k] = adjoints[i]
+        return gradient
+
     def pass_table(self):
-        return forward_pass
-    
+        """Returns the forward pass table of the tape as a pandas DataFrame"""
+        return self.tape.table()
+
     def clear_table(self):
-        global forward_pass_index 
-        global forward_pass 
-        forward_pass_index = 0
-        forward_pass = pd.DataFrame(columns=['Node', 'd1', 'd1value', 'd2', 'd2value'])
-    
-# Reverse Pass  
-def reversepass(df,vars):
-  le = len(vars)
-  df["currentvalue"] = df[['d1', 'd2']].apply(lambda x: ''.join(x), axis=1)
-  dic = {}
-  dic[df.iloc[-1]["Node"]] =1
-  ### start from the second last node to first
-  for l in range(-2,-(df.shape[0]+1),-1):
-    n = df.iloc[l]["Node"]
-    der = 0
-  ###  scan all the rows  
-    for row in range(le,df.shape[0]):
-      if n in df.iloc[row]["currentvalue"]:
-        parent = df.iloc[row]["Node"]
-        if n == df.iloc[row]["d1"]:
-          der_n = df.iloc[row]["d1value"]
-        elif n == df.iloc[row]["d2"]:
-          der_n = df.iloc[row]["d2value"]
-        der = der + dic[parent]*der_n
-    dic[n] = der
-  dic_out = dict((k, dic[k]) for k in vars) 
-  return dic_out
+        """Removes every node from the tape"""
+        self.tape.clear()
+
+def grad(f, wrt=None):
+    """Returns the gradient of the AutoDiffReverse object f with respect to wrt as a NumPy array
+
+    If f is a function of an array returning a scalar, the function computing its
+    gradient is returned instead; see value_and_grad.
+
+    EXAMPLES
+    ========
+    >>> df = grad(lambda x: np.sum(x * x))
+    >>> df(np.array([1.0, 2.0, 3.0]))
+    array([2., 4., 6.])
+    """
+    if isinstance(f, AutoDiffReverse):
+        return f.backward(wrt)
+    if not callable(f):
+        raise TypeError("grad takes an AutoDiffReverse object or a function, not a {}".format(type(f).__name__))
+    value_and_gradient = value_and_grad(f)
+
+    @functools.wraps(f)
+    def gradient(x, *args, **kwargs):
+        return value_and_gradient(x, *args, **kwargs)[1]
+    return gradient
+
+def value_and_grad(f):
+    """Returns a function computing the value of f and its gradient with respect to its first argument
+
+    f takes an array (or a float) and returns a scalar. Its first argument is replaced
+    by an object array of AutoDiffReverse leaves recorded on a fresh tape, so f can use
+    indexing, arithmetic, the elementary functions and np.sum or np.dot. One reverse
+    sweep then gives the gradient with respect to every element, so the cost is a
+    small multiple of one evaluation of f whatever the size of the input. The tape is
+    released before returning.
+
+    EXAMPLES
+    ========
+    >>> f = value_and_grad(lambda x: x[0] * x[1] + x[1])
+    >>> f([3.0, 2.0])
+    (8.0, array([2., 4.]))
+    """
+    @functools.wraps(f)
+    def value_and_gradient(x, *args, **kwargs):
+        x = np.asarray(x, dtype=float)
+        with tape() as t:
+            y = _trace(t, f, x, args, kwargs)
+            gradient = np.zeros(x.size)
+            if not isinstance(y, AutoDiffReverse):
+                return float(y), gradient.reshape(x.shape)
+            adjoints = t.sweep(y.id)[:x.size]
+            gradient[:len(adjoints)] = adjoints
+            return y.val, gradient.reshape(x.shape)
+    return value_and_gradient
+
+def _trace(t, f, x, args=(), kwargs=None, guards=False):
+    """Records f on the empty tape t and returns its scalar output
+
+    The elements of the array x are recorded first, as the leaves with ids 0 to x.size - 1.
+    With guards=True the comparisons f makes are recorded on t.guards, for compile.
+    """
+    kwargs = kwargs or {}
+    t.tracing = guards
+    inputs = AutoDiffReverse._leaves(t, x)
+    y = f(inputs if x.ndim else inputs[()], *args, **kwargs)
+    if isinstance(y, np.ndarray):
+        if y.size != 1:
+            raise ValueError("f must return a scalar, not an array of shape {}".format(y.shape))
+        y = y.reshape(())[()]
+    return y
+
+# Reverse Pass
+def reversepass(df, vars):
+    """Returns the derivatives of the last node of a forward pass table with respect to vars
+
+    The table is swept once from the last row to the first, accumulating the adjoint of
+    each parent by exact name, so the cost is linear in the number of rows.
+    """
+    nodes = list(df['Node'])
+    d1, d1value = list(df['d1']), list(df['d1value'])
+    d2, d2value = list(df['d2']), list(df['d2value'])
+    index = {}
+    for i, node in enumerate(nodes):
+        index[node] = i
+    adjoints = [0.0] * len(nodes)
+    adjoints[-1] = 1.0
+    for i in range(len(nodes) - 1, -1, -1):
+        a = adjoints[i]
+        # Variables have themselves as their only parent
+        if not a or d1[i] == nodes[i]:
+            continue
+        adjoints[index[d1[i]]] += a * d1value[i]
+        if d2[i] != '-':
+            adjoints[index[d2[i]]] += a * d2value[i]
+    return dict((k, adjoints[index[k]]) for k in vars)
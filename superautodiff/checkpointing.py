@@ -0,0 +1,191 @@
+import functools
+import math
+import numpy as np
+from superautodiff.autodiffreverse import AutoDiffReverse, current_tape, tape
+
+
+def _inputs(x, t):
+    """Returns the values, the ids on the tape t (-1 for constants) and the shape of x"""
+    x = np.asarray(x, dtype=object)
+    values, ids = [], []
+    for e in x.ravel().tolist():
+        if isinstance(e, AutoDiffReverse):
+            if e.tape is not t:
+                raise ValueError("AutoDiffReverse objects recorded on different tapes cannot be combined")
+            values.append(e.val)
+            ids.append(e.id)
+        else:
+            values.append(float(e))
+            ids.append(-1)
+    return np.array(values), ids, x.shape
+
+
+def _leaves(t, values, shape):
+    """Records values as leaves of the tape t and returns them with the given shape"""
+    nodes = AutoDiffReverse._leaves(t, values).reshape(shape)
+    return nodes if shape else nodes[()]
+
+
+def _nodes(t, first, values, shape):
+    """Returns the nodes first, first + 1, ... of the tape t with the given values, with the given shape"""
+    nodes = np.empty(len(values), dtype=object)
+    for k, val in enumerate(values.tolist()):
+        node = AutoDiffReverse.__new__(AutoDiffReverse)
+        node.val = val
+        node.tape = t
+        node.id = first + k
+        nodes[k] = node
+    nodes = nodes.reshape(shape)
+    return nodes if shape else nodes[()]
+
+
+def _evaluate(f, values, shape):
+    """Returns the values and the shape of the output of f at values, recorded on a tape that is released"""
+    with tape() as t:
+        y = np.asarray(f(_leaves(t, values, shape)), dtype=object)
+        return np.array([getattr(e, 'val', e) for e in y.ravel().tolist()], dtype=float), y.shape
+
+
+def _vjp(f, values, shape, adjoints):
+    """Returns the adjoints of the inputs of f at values given the adjoints of its outputs
+
+    f is recorded again on a tape of its own, which is swept once and released.
+    """
+    gradient = np.zeros(len(values))
+    with tape() as t:
+        y = np.asarray(f(_leaves(t, values, shape)), dtype=object).ravel().tolist()
+        outputs = [(e.id, a) for e, a in zip(y, adjoints.tolist()) if isinstance(e, AutoDiffReverse)]
+        if outputs:
+            ids, seeds = zip(*outputs)
+            swept = t.sweep(ids, np.array(seeds))[:len(values)]
+            gradient[:len(swept)] = swept
+    return gradient
+
+
+def checkpoint(fn):
+    """Returns fn recorded as a single checkpoint whose inside is recomputed during the reverse sweep
+
+    fn takes an AutoDiffReverse object or an array of them, followed by any constant
+    arguments, and returns the same. When the checkpointed function is called on nodes
+    of the current tape, fn is evaluated on a tape of its own that is released at once;
+    only the values of the inputs and the outputs are kept, and the outputs are recorded
+    as nodes of the current tape. When a reverse sweep reaches them fn is recorded
+    again from the saved inputs and swept to give the adjoints of the inputs. The tape
+    thus holds no node of fn, at the cost of evaluating it twice.
+
+    Every node fn depends on has to be passed in its first argument: nodes of the
+    current tape it uses otherwise raise a ValueError.
+
+    EXAMPLES
+    ========
+    >>> @checkpoint
+    ... def f(x):
+    ...     return x[0] * x[1] + x[1] ** 2
+    >>> with tape() as t:
+    ...     x = AutoDiffReverse._leaves(t, [3.0, 2.0])
+    ...     y = f(x) * 2
+    ...     len(t), y.val, t.sweep(y.id)[:2]
+    (4, 20.0, array([ 4., 14.]))
+    """
+    @functools.wraps(fn)
+    def checkpointed(x, *args, **kwargs):
+        t = current_tape()
+        values, ids, shape = _inputs(x, t)
+        f = lambda inputs: fn(inputs, *args, **kwargs)
+        outputs, output_shape = _evaluate(f, values, shape)
+
+        def backward(adjoints):
+            return _vjp(f, values, shape, adjoints)
+        first = t.record_checkpoint(outputs, ids, backward)
+        return _nodes(t, first, outputs, output_shape)
+    return checkpointed
+
+
+def _advance(step, values, shape, steps):
+    """Returns the values of the state after steps steps from values, recording every step on the same scratch tape"""
+    with tape() as t:
+        for _ in range(steps):
+            t.clear()
+            y = np.asarray(step(_leaves(t, values, shape)), dtype=object).ravel().tolist()
+            if len(y) != len(values):
+                raise ValueError("step must return a state of {} values, not {}".format(len(values), len(y)))
+            values = np.array([getattr(e, 'val', e) for e in y], dtype=float)
+    return values
+
+
+def _repetitions(steps, snapshots):
+    """Returns the smallest number of repetitions r with binomial(snapshots + r, snapshots) >= steps"""
+    r = 0
+    while math.comb(snapshots + r, snapshots) < steps:
+        r += 1
+    return r
+
+
+def _reverse(advance, vjp, state, adjoint, steps, snapshots):
+    """Returns the adjoint of state given the adjoint of the state steps steps after it
+
+    The steps are reversed by the binomial schedule of Revolve: with s free snapshots
+    and r repetitions, binomial(s + r, s) steps can be reversed while advancing at most
+    r times per step on average. A snapshot is placed so that the steps after it can be
+    reversed with s - 1 snapshots and r repetitions, they are reversed recursively, and
+    the steps before it are reversed from state with its snapshot free again. At most
+    snapshots + 1 states are held at once.
+    """
+    while steps > 1 and snapshots > 0:
+        r = _repetitions(steps, snapshots)
+        right = min(math.comb(snapshots - 1 + r, snapshots - 1), steps - 1)
+        middle = advance(state, steps - right)
+        adjoint = _reverse(advance, vjp, middle, adjoint, right, snapshots - 1)
+        steps -= right
+    # Without free snapshots each step is recomputed from state
+    for k in range(steps - 1, -1, -1):
+        adjoint = vjp(advance(state, k), adjoint)
+    return adjoint
+
+
+def checkpoint_loop(step, x, n_steps, snapshots=None):
+    """Returns the state after applying step n_steps times to x, with a binomial checkpointing schedule
+
+    step takes the state, an AutoDiffReverse object or an array of them, and returns the
+    next state of the same size. As for checkpoint, the loop is recorded on the current
+    tape as a single node per element of the final state, and nothing else is kept of
+    the forward pass but the initial state. The reverse sweep reverses the loop one step
+    at a time, recomputing the states it needs from at most snapshots saved states with
+    the binomial schedule of Revolve (Griewank and Walther, 2000).
+
+    snapshots is the memory budget, in states. With s snapshots and the smallest r such
+    that binomial(s + r, s) >= n_steps, step is evaluated at most (r + 2) * n_steps times
+    in all, counting the forward pass and the recordings of the reverse sweep. It
+    defaults to ceil(log2(n_steps)), so the memory grows logarithmically with n_steps
+    and so does r, slowly: it is 4 for a thousand steps and 8 for a million. The tape
+    holds one step at a time.
+
+    EXAMPLES
+    ========
+    >>> with tape() as t:
+    ...     x = AutoDiffReverse._leaves(t, [1.0, 2.0])
+    ...     y = checkpoint_loop(lambda s: np.array([s[0] - 0.1 * s[1], s[1] + 0.1 * s[0]]), x, 100, snapshots=3)
+    ...     r = y[0] * y[0] + y[1] * y[1]
+    ...     len(t), round(r.val, 6), t.sweep(r.id)[:2].round(6)
+    (7, 13.524069, array([ 5.409628, 10.819255]))
+    """
+    if n_steps < 0:
+        raise ValueError("n_steps must be at least 0, not {}".format(n_steps))
+    t = current_tape()
+    values, ids, shape = _inputs(x, t)
+    if snapshots is None:
+        snapshots = max(1, math.ceil(math.log2(max(n_steps, 1))))
+    if snapshots < 0:
+        raise ValueError("snapshots must be at least 0, not {}".format(snapshots))
+
+    def advance(state, steps):
+        return _advance(step, state, shape, steps)
+
+    def vjp(state, adjoint):
+        return _vjp(step, state, shape, adjoint)
+
+    def backward(adjoints):
+        return _reverse(advance, vjp, values, adjoints, n_steps, snapshots)
+    outputs = advance(values, n_steps)
+    first = t.record_checkpoint(outputs, ids, backward)
+    return _nodes(t, first, outputs, shape)
@@ -0,0 +1,414 @@
+import math
+import os
+import numpy as np
+from superautodiff.autodiffreverse import AutoDiffReverse, tape
+from superautodiff.compiled import _Program, _COMPARISONS, _OPERATOR_SOURCES
+from superautodiff.functions import PRIMITIVES, OP_PRIMITIVES
+from superautodiff.optimize import optimize as _optimize
+from superautodiff.tapes import OPS
+
+# Version of the generated code, part of every cache key so that a new generator never
+# loads modules written by an older one
+CODEGEN_VERSION = 2
+
+# Environment variable overriding the default cache directory
+CACHE_ENV = 'SUPERAUTODIFF_CACHE'
+
+_HEADER = '''"""Generated by superautodiff.codegen; do not edit
+
+Computes a function traced with superautodiff and its Jacobian matrix as a fixed
+sequence of NumPy operations on arrays with one row per node of the trace.
+"""
+import numpy as np
+
+try:
+    from superautodiff.compiled import ControlFlowError
+except ImportError:
+    class ControlFlowError(Exception):
+        pass
+
+'''
+
+_FOOTER = '''
+
+def _inputs(x):
+    x = np.asarray(x, dtype=float)
+    if x.shape == SHAPE:
+        return x.reshape(-1, 1), ()
+    if x.shape[1:] == SHAPE:
+        return x.reshape(len(x), -1).T, x.shape[:1]
+    raise ValueError("Inputs must have shape {} or a leading batch axis, not {}".format(SHAPE, x.shape))
+
+
+def _output(v, batch):
+    y = v[_OUTPUTS].T.reshape(batch + OUTPUT_SHAPE)
+    return y if batch or OUTPUT_SHAPE else float(y)
+
+
+def value(x):
+    """Returns the value of the function at x, or at every row of a batch x"""
+    v, d1, d2, batch = _forward(x)
+    return _output(v, batch)
+
+
+def value_and_jacobian(x):
+    """Returns the value of the function at x and its derivatives with respect to x"""
+    v, d1, d2, batch = _forward(x)
+    g = np.zeros(v.shape + (len(_OUTPUTS),))
+    g[_OUTPUTS, :, np.arange(len(_OUTPUTS))] = 1.0
+    _reverse(g, d1, d2)
+    jacobian = g[:N_INPUTS].transpose(1, 2, 0).reshape(batch + OUTPUT_SHAPE + SHAPE)
+    return _output(v, batch), jacobian
+
+
+def jacobian(x):
+    """Returns the derivatives of the function at x with respect to x"""
+    return value_and_jacobian(x)[1]
+
+
+value_and_grad = value_and_jacobian
+grad = jacobian
+'''
+
+
+def default_cache_dir():
+    """Returns the directory generated modules are cached in
+
+    This is the directory named by the SUPERAUTODIFF_CACHE environment variable, or
+    superautodiff under the user cache directory.
+    """
+    if os.environ.get(CACHE_ENV):
+        return os.environ[CACHE_ENV]
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'superautodiff')
+
+
+def _trace_outputs(t, f, x):
+    """Records f on the empty tape t, with the comparisons it makes as guards, and returns the array of its outputs"""
+    t.tracing = True
+    inputs = AutoDiffReverse._leaves(t, x)
+    y = f(inputs if x.ndim else inputs[()])
+    if isinstance(y, AutoDiffReverse):
+        return np.array(y, dtype=object)
+    return np.asarray(y, dtype=object)
+
+
+def _optimized(t, outputs, n_inputs):
+    """Returns the tape t simplified by optimize and the outputs as nodes of the new tape"""
+    ids = [y.id for y in outputs.ravel() if isinstance(y, AutoDiffReverse)]
+    if not ids:
+        return t, outputs
+    optimized, new, stats = _optimize(t, ids, n_inputs)
+    new = iter(new.tolist())
+    nodes = np.empty(outputs.shape, dtype=object)
+    for k, y in enumerate(outputs.ravel()):
+        if isinstance(y, AutoDiffReverse):
+            node = AutoDiffReverse.__new__(AutoDiffReverse)
+            node.val, node.tape, node.id = y.val, optimized, next(new)
+            y = node
+        nodes.reshape(-1)[k] = y
+    return optimized, nodes
+
+
+def _graph_key(t, outputs, shape, optimized):
+    """Returns a hash of the structure of the graph computing the outputs on the tape t
+
+    The key depends on the operations, the parents, the constants and the traced
+    comparisons of the nodes, and on the values of the leaves that are not inputs, but
+    not on the values of the inputs. It is computed before the graph is optimised.
+    """
+    import hashlib
+
+    ids = [y.id for y in outputs.ravel() if isinstance(y, AutoDiffReverse)]
+    n = t.span(ids)
+    n_inputs = int(np.prod(shape, dtype=int))
+    ops = t.ops[:n]
+    h = hashlib.sha256()
+    h.update(repr((CODEGEN_VERSION, shape, outputs.shape, optimized)).encode())
+    # Op codes of the elementary functions depend on the order they were registered in
+    h.update(' '.join(OPS[op] for op in np.unique(ops).tolist()).encode())
+    h.update(np.unique(ops, return_inverse=True)[1].astype(np.int16).tobytes())
+    h.update(np.ascontiguousarray(t.parents[:n]).tobytes())
+    h.update(np.ascontiguousarray(t.constants[:n]).tobytes())
+    constant_leaves = np.flatnonzero(ops[n_inputs:] == 0) + n_inputs
+    h.update(constant_leaves.tobytes())
+    h.update(t.values[constant_leaves].tobytes())
+    h.update(repr(t.guards).encode())
+    h.update(repr([y.id if isinstance(y, AutoDiffReverse) else float(y) for y in outputs.ravel()]).encode())
+    return h.hexdigest()[:32]
+
+
+def _literal(a):
+    """Returns the source of a NumPy array equal to a"""
+    a = np.asarray(a)
+    if a.dtype.kind in 'iu':
+        return 'np.array({}, dtype=np.intp)'.format(a.ravel().tolist())
+    items = ', '.join(repr(v) if math.isfinite(v) else "float('{}')".format(v) for v in a.ravel().tolist())
+    source = 'np.array([{}])'.format(items)
+    return source if a.ndim == 1 else '{}.reshape{}'.format(source, (-1,) + a.shape[1:])
+
+
+def _primitive_source(op):
+    """Returns the source of the value and the derivative of the elementary function with op code op
+
+    They are the NumPy sources of its Primitive. The kernels of elementary functions
+    defined without sources are looked up in PRIMITIVES when the module is imported,
+    under the name returned with them, which is None when there is none to look up.
+    """
+    if op not in OP_PRIMITIVES:
+        raise ValueError("Operations of type {} cannot be generated".format(OPS[op]))
+    p = OP_PRIMITIVES[op]
+    if p.value_source is not None and p.derivative_source is not None:
+        return (p.value_source, p.derivative_source), None
+    if p.name not in PRIMITIVES:
+        raise ValueError("Operations of type {} cannot be generated".format(p.name))
+    f = '_{}'.format(p.name)
+    return (p.value_source or '{}.value(u)'.format(f), p.derivative_source or '{}.derivative(u)'.format(f)), f
+
+
+def _scatter_source(g, plan, names, contribution):
+    """Returns the statements adding the rows of contribution into the rows of g given by a _scatter plan"""
+    targets, order, starts = plan
+    if order is None:
+        return ['{}[{}] += {}'.format(g, names(targets), contribution)]
+    return ['{}[{}] += np.add.reduceat(({})[{}], {}, axis=0)'.format(
+        g, names(targets), contribution, names(order), names(starts))]
+
+
+def generate_source(f, example_inputs, optimize=True):
+    """Traces f once on example_inputs and returns the source of a module computing f and its Jacobian matrix
+
+    f takes an array of the shape of example_inputs and returns a scalar or an array.
+    The module defines value(x), value_and_jacobian(x) and jacobian(x), with the aliases
+    value_and_grad and grad, which accept x of that shape or with a leading batch axis;
+    it needs only NumPy to run. Unless optimize is False, the trace is first simplified
+    by superautodiff.optimize.optimize. The key of the module, a hash of the structure
+    of the graph, is returned with it.
+
+    EXAMPLES
+    ========
+    >>> source, key = generate_source(lambda x: x[0] * np.sin(x[1]), np.zeros(2))
+    >>> print(source[source.index('def _forward'):source.index('def _reverse')].strip())
+    def _forward(x):
+        inputs, batch = _inputs(x)
+        v = np.empty((N, inputs.shape[1]))
+        d1 = np.empty_like(v)
+        d2 = np.empty_like(v)
+        v[:N_INPUTS] = inputs
+        # sin of 1 node
+        u = v[_A1]
+        v[_A0] = val = np.sin(u)
+        d1[_A0] = np.cos(u)
+        # mul of 1 node
+        u = v[_A3]
+        w = v[_A0]
+        v[_A2] = val = u * w
+        d1[_A2] = w
+        d2[_A2] = u
+        return v, d1, d2, batch
+    """
+    x = np.asarray(example_inputs, dtype=float)
+    with tape() as t:
+        outputs = _trace_outputs(t, f, x)
+        key = _graph_key(t, outputs, x.shape, optimize)
+        if optimize:
+            t, outputs = _optimized(t, outputs, x.size)
+        return _module_source(t, outputs, x.shape, key)[0], key
+
+
+def _module_source(t, outputs, shape, key, inline=None):
+    """Returns the source of the module computing the outputs recorded on the tape t
+
+    Arrays with more than inline elements are not written into the source but returned
+    in a dictionary, to be saved next to the module in an .npz file of the same name,
+    which the module loads when it is imported. All arrays are written inline when
+    inline is None.
+    """
+    n_inputs = int(np.prod(shape, dtype=int))
+    ids = [y.id for y in outputs.ravel() if isinstance(y, AutoDiffReverse)]
+    program = _Program(t, ids, n_inputs)
+    n = program.n
+
+    # Outputs that are constants get rows of their own after the nodes
+    output_ids, constants = [], []
+    for y in outputs.ravel():
+        if isinstance(y, AutoDiffReverse):
+            output_ids.append(y.id)
+        else:
+            output_ids.append(n + len(constants))
+            constants.append(float(y))
+    constant_ids = np.concatenate([program.constant_ids, np.arange(n, n + len(constants), dtype=np.intp)])
+    constant_values = np.concatenate([program.constant_values, constants])
+
+    # Arrays are written once and named by their position; equal arrays share a name
+    arrays, names = [], {}
+    def name(a):
+        a = np.asarray(a)
+        key = (a.dtype.str, a.shape, a.tobytes())
+        if key not in names:
+            names[key] = '_A{}'.format(len(arrays))
+            arrays.append(a)
+        return names[key]
+
+    def comment(kind, count):
+        return '    # {} of {} node{}'.format(kind, count, 's' if count > 1 else '')
+
+    forward = ['def _forward(x):',
+               '    inputs, batch = _inputs(x)',
+               '    v = np.empty((N, inputs.shape[1]))',
+               '    d1 = np.empty_like(v)',
+               '    d2 = np.empty_like(v)',
+               '    v[:N_INPUTS] = inputs']
+    if len(constant_ids):
+        forward.append('    v[{}] = {}[:, None]'.format(name(constant_ids), name(constant_values)))
+    reverse = []
+    imports = []
+    for step in program.steps:
+        if step[0] == 'linear':
+            _, idx, columns, coefficients, starts, counts, constant, plan = step
+            i, k = name(idx), name(coefficients)
+            forward.append(comment('weighted sums', len(idx)))
+            forward.append('    v[{}] = np.add.reduceat({} * v[{}], {}, axis=0) + {}'.format(
+                i, k, name(columns), name(starts), name(constant)))
+            contribution = '{}[:, :, None] * np.repeat(g[{}], {}, axis=0)'.format(k, i, name(counts))
+            reverse.append([comment('weighted sums', len(idx))]
+                           + ['    ' + s for s in _scatter_source('g', plan, name, contribution)])
+            continue
+
+        op, idx, p, q, c, plan1, plan2 = step
+        if op in _OPERATOR_SOURCES:
+            (val, d1, d2), f = _OPERATOR_SOURCES[op], None
+        else:
+            ((val, d1), f), d2 = _primitive_source(op), None
+            if f is not None:
+                imports.append('{} = PRIMITIVES[{!r}]'.format(f, OPS[op]))
+        i = name(idx)
+        forward.append(comment(OPS[op], len(idx)))
+        forward.append('    u = v[{}]'.format(name(p)))
+        if q is not None:
+            forward.append('    w = v[{}]'.format(name(q)))
+        if op in _OPERATOR_SOURCES and OPS[op].endswith('c'):
+            forward.append('    c = {}'.format(name(c)))
+        forward.append('    v[{}] = val = {}'.format(i, val))
+        forward.append('    d1[{}] = {}'.format(i, d1))
+        if d2 is not None:
+            forward.append('    d2[{}] = {}'.format(i, d2))
+        statements = [comment(OPS[op], len(idx)), '    a = g[{}]'.format(i)]
+        statements += ['    ' + s for s in _scatter_source('g', plan1, name, 'a * d1[{}][:, :, None]'.format(i))]
+        if q is not None:
+            statements += ['    ' + s for s in _scatter_source('g', plan2, name, 'a * d2[{}][:, :, None]'.format(i))]
+        reverse.append(statements)
+
+    for op, left, right, c, outcome in program.guards:
+        compare, symbol = _COMPARISONS[op]
+        other = 'v[{}]'.format(right) if right >= 0 else repr(c)
+        test = 'np.all' if outcome else 'np.any'
+        forward.append('    if not {}(v[{}] {} {}):'.format(test, left, symbol, other) if outcome
+                       else '    if {}(v[{}] {} {}):'.format(test, left, symbol, other))
+        forward.append('        raise ControlFlowError("The comparison node {} {} {} was {} when f was traced '
+                       'but not for these inputs; generate f again for this branch")'.format(
+                           left, symbol, 'node {}'.format(right) if right >= 0 else other, outcome))
+    forward.append('    return v, d1, d2, batch')
+
+    backward = ['def _reverse(g, d1, d2):']
+    for statements in reversed(reverse):
+        backward.extend(statements)
+    if not reverse:
+        backward.append('    pass')
+
+    lines = [_HEADER.rstrip('\n')]
+    if imports:
+        lines += ['from superautodiff.functions import PRIMITIVES', ''] + imports
+    lines += ['',
+              'KEY = {!r}'.format(key),
+              'SHAPE = {!r}'.format(tuple(shape)),
+              'OUTPUT_SHAPE = {!r}'.format(outputs.shape),
+              'N_INPUTS = {}'.format(n_inputs),
+              'N = {}'.format(n + len(constants)),
+              '_OUTPUTS = {}'.format(_literal(np.array(output_ids, dtype=np.intp))),
+              '']
+    data = {}
+    for j, a in enumerate(arrays):
+        if inline is None or a.size <= inline:
+            lines.append('_A{} = {}'.format(j, _literal(a)))
+        else:
+            if not data:
+                lines += ['_DATA = np.load(__file__[:-3] + ".npz")']
+            data['_A{}'.format(j)] = a
+            lines.append("_A{0} = _DATA['_A{0}']".format(j))
+    lines += ['', ''] + forward + ['', ''] + backward
+    return '\n'.join(lines) + '\n' + _FOOTER, data
+
+
+# Largest arrays written into the source of cached modules; larger ones are saved in
+# a data file, which is much faster to load than to parse
+_INLINE = 64
+
+# Modules imported by this process, by path
+_MODULES = {}
+
+def _import(path):
+    """Imports the generated module at path, once per process"""
+    import importlib.util
+
+    if path not in _MODULES:
+        name = 'superautodiff_generated_' + os.path.splitext(os.path.basename(path))[0]
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _MODULES[path] = module
+    return _MODULES[path]
+
+
+def _path(key, cache_dir):
+    return os.path.join(cache_dir or default_cache_dir(), 'sad_{}.py'.format(key))
+
+
+def generate(f, example_inputs, cache_dir=None, optimize=True):
+    """Returns the generated module computing f and its Jacobian matrix, writing it to the cache if it is new
+
+    f is traced once on example_inputs, and the module is cached on disk under a hash of
+    the structure of the graph, its KEY; another process can import it with
+    load_generated(KEY) without tracing f. Arrays of more than 64 elements, such as the
+    node ids of the groups of operations, are saved next to the module in an .npz file.
+    The module is written to a temporary file that is then renamed, so processes
+    generating the same module concurrently do not read partial files. See
+    generate_source for the functions of the module.
+
+    EXAMPLES
+    ========
+    >>> import tempfile
+    >>> module = generate(lambda x: x[0] * x[1], np.array([1.0, 2.0]), tempfile.mkdtemp())
+    >>> module.value_and_grad(np.array([3.0, 4.0]))
+    (12.0, array([4., 3.]))
+    >>> load_generated(module.KEY, os.path.dirname(module.__file__)) is module
+    True
+    """
+    x = np.asarray(example_inputs, dtype=float)
+    with tape() as t:
+        outputs = _trace_outputs(t, f, x)
+        key = _graph_key(t, outputs, x.shape, optimize)
+        path = _path(key, cache_dir)
+        if not os.path.exists(path):
+            if optimize:
+                t, outputs = _optimized(t, outputs, x.size)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            source, data = _module_source(t, outputs, x.shape, key, _INLINE)
+            # The module is written last, so that its data file exists once it does
+            temporary = '{}.{}.tmp'.format(path, os.getpid())
+            if data:
+                with open(temporary, 'wb') as file:
+                    np.savez(file, **data)
+                os.replace(temporary, path[:-3] + '.npz')
+            with open(temporary, 'w') as file:
+                file.write(source)
+            os.replace(temporary, path)
+    return _import(path)
+
+
+def load_generated(key, cache_dir=None):
+    """Imports the cached module with the given KEY, made by generate, without tracing"""
+    path = _path(key, cache_dir)
+    if not os.path.exists(path):
+        raise KeyError("No generated module with key {} in {}".format(key, os.path.dirname(path)))
+    return _import(path)
@@ -0,0 +1,460 @@
+import collections
+import functools
+import math
+import numpy as np
+from superautodiff.autodiffreverse import AutoDiffReverse, tape, _trace
+from superautodiff.functions import OP_PRIMITIVES
+from superautodiff.optimize import optimize as _optimize
+from superautodiff.tapes import OPS, OP_CODES
+
+
+class ControlFlowError(Exception):
+    """Raised when a compiled function is called on inputs that take a different branch than the traced ones"""
+
+
+# Operators that are linear in their parents, as functions of (parent 1, parent 2, constant)
+# returning their terms [(parent, coefficient), ...] and their constant term
+_LINEAR = {
+    OP_CODES['add']: lambda p, q, c: ([(p, 1.0), (q, 1.0)], 0.0),
+    OP_CODES['sub']: lambda p, q, c: ([(p, 1.0), (q, -1.0)], 0.0),
+    OP_CODES['addc']: lambda p, q, c: ([(p, 1.0)], c),
+    OP_CODES['subc']: lambda p, q, c: ([(p, 1.0)], -c),
+    OP_CODES['rsubc']: lambda p, q, c: ([(p, -1.0)], c),
+    OP_CODES['mulc']: lambda p, q, c: ([(p, c)], 0.0),
+    OP_CODES['divc']: lambda p, q, c: ([(p, 1 / c)], 0.0),
+}
+
+# NumPy source of the value and the partial derivatives of the other operators, as
+# expressions of u and w, the values of the parents, c, the constants of the nodes, and
+# val, the value; the second partial derivative is None for unary operators
+_OPERATOR_SOURCES = {
+    OP_CODES['mul']: ('u * w', 'w', 'u'),
+    OP_CODES['div']: ('u / w', '1 / w', '-val / w'),
+    OP_CODES['rdivc']: ('c / u', '-val / u', None),
+    OP_CODES['powc']: ('u ** c', 'c * u ** (c - 1)', None),
+    OP_CODES['rpowc']: ('c ** u', 'val * np.log(c)', None),
+}
+
+def _operator_kernel(value, d1, d2):
+    """Returns the vectorised kernel computing the value and the partial derivatives given by their sources"""
+    namespace = {'np': np}
+    exec('def kernel(u, w, c):\n    val = {}\n    return val, {}, {}\n'.format(value, d1, d2), namespace)
+    return namespace['kernel']
+
+# Vectorised kernels of the other operators, returning the value and the partial
+# derivatives with respect to both parents (None for unary operators)
+_KERNELS = {op: _operator_kernel(*sources) for op, sources in _OPERATOR_SOURCES.items()}
+
+_COMPARISONS = {'lt': (np.less, '<'), 'le': (np.less_equal, '<='), 'gt': (np.greater, '>'),
+                'ge': (np.greater_equal, '>=')}
+
+_BINARY = (OP_CODES['mul'], OP_CODES['div'])
+
+
+def _scatter(targets):
+    """Returns a plan for adding rows of contributions into the rows targets of an array
+
+    Targets that repeat have to be summed first: the contributions are sorted by target
+    and reduced with np.add.reduceat, which is much faster than np.add.at on 2-D arrays.
+    """
+    targets = np.asarray(targets, dtype=np.intp)
+    order = np.argsort(targets, kind='stable')
+    ordered = targets[order]
+    starts = np.flatnonzero(np.r_[True, ordered[1:] != ordered[:-1]])
+    if len(starts) == len(targets):
+        return targets, None, None
+    return ordered[starts], order, starts
+
+def _scatter_add(array, plan, contributions):
+    """Adds the rows of contributions into array following a plan made by _scatter"""
+    targets, order, starts = plan
+    if order is None:
+        array[targets] += contributions
+    else:
+        array[targets] += np.add.reduceat(contributions[order], starts, axis=0)
+
+
+def _kernel(op):
+    """Returns the vectorised kernel of the operator or elementary function with op code op"""
+    if op in _KERNELS:
+        return _KERNELS[op]
+    if op in OP_PRIMITIVES:
+        p = OP_PRIMITIVES[op]
+        return lambda u, w, c: (p.value(u), p.derivative(u), None)
+    raise ValueError("Operations of type {} cannot be compiled".format(OPS[op]))
+
+
+class _Program():
+    """The straight-line program computing the nodes outputs of the tape t from its first n_inputs leaves
+
+    Only the nodes the outputs or a traced comparison depend on are kept. Chains of
+    linear operations are fused into weighted sums of their sources, and the remaining
+    nodes are grouped by their depth in the graph and by their operation.
+
+    ATTRIBUTES
+    ==========
+    n : number of rows of the value buffers, which are indexed by node id
+    steps : list of the groups in order of evaluation, either ('linear', idx, columns,
+            coefficients, starts, counts, constant, plan) for weighted sums or (op, idx,
+            p, q, c, plan1, plan2) for the other operations; plans are made by _scatter
+    constant_ids : ids of the leaves that are not inputs, i.e. constants created inside f
+    constant_values : values of these leaves
+    guards : every comparison recorded on the tape; the nodes they compare are kept
+    n_nodes : number of nodes computed by the steps
+    """
+
+    def __init__(self, t, outputs, n_inputs):
+        if t.checkpoints:
+            raise ValueError("Checkpointed computations cannot be compiled")
+        n = t.span(outputs)
+        self.n = max(n, n_inputs)
+        ops = t.ops[:n].tolist()
+        constants = t.constants[:n].tolist()
+        parents1, parents2 = t.parents[:n, 0].tolist(), t.parents[:n, 1].tolist()
+
+        # Nodes the outputs or a guard depend on; guard operands are never fused away
+        pinned = set(outputs)
+        for op, left, right, c, outcome in t.guards:
+            pinned.update(i for i in (left, right) if i >= 0)
+        self.guards = list(t.guards)
+        needed = [False] * n
+        for i in pinned:
+            needed[i] = True
+        uses = [0] * n
+        for i in range(n - 1, -1, -1):
+            if needed[i]:
+                for p in (parents1[i], parents2[i]):
+                    if p >= 0:
+                        needed[p] = True
+                        uses[p] += 1
+
+        # Fuse chains of linear operations into weighted sums of their sources
+        linear = {}
+        fused = [False] * n
+        for i in range(n):
+            if not needed[i] or ops[i] not in _LINEAR:
+                continue
+            terms, constant = _LINEAR[ops[i]](parents1[i], parents2[i], constants[i])
+            expression = None
+            for p, coefficient in terms:
+                if p in linear and uses[p] == 1 and p not in pinned:
+                    source, source_constant = linear.pop(p)
+                    fused[p] = True
+                    constant += coefficient * source_constant
+                    if coefficient != 1.0:
+                        source = {k: coefficient * v for k, v in source.items()}
+                else:
+                    source = {p: coefficient}
+                if expression is None:
+                    expression = source
+                else:
+                    if len(source) > len(expression):
+                        expression, source = source, expression
+                    for k, v in source.items():
+                        expression[k] = expression.get(k, 0.0) + v
+            linear[i] = (expression, constant)
+
+        # Leaves other than the inputs are constants created inside f
+        constant_ids = [i for i in range(n_inputs, n) if needed[i] and ops[i] == 0]
+        self.constant_ids = np.array(constant_ids, dtype=np.intp)
+        self.constant_values = t.values[constant_ids].copy()
+
+        # Depth of every computed node and the groups of nodes of each depth and operation
+        level = [0] * n
+        groups = {}
+        for i in range(n_inputs, n):
+            if not needed[i] or fused[i] or ops[i] == 0:
+                continue
+            if i in linear:
+                sources = linear[i][0]
+                key = 'linear'
+            else:
+                sources = [p for p in (parents1[i], parents2[i]) if p >= 0]
+                key = ops[i]
+            level[i] = 1 + max(level[p] for p in sources)
+            groups.setdefault((level[i], key), []).append(i)
+
+        self.steps = []
+        for (depth, key), nodes in sorted(groups.items(), key=lambda item: (item[0][0], str(item[0][1]))):
+            idx = np.array(nodes, dtype=np.intp)
+            if key == 'linear':
+                columns, coefficients, counts = [], [], []
+                for i in nodes:
+                    expression = linear[i][0]
+                    columns.extend(expression.keys())
+                    coefficients.extend(expression.values())
+                    counts.append(len(expression))
+                starts = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.intp)
+                self.steps.append(('linear', idx, np.array(columns, dtype=np.intp), np.array(coefficients)[:, None],
+                                   starts, np.array(counts, dtype=np.intp),
+                                   np.array([linear[i][1] for i in nodes])[:, None], _scatter(columns)))
+            else:
+                if key == OP_CODES['custom']:
+                    raise ValueError("Operations of type custom cannot be compiled")
+                p = np.array([parents1[i] for i in nodes], dtype=np.intp)
+                q = np.array([parents2[i] for i in nodes], dtype=np.intp) if key in _BINARY else None
+                c = np.array([constants[i] for i in nodes])[:, None]
+                self.steps.append((key, idx, p, q, c, _scatter(p), None if q is None else _scatter(q)))
+        self.n_nodes = sum(len(step[1]) for step in self.steps)
+
+
+class CompiledFunction():
+    """A scalar function traced once in reverse mode and replayed as a straight-line program
+
+    The nodes of the trace that the output depends on are grouped by their depth in the
+    graph and by their operation, and every group is evaluated with a single NumPy call
+    on preallocated buffers, for the values in the forward direction and for the
+    adjoints in the reverse direction; no Python object is created per operation.
+    Chains of linear operations, such as the running sum of np.sum, are fused into a
+    single weighted sum of their sources first, so they do not add depth. Inputs with
+    an extra leading axis are evaluated as a batch, row by row.
+
+    Comparisons made on the traced values are replayed as guards: if one of them has a
+    different outcome for new inputs, the traced program no longer describes f and a
+    ControlFlowError is raised.
+
+    ATTRIBUTES
+    ==========
+    shape : shape of the input array f was traced on
+    n_nodes : number of nodes the program evaluates
+    n_steps : number of vectorised steps of the program
+    optimization : statistics of the optimize pass run on the trace, or None
+
+    EXAMPLES
+    ========
+    >>> f = compile(lambda x: np.sum(x * x) + x[0], np.zeros(3))
+    >>> f(np.array([1.0, 2.0, 3.0]))
+    15.0
+    >>> f.value_and_grad(np.array([1.0, 2.0, 3.0]))
+    (15.0, array([3., 4., 6.]))
+    """
+
+    def __init__(self, t, output, shape, constant=0.0, optimization=None):
+        self.shape = shape
+        self.optimization = optimization
+        n_inputs = int(np.prod(shape, dtype=int))
+        self._n_inputs = n_inputs
+        self._buffers = {}
+
+        # A function whose output does not depend on its input compiles to a constant,
+        # which is still only valid on the branch of the comparisons it made
+        self._output, self._constant = output, float(constant)
+        program = _Program(t, [] if output is None else [output], n_inputs)
+        self._n, self._guards = program.n, program.guards
+        self._constant_ids, self._constant_values = program.constant_ids, program.constant_values
+        self._steps = [step if step[0] == 'linear' else (_kernel(step[0]),) + step[1:] for step in program.steps]
+        self.n_nodes = program.n_nodes
+        self.n_steps = len(self._steps)
+
+    def _buffer(self, batch):
+        """Returns the preallocated value, partial and adjoint buffers for a batch of the given size"""
+        if batch not in self._buffers:
+            shape = (self._n, batch)
+            self._buffers[batch] = (np.zeros(shape), np.zeros(shape), np.zeros(shape), np.zeros(shape))
+        return self._buffers[batch]
+
+    def _inputs(self, x):
+        """Returns the inputs as an (n_inputs, batch) array and the shape of the batch"""
+        x = np.asarray(x, dtype=float)
+        if x.shape == self.shape:
+            return x.reshape(1, -1).T, ()
+        if x.shape[1:] == self.shape:
+            return x.reshape(len(x), -1).T, x.shape[:1]
+        raise ValueError("Inputs must have shape {} or a leading batch axis, not {}".format(self.shape, x.shape))
+
+    def _forward(self, x):
+        """Evaluates the program on x and returns the buffers and the batch shape"""
+        inputs, batch = self._inputs(x)
+        values, partials1, partials2, adjoints = self._buffer(inputs.shape[1])
+        values[:self._n_inputs] = inputs
+        values[self._constant_ids] = self._constant_values[:, None]
+        for step in self._steps:
+            if step[0] == 'linear':
+                _, idx, columns, coefficients, starts, counts, constant, plan = step
+                values[idx] = np.add.reduceat(coefficients * values[columns], starts, axis=0) + constant
+            else:
+                kernel, idx, p, q, c, plan1, plan2 = step
+                val, d1, d2 = kernel(values[p], None if q is None else values[q], c)
+                values[idx] = val
+                partials1[idx] = d1
+                if d2 is not None:
+                    partials2[idx] = d2
+        self._check_guards(values)
+        return values, partials1, partials2, adjoints, batch
+
+    def _check_guards(self, values):
+        """Raises a ControlFlowError if a traced comparison has a different outcome on the current values"""
+        for op, left, right, c, outcome in self._guards:
+            compare, symbol = _COMPARISONS[op]
+            results = compare(values[left], values[right] if right >= 0 else c)
+            if not (results == outcome).all():
+                raise ControlFlowError(
+                    "The comparison {} {} {} was {} when f was traced but is {} for these inputs; "
+                    "compile f again for this branch".format(
+                        'node {}'.format(left), symbol, 'node {}'.format(right) if right >= 0 else c,
+                        outcome, not outcome))
+
+    def _result(self, values, batch):
+        """Returns the value of the output for each row of the batch"""
+        if self._output is None:
+            return np.full(batch, self._constant) if batch else self._constant
+        result = values[self._output]
+        return result.copy() if batch else float(result[0])
+
+    def __call__(self, x):
+        """Returns the value of the compiled function at x"""
+        values, _, _, _, batch = self._forward(x)
+        return self._result(values, batch)
+
+    def value_and_grad(self, x):
+        """Returns the value of the compiled function at x and its gradient with respect to x"""
+        values, partials1, partials2, adjoints, batch = self._forward(x)
+        if self._output is None:
+            return self._result(values, batch), np.zeros(batch + self.shape)
+        adjoints[:] = 0.0
+        adjoints[self._output] = 1.0
+        for step in reversed(self._steps):
+            if step[0] == 'linear':
+                _, idx, columns, coefficients, starts, counts, constant, plan = step
+                _scatter_add(adjoints, plan, coefficients * np.repeat(adjoints[idx], counts, axis=0))
+            else:
+                kernel, idx, p, q, c, plan1, plan2 = step
+                a = adjoints[idx]
+                _scatter_add(adjoints, plan1, a * partials1[idx])
+                if q is not None:
+                    _scatter_add(adjoints, plan2, a * partials2[idx])
+        gradient = adjoints[:self._n_inputs].T.reshape(batch + self.shape)
+        return self._result(values, batch), gradient.copy()
+
+    def grad(self, x):
+        """Returns the gradient of the compiled function at x"""
+        return self.value_and_grad(x)[1]
+
+
+def compile(f, example_inputs, optimize=True):
+    """Traces the scalar function f once on example_inputs and returns it as a CompiledFunction
+
+    f is recorded in reverse mode as by value_and_grad; the compiled function can then
+    be evaluated, with its gradient, on any input of the same shape, or on a batch of
+    them, without tracing f again. The comparisons f makes on its inputs are checked on
+    every call; f must otherwise be a fixed sequence of operations. Unless optimize is
+    False, the trace is first simplified by superautodiff.optimize.optimize.
+    """
+    return _compile(f, np.asarray(example_inputs, dtype=float), optimize)
+
+
+def _compile(f, x, optimize=True, args=(), kwargs=None):
+    """Traces f(x, *args, **kwargs) and returns it as a CompiledFunction of x"""
+    kwargs = kwargs or {}
+    with tape() as t:
+        y = _trace(t, f, x, args, kwargs, guards=True)
+        if not isinstance(y, AutoDiffReverse):
+            return CompiledFunction(t, None, x.shape, y)
+        if not optimize:
+            return CompiledFunction(t, y.id, x.shape)
+        optimized, (output,), stats = _optimize(t, [y.id], x.size)
+        return CompiledFunction(optimized, output, x.shape, optimization=stats)
+
+
+CacheInfo = collections.namedtuple('CacheInfo', ['hits', 'misses', 'invalidations', 'maxsize', 'currsize'])
+
+
+class DifferentiableFunction():
+    """A scalar function whose compiled traces are kept in a least recently used cache
+
+    The first call with an input of a new structure (shape and dtype of the first
+    argument, and the values of the other arguments) traces and compiles f; later calls
+    with the same structure replay the compiled function. At most cache_size traces are
+    kept, or every trace when cache_size is None, and the least recently used one is
+    evicted first. When a traced comparison takes another branch, the trace is
+    invalidated and f is traced again on the new input. Other arguments that cannot be
+    hashed are not cached: f is then traced on every call.
+
+    Calling the object returns the value of f; value_and_grad and grad also return its
+    gradient with respect to the first argument, as the functions of the same names.
+    The statistics of the cache are returned by cache_info.
+
+    EXAMPLES
+    ========
+    >>> @differentiable(cache_size=2)
+    ... def f(x):
+    ...     return np.sum(x * x)
+    >>> f.value_and_grad(np.array([1.0, 2.0]))
+    (5.0, array([2., 4.]))
+    >>> f(np.array([3.0, 4.0]))
+    25.0
+    >>> f.cache_info()
+    CacheInfo(hits=1, misses=1, invalidations=0, maxsize=2, currsize=1)
+    """
+
+    def __init__(self, f, cache_size=128, optimize=True):
+        functools.update_wrapper(self, f)
+        self._f = f
+        self._cache = collections.OrderedDict()
+        self._maxsize = cache_size
+        self._optimize = optimize
+        self._hits = self._misses = self._invalidations = 0
+
+    def _compiled(self, x, args, kwargs):
+        """Returns the compiled function for the structure of the arguments and the key it is cached under"""
+        try:
+            key = (x.shape, x.dtype.str, args, frozenset(kwargs.items()))
+            hash(key)
+        except TypeError:
+            self._misses += 1
+            return _compile(self._f, np.asarray(x, dtype=float), self._optimize, args, kwargs), None
+        compiled = self._cache.get(key)
+        if compiled is not None:
+            self._hits += 1
+            self._cache.move_to_end(key)
+            return compiled, key
+        self._misses += 1
+        compiled = _compile(self._f, np.asarray(x, dtype=float), self._optimize, args, kwargs)
+        if self._maxsize != 0:
+            self._cache[key] = compiled
+            if self._maxsize is not None and len(self._cache) > self._maxsize:
+                self._cache.popitem(last=False)
+        return compiled, key
+
+    def _replay(self, method, x, args, kwargs):
+        """Calls method of the compiled function for x, tracing f again if the cached trace took another branch"""
+        x = np.asarray(x)
+        compiled, key = self._compiled(x, args, kwargs)
+        try:
+            return method(compiled, x)
+        except ControlFlowError:
+            self._invalidations += 1
+            self._cache.pop(key, None)
+            return method(self._compiled(x, args, kwargs)[0], x)
+
+    def __call__(self, x, *args, **kwargs):
+        """Returns the value of f at x"""
+        return self._replay(CompiledFunction.__call__, x, args, kwargs)
+
+    def value_and_grad(self, x, *args, **kwargs):
+        """Returns the value of f at x and its gradient with respect to x"""
+        return self._replay(CompiledFunction.value_and_grad, x, args, kwargs)
+
+    def grad(self, x, *args, **kwargs):
+        """Returns the gradient of f at x"""
+        return self.value_and_grad(x, *args, **kwargs)[1]
+
+    def cache_info(self):
+        """Returns the numbers of hits, misses and invalidations, and the maximum and current sizes of the cache"""
+        return CacheInfo(self._hits, self._misses, self._invalidations, self._maxsize, len(self._cache))
+
+    def cache_clear(self):
+        """Removes every trace from the cache and resets its statistics"""
+        self._cache.clear()
+        self._hits = self._misses = self._invalidations = 0
+
+
+def differentiable(f=None, cache_size=128, optimize=True):
+    """Decorator making f a DifferentiableFunction whose compiled traces are cached
+
+    It can be used with or without arguments, as @differentiable or
+    @differentiable(cache_size=N).
+    """
+    if f is None:
+        return functools.partial(differentiable, cache_size=cache_size, optimize=optimize)
+    return DifferentiableFunction(f, cache_size, optimize)
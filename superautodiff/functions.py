@@ -1,432 +1,459 @@
 import numpy as np
 import math
+import operator
 import superautodiff as sad
+from superautodiff.autodiff import AutoDiff, AutoDiffBatch, AutoDiffDense, AutoDiffVector, Dual, Taylor
+from superautodiff.autodiff import _series_mul, _series_div, _series_pow, _series_exp
+from superautodiff.autodiffreverse import AutoDiffReverse
+from superautodiff.tapes import op_code
 from collections import Counter
 
-def jacobian(variables, functions):
-    """Returns the Jacobian matrix containing the first derivative of each input function with respect to each input variable"""
-    derivatives = []
-    
-    try:
-        # Case where functions is a list of AD objects
-        if type(functions) is list:
-            
-            if len(functions) is 0:
-                raise ValueError("Functions cannot be empty; input either an AutoDiffVector object or a list of AutoDiff objects")
-            
-            for function in functions:
-                for variable in variables:
-                    derivatives.append(function.der[variable])
-            
-            return np.array(derivatives).reshape(len(functions), len(variables))
-        
-        # Case where functions is an ADV object
-        else:
-            if len(functions.objects) is 0:
-                raise ValueError("Functions cannot be empty; input either an AutoDiffVector object or a list of AutoDiff objects")
-            
-            try:
-                for key in list(functions.objects.keys()):
-                    for variable in variables:
-                        derivatives.append((functions.objects[key].der[variable]))
-                return np.array(derivatives).reshape(len(functions.objects), len(variables))
-            
-            # If neither case fits raise an error
-            except:
-                raise ValueError("Function inputs need to either be an AutoDiffVector object or an array of AutoDiff objects")
-    except:
-        raise ValueError("Incorrect input")
-                    
-                
+# Implementations of each elementary function, keyed by function name and then by argument type
+_DISPATCH = {}
 
+def register(name, cls):
+    """Decorator registering the implementation of the elementary function name for objects of type cls
 
-def sin(x):
-    """Returns the sine of the AutoDiff or AutoDiffVector or AutoDiffReverse object"""
+    Implementations registered for object are used for constants.
+    """
+    def decorator(function):
+        _DISPATCH.setdefault(name, {})[cls] = function
+        return function
+    return decorator
 
-    if (type(x).__name__) is 'AutoDiffVector':
-        return _sinV(x)
-    elif (type(x).__name__) is 'AutoDiffReverse':
-        return _sinR(x)
+def _dispatch(name, x):
+    """Returns the implementation of the elementary function name for the type of x
 
+    The exact type is looked up first; otherwise the implementation registered for the
+    closest base class is used and cached for the type.
+    """
+    table = _DISPATCH[name]
+    try:
+        return table[type(x)]
+    except KeyError:
+        for cls in type(x).__mro__:
+            if cls in table:
+                table[type(x)] = table[cls]
+                return table[cls]
+
+JACOBIAN_FORMATS = ('dense', 'csr', 'coo')
+
+def jacobian(variables, functions, format='dense', out=None, workers=1):
+    """Returns the Jacobian matrix containing the first derivative of each input function with respect to each input variable
+
+    Only the nonzero derivatives of each function are visited, so a list of AutoDiff
+    objects costs time proportional to the number of nonzero entries. format='csr'
+    and format='coo' return a SciPy sparse matrix, which requires scipy. With
+    format='dense' the entries can be written into a preallocated array out.
+
+    variables can also be a vector function f and functions the point x: f is then
+    evaluated in forward mode with one tangent direction per element of x, and the
+    directions are split between workers processes (see column_jacobian).
+
+    EXAMPLES
+    ========
+    >>> x, y = AutoDiff('x', 1.0), AutoDiff('y', 2.0)
+    >>> jacobian(['x', 'y'], [x * y, 3 * x])
+    array([[2., 1.],
+           [3., 0.]])
+    >>> jacobian(['x', 'y'], [x * y, 3 * x], format='csr').nnz
+    3
+    >>> jacobian(lambda v: v * v[0], [1.0, 2.0])
+    array([[2., 0.],
+           [2., 1.]])
+    """
+    if format not in JACOBIAN_FORMATS:
+        raise ValueError("format must be one of 'dense', 'csr' or 'coo', not {!r}".format(format))
+    if out is not None and format != 'dense':
+        raise ValueError("out can only be used with format='dense'")
+    if callable(variables):
+        from superautodiff.parallel import column_jacobian
+        return _jacobian_output(column_jacobian(variables, functions, workers), format, out)
+    if isinstance(variables, str):
+        raise ValueError("Variables must be a list of variable names, not a string")
+    variables = list(variables)
+
+    # Case where functions is an ADV object
+    if type(functions) is sad.AutoDiffVector:
+        if len(functions.variables) == 0:
+            raise ValueError("Functions cannot be empty; input either an AutoDiffVector object or a list of AutoDiff objects")
+        return _jacobian_output(_jacobian_vector(variables, functions), format, out)
+
+    if type(functions) is not list:
+        raise ValueError("Function inputs need to either be an AutoDiffVector object or a list of AutoDiff objects")
+    if len(functions) == 0:
+        raise ValueError("Functions cannot be empty; input either an AutoDiffVector object or a list of AutoDiff objects")
+    for i, function in enumerate(functions):
+        if not hasattr(function, 'der'):
+            raise ValueError("Element {} of functions is a {}, not an autodifferentiation object".format(i, type(function).__name__))
+
+    # AutoDiffDense objects sharing a registry can stack their tangents directly
+    if all(isinstance(function, sad.AutoDiffDense) for function in functions):
+        if all(function.registry is functions[0].registry for function in functions):
+            return _jacobian_output(_jacobian_dense(variables, functions), format, out)
+
+    # The column of each variable; a variable listed twice fills both of its columns
+    columns = {}
+    for j, variable in enumerate(variables):
+        columns.setdefault(variable, []).append(j)
+
+    rows, cols, data = [], [], []
+    for i, function in enumerate(functions):
+        for variable, value in function.der.items():
+            if value and variable in columns:
+                for j in columns[variable]:
+                    rows.append(i)
+                    cols.append(j)
+                    data.append(value)
+    shape = (len(functions), len(variables))
+
+    if format == 'dense':
+        out = _jacobian_out(out, shape)
+        out[...] = 0.0
+        out[rows, cols] = data
+        return out
+    sparse = _scipy_sparse(format)
+    matrix = sparse.coo_matrix((np.array(data, dtype=float), (np.array(rows, dtype=np.intp), np.array(cols, dtype=np.intp))), shape=shape)
+    return matrix.tocsr() if format == 'csr' else matrix
+
+def _jacobian_out(out, shape):
+    """Returns the preallocated output array after checking its shape, or a new array if out is None"""
+    if out is None:
+        return np.zeros(shape)
+    if not isinstance(out, np.ndarray) or out.shape != shape:
+        raise ValueError("out must be a NumPy array of shape {}".format(shape))
+    return out
+
+def _jacobian_output(matrix, format, out):
+    """Returns a dense Jacobian matrix in the requested format, written into out if given"""
+    if format == 'dense':
+        if out is None:
+            return matrix
+        _jacobian_out(out, matrix.shape)[...] = matrix
+        return out
+    matrix = _scipy_sparse(format).coo_matrix(matrix)
+    return matrix.tocsr() if format == 'csr' else matrix
+
+def _scipy_sparse(format):
+    """Imports scipy.sparse, which is only needed for the sparse output formats"""
     try:
-        var = x.var
-        val = np.sin(x.val)
-        der = {k: np.cos(x.val) * v for k, v in x.der.items()}
-        der = Counter(der)
-        return sad.AutoDiff(var, val, der)
-    except AttributeError:
-        # print("Warning: For AutoDiffVector objects, please use the corresponding mathematical function: sinV(ADV) instead of sin(ADV)")
-        return np.sin(x)
-
-def _sinV(x):
-    """Returns the sine of the AutoDiffVector object"""
-
-    objects = []
-    for i in range(len(x.objects)):
-        new_object = sin(x.objects[list(x.objects.keys())[i]])
-        objects.append(new_object)
-        
-    return sad.autodiff.AutoDiffVector(objects)
-
-def _sinR(x):
-    """Returns the sine of the AutoDiffReverse object"""
-    der = {x.var : np.cos(x.val)}
-    der = Counter(der)
-    return sad.AutoDiffReverse(np.sin(x.val), None, der)
+        import scipy.sparse
+    except ImportError:
+        raise ImportError("jacobian(..., format={!r}) requires scipy".format(format))
+    return scipy.sparse
+
+def _jacobian_dense(variables, functions):
+    """Returns the Jacobian matrix of a list of AutoDiffDense objects sharing a registry"""
+    registry = functions[0].registry
+    n = len(registry)
+    # The extra zero column stands in for variables that were never registered
+    tangents = np.zeros((len(functions), n + 1))
+    for i, function in enumerate(functions):
+        tangents[i, :len(function.tangent)] = function.tangent
+    columns = [registry.slots.get(variable, n) for variable in variables]
+    return tangents[:, columns]
+
+def _jacobian_vector(variables, functions):
+    """Returns the Jacobian matrix of an AutoDiffVector object, reading its derivative matrix directly"""
+    registry = functions.registry
+    n = functions.der.shape[1]
+    columns = [registry.slots.get(variable, -1) for variable in variables]
+    # The derivative matrix is returned without copying when the columns already match
+    if columns == list(range(n)):
+        return functions.der
+    # The extra zero column stands in for variables the vector does not depend on
+    der = np.concatenate([functions.der, np.zeros((functions.der.shape[0], 1))], axis=1)
+    return der[:, [n if column < 0 or column >= n else column for column in columns]]
+
+def _applyV(x, val, der):
+    """Returns the AutoDiffVector object with values val whose derivatives are der times those of x"""
+    return sad.AutoDiffVector._make(x.variables, val, x.der * der[:, None], x.registry)
+
+def _applyB(x, val, der):
+    """Returns the AutoDiffBatch object with values val whose derivatives are der times those of x"""
+    return sad.AutoDiffBatch._make(x.var, val, {k: der * v for k, v in x.der.items()})
+
+def _applyD(x, val, der):
+    """Returns the AutoDiffDense object with value val whose derivatives are der times those of x"""
+    return sad.AutoDiffDense._make(x.var, float(val), der * x.tangent, x.registry)
+
+def _scalar_kernel(kernel, fallback):
+    """Returns kernel, evaluating the NumPy kernel fallback at the points where kernel raises"""
+    if kernel is None:
+        if fallback is None:
+            return None
+        kernel = fallback
+
+    def scalar(x):
+        try:
+            return kernel(x)
+        except (ValueError, ArithmeticError):
+            return float(fallback(np.float64(x)))
+    return scalar
+
+def _numpy_kernel(source):
+    """Returns the NumPy kernel evaluating source, an expression of the array u"""
+    return eval('lambda u: ' + source, {'np': np})
+
+class Primitive():
+    """An elementary function defined once by its value and its derivative
+
+    The implementations for every autodifferentiation type are generated from these
+    kernels. The NumPy kernels are used for arrays and the math kernels, which have
+    less overhead per call, for single floats. Where a math kernel raises instead of
+    returning nan or inf, e.g. math.log(0.0) or math.exp(1000.0), the NumPy kernel is
+    evaluated instead, so every engine follows the NumPy semantics and warnings.
+
+    The NumPy kernels can be given as the sources of expressions of u instead of
+    functions. The generated modules of superautodiff.codegen are then written from the
+    same sources, so that there is a single definition of the function to maintain.
+
+    ATTRIBUTES
+    ==========
+    name : name of the function, used as its key in the dispatch table
+    value : NumPy kernel returning the value of the function
+    derivative : NumPy kernel returning the derivative of the function
+    value_source : source of the value as a NumPy expression of u, or None
+    derivative_source : source of the derivative as a NumPy expression of u, or None
+    scalar : math kernel returning the value of the function at a float
+    scalar_derivative : math kernel returning the derivative of the function at a float
+    second_derivative : kernel returning the second derivative of the function at a float
+    taylor : kernel returning the Taylor coefficients of the function of a series
+    op : op code recorded on tapes for the function
+
+    EXAMPLES
+    ========
+    >>> p = PRIMITIVES['sin']
+    >>> p.value(np.array([0.0, 0.5]))
+    array([0.        , 0.47942554])
+    >>> p.scalar_derivative(0.0)
+    1.0
+    >>> p.derivative_source
+    'np.cos(u)'
+    """
+
+    def __init__(self, name, value, derivative, scalar=None, scalar_derivative=None, second_derivative=None,
+                 taylor=None):
+        self.name = name
+        self.value_source = value if isinstance(value, str) else None
+        self.derivative_source = derivative if isinstance(derivative, str) else None
+        self.value = _numpy_kernel(value) if isinstance(value, str) else value
+        self.derivative = _numpy_kernel(derivative) if isinstance(derivative, str) else derivative
+        self.scalar = _scalar_kernel(scalar, self.value)
+        self.scalar_derivative = _scalar_kernel(scalar_derivative, self.derivative)
+        self.second_derivative = _scalar_kernel(second_derivative, second_derivative)
+        self.taylor = taylor
+        self.op = op_code(name)
+
+    def implementations(self):
+        """Returns the implementation of the function for each argument type"""
+        value, derivative = self.value, self.derivative
+        scalar, scalar_derivative = self.scalar, self.scalar_derivative
+        op, series = self.op, self.taylor
+
+        def constant(x):
+            return value(x)
+
+        def number(x):
+            return scalar(x)
+
+        def forward(x):
+            d = scalar_derivative(x.val)
+            return sad.AutoDiff(x.var, scalar(x.val), Counter({k: d * v for k, v in x.der.items()}))
+
+        def vector(x):
+            return _applyV(x, value(x.val), derivative(x.val))
+
+        def reverse(x):
+            return AutoDiffReverse._record(x.tape, scalar(x.val), x.id, scalar_derivative(x.val), op=op)
+
+        def batch(x):
+            return _applyB(x, value(x.val), derivative(x.val))
+
+        def dense(x):
+            return AutoDiffDense._make(x.var, scalar(x.val), scalar_derivative(x.val) * x.tangent, x.registry)
+
+        def dual(x):
+            v = x.val
+            return Dual._make(scalar(v), scalar_derivative(v) * x.der)
+
+        def polynomial(x):
+            return Taylor._make(series(x.coef))
+
+        implementations = {object: constant, float: number, int: number, AutoDiff: forward,
+                           AutoDiffVector: vector, AutoDiffReverse: reverse, AutoDiffBatch: batch,
+                           AutoDiffDense: dense, Dual: dual}
+        if series is not None:
+            implementations[Taylor] = polynomial
+        suffixes = {object: 'C', float: 'C', int: 'C', AutoDiff: 'F', AutoDiffVector: 'V',
+                    AutoDiffReverse: 'R', AutoDiffBatch: 'B', AutoDiffDense: 'D', Dual: 'S', Taylor: 'T'}
+        for cls, function in implementations.items():
+            function.__name__ = function.__qualname__ = '_' + self.name + suffixes[cls]
+        return implementations
+
+    def register(self):
+        """Registers the implementations of the function in the dispatch table"""
+        OP_PRIMITIVES[self.op] = self
+        for cls, function in self.implementations().items():
+            register(self.name, cls)(function)
+
+# The elementary functions, each defined by its value and derivative kernels
+PRIMITIVES = {}
+
+# Every registered Primitive, including the logarithms to other bases, keyed by op code
+OP_PRIMITIVES = {}
+
+def primitive(name, value, derivative, scalar=None, scalar_derivative=None, second_derivative=None, taylor=None):
+    """Defines the elementary function name and registers its implementation for every type"""
+    p = Primitive(name, value, derivative, scalar, scalar_derivative, second_derivative, taylor)
+    PRIMITIVES[name] = p
+    p.register()
+    return p
+
+# Taylor coefficient kernels of the elementary functions. Each solves y' = g a' for the
+# series a of the argument: y[k] = sum(j * a[j] * g[k - j] for j = 1..k) / k
+
+def _series_integral(a, g, y0):
+    """Returns the series y with y[0] = y0 and y' = g a'"""
+    y = np.zeros(len(a))
+    y[0] = y0
+    ja = np.arange(len(a)) * a
+    for k in range(1, len(a)):
+        y[k] = np.dot(ja[1:k + 1], g[k - 1::-1]) / k
+    return y
+
+def _series_sincos(a, sign):
+    """Returns the series of sin(a) and cos(a), or of sinh(a) and cosh(a) when sign is 1"""
+    s, c = np.zeros(len(a)), np.zeros(len(a))
+    if sign < 0:
+        s[0], c[0] = np.sin(a[0]), np.cos(a[0])
+    else:
+        s[0], c[0] = np.sinh(a[0]), np.cosh(a[0])
+    ja = np.arange(len(a)) * a
+    for k in range(1, len(a)):
+        s[k] = np.dot(ja[1:k + 1], c[k - 1::-1]) / k
+        c[k] = sign * np.dot(ja[1:k + 1], s[k - 1::-1]) / k
+    return s, c
+
+def _series_tan(a, sign):
+    """Returns the series of tan(a), or of tanh(a) when sign is -1, using y' = (1 + sign y^2) a'"""
+    y, z = np.zeros(len(a)), np.zeros(len(a))
+    y[0] = np.tan(a[0]) if sign > 0 else np.tanh(a[0])
+    z[0] = 1 + sign * y[0] * y[0]
+    ja = np.arange(len(a)) * a
+    for k in range(1, len(a)):
+        y[k] = np.dot(ja[1:k + 1], z[k - 1::-1]) / k
+        z[k] = sign * np.dot(y[:k + 1], y[k::-1])
+    return y
+
+def _series_reciprocal(a):
+    """Returns the series of 1 / a"""
+    one = np.zeros(len(a))
+    one[0] = 1.0
+    return _series_div(one, a)
+
+def _series_log(a):
+    """Returns the series of log(a)"""
+    return _series_integral(a, _series_reciprocal(a), np.log(a[0]))
+
+def _series_one_plus_square(a, sign):
+    """Returns the series of 1 + sign a^2"""
+    b = sign * _series_mul(a, a)
+    b[0] += 1.0
+    return b
+
+def _series_arcsin(a):
+    """Returns the series of arcsin(a)"""
+    return _series_integral(a, _series_pow(_series_one_plus_square(a, -1), -0.5), np.arcsin(a[0]))
+
+def _series_arccos(a):
+    """Returns the series of arccos(a)"""
+    return _series_integral(a, -_series_pow(_series_one_plus_square(a, -1), -0.5), np.arccos(a[0]))
+
+def _series_arctan(a):
+    """Returns the series of arctan(a)"""
+    return _series_integral(a, _series_reciprocal(_series_one_plus_square(a, 1)), np.arctan(a[0]))
+
+primitive('sin', 'np.sin(u)', 'np.cos(u)', math.sin, math.cos, lambda x: -np.sin(x),
+          taylor=lambda a: _series_sincos(a, -1)[0])
+primitive('cos', 'np.cos(u)', '-np.sin(u)', math.cos, lambda x: -math.sin(x), lambda x: -np.cos(x),
+          taylor=lambda a: _series_sincos(a, -1)[1])
+primitive('tan', 'np.tan(u)', '1 / np.cos(u) ** 2', math.tan, lambda x: 1 / math.cos(x) ** 2,
+          lambda x: 2 * np.tan(x) / np.cos(x) ** 2, lambda a: _series_tan(a, 1))
+primitive('arcsin', 'np.arcsin(u)', '1 / np.sqrt(1 - u * u)', math.asin, lambda x: 1 / math.sqrt(1 - x * x),
+          lambda x: x / np.sqrt(1 - x * x) ** 3, _series_arcsin)
+primitive('arccos', 'np.arccos(u)', '-1 / np.sqrt(1 - u * u)', math.acos, lambda x: -1 / math.sqrt(1 - x * x),
+          lambda x: -x / np.sqrt(1 - x * x) ** 3, _series_arccos)
+primitive('arctan', 'np.arctan(u)', '1 / (1 + u * u)', math.atan, None, lambda x: -2 * x / (1 + x * x) ** 2,
+          _series_arctan)
+primitive('exp', 'np.exp(u)', 'np.exp(u)', math.exp, math.exp, np.exp, _series_exp)
+primitive('log', 'np.log(u)', '1 / u', math.log, None, lambda x: -1 / (x * x), _series_log)
+primitive('sinh', 'np.sinh(u)', 'np.cosh(u)', math.sinh, math.cosh, np.sinh, lambda a: _series_sincos(a, 1)[0])
+primitive('cosh', 'np.cosh(u)', 'np.sinh(u)', math.cosh, math.sinh, np.cosh, lambda a: _series_sincos(a, 1)[1])
+primitive('tanh', 'np.tanh(u)', '1 / np.cosh(u) ** 2', math.tanh, lambda x: 1 / math.cosh(x) ** 2,
+          lambda x: -2 * np.tanh(x) / np.cosh(x) ** 2, lambda a: _series_tan(a, -1))
+
+def sin(x):
+    """Returns the sine of the AutoDiff or AutoDiffVector or AutoDiffReverse object"""
+    return _dispatch('sin', x)(x)
 
 def cos(x):
     """Returns the cosine of the AutoDiff or AutoDiffVector or AutoDiffReverse object"""
-
-    if (type(x).__name__) is 'AutoDiffVector':
-        return _cosV(x)
-    elif (type(x).__name__) is 'AutoDiffReverse':
-        return _cosR(x)
-
-    try:
-        var = x.var
-        val = np.cos(x.val)
-        der = {k: -np.sin(x.val) * v for k, v in x.der.items()}
-        der = Counter(der)
-        return sad.AutoDiff(var, val, der)
-    except AttributeError:
-        # print("Warning: For AutoDiffVector objects, please use the corresponding mathematical function: cosV(ADV) instead of cos(ADV)")
-        return np.cos(x)
-
-def _cosV(x):
-    """Returns the cosine of the AutoDiffVector object"""
-
-    objects = []
-    for i in range(len(x.objects)):
-        new_object = cos(x.objects[list(x.objects.keys())[i]])
-        objects.append(new_object)
-        
-    return sad.autodiff.AutoDiffVector(objects)
-
-def _cosR(x):
-    """Returns the cosine of the AutoDiffReverse object"""
-
-    der = {x.var : -np.sin(x.val)}
-    der = Counter(der)
-    return sad.AutoDiffReverse(np.cos(x.val), None, der)
+    return _dispatch('cos', x)(x)
 
 def tan(x):
     """Returns the tangent of the AutoDiff or AutoDiffVector or AutoDiffReverse object"""
-
-    if (type(x).__name__) is 'AutoDiffVector':
-        return _tanV(x)
-    elif (type(x).__name__) is 'AutoDiffReverse':
-        return _tanR(x)
-
-    try:
-        var = x.var
-        val = np.tan(x.val)
-        der = {k: (1 / (np.cos(x.val) ** 2)) * v for k, v in x.der.items()}
-        der = Counter(der)
-        return sad.AutoDiff(var, val, der)
-    except AttributeError:
-        # print("Warning: For AutoDiffVector objects, please use the corresponding mathematical function: tanV(ADV) instead of tan(ADV)")
-        return np.tan(x)
-
-def _tanV(x):
-    """Returns the tangent of the AutoDiffVectorobject"""
-
-    objects = []
-    for i in range(len(x.objects)):
-        new_object = tan(x.objects[list(x.objects.keys())[i]])
-        objects.append(new_object)
-        
-    return sad.autodiff.AutoDiffVector(objects)
-
-def _tanR(x):
-    """Returns the rangent of the AutoDiffReverse object"""
-
-    der = {x.var : 1 / (np.cos(x.val) ** 2)}
-    return sad.AutoDiffReverse(np.tan(x.val), None, der)
+    return _dispatch('tan', x)(x)
 
 def arcsin(x):
     """Returns the arcsine of the AutoDiff or AutoDiffVector or AutoDiffReverse object"""
-
-    if (type(x).__name__) is 'AutoDiffVector':
-        return _arcsinV(x)
-    elif (type(x).__name__) is 'AutoDiffReverse':
-        return _arcsinR(x)
-
-    try:
-        var = x.var
-        val = np.arcsin(x.val)
-        der = {k: (1 / np.sqrt(1 - x.val ** 2)) * v for k, v in x.der.items()}
-        der = Counter(der)
-        return sad.AutoDiff(var, val, der)
-    except AttributeError:
-        # print("Warning: For AutoDiffVector objects, please use the corresponding mathematical function: arcsinV(ADV) instead of arcsin(ADV)")
-        return np.arcsin(x)
-
-def _arcsinV(x):
-    """Returns the arcsine of the AutoDiffVector object"""
-
-    objects = []
-    for i in range(len(x.objects)):
-        new_object = arcsin(x.objects[list(x.objects.keys())[i]])
-        objects.append(new_object)
-        
-    return sad.autodiff.AutoDiffVector(objects)
-
-def _arcsinR(x):
-    """Returns the arcsine of the AutoDiffReverse object"""
-
-    der = {x.var : 1 / np.sqrt(1 - x.val ** 2)}
-    return sad.AutoDiffReverse(np.arcsin(x.val), None, der)
+    return _dispatch('arcsin', x)(x)
 
 def arccos(x):
     """Returns the arccos of the AutoDiff or AutoDiffVector or AutoDiffReverse object"""
-
-    if (type(x).__name__) is 'AutoDiffVector':
-        return _arccosV(x)
-    elif (type(x).__name__) is 'AutoDiffReverse':
-        return _arccosR(x)
-
-    try:
-        var = x.var
-        val = np.arccos(x.val)
-        der = {k: (1 / -np.sqrt(1 - x.val ** 2)) * v for k, v in x.der.items()}
-        der = Counter(der)
-        return sad.AutoDiff(var, val, der)
-    except AttributeError:
-        # print("Warning: For AutoDiffVector objects, please use the corresponding mathematical function: arccosV(ADV) instead of arccos(ADV)")
-        return np.arccos(x)
-
-
-def _arccosV(x):
-    """Returns the arccos of the AutoDiffVector object"""
-
-    objects = []
-    for i in range(len(x.objects)):
-        new_object = arccos(x.objects[list(x.objects.keys())[i]])
-        objects.append(new_object)
-        
-    return sad.autodiff.AutoDiffVector(objects)
-
-def _arccosR(x):
-    """Returns the arccsine of the AutoDiffReverse object"""
-
-    der = {x.var : 1 / -np.sqrt(1 - x.val ** 2)}
-    return sad.AutoDiffReverse(np.arccos(x.val), None, der)
+    return _dispatch('arccos', x)(x)
 
 def arctan(x):
     """Returns the arctangent of the AutoDiff or AutoDiffVector or AutoDiffReverse object"""
-    
-    if (type(x).__name__) is 'AutoDiffVector':
-        return _arctanV(x)
-    elif (type(x).__name__) is 'AutoDiffReverse':
-        return _arctanR(x)
-
-    try:
-        var = x.var
-        val = np.arctan(x.val)
-        der = {k: (1 / (1 + x.val * x.val)) * v for k, v in x.der.items()}
-        der = Counter(der)
-        return sad.AutoDiff(var, val, der)
-    except AttributeError:
-        # print("Warning: For AutoDiffVector objects, please use the corresponding mathematical function: arctanV(ADV) instead of arctan(ADV)")
-        return np.arctan(x)
-
-
-def _arctanV(x):
-    """Returns the arctangent of the AutoDiffVector object"""
-
-    objects = []
-    for i in range(len(x.objects)):
-        new_object = arctan(x.objects[list(x.objects.keys())[i]])
-        objects.append(new_object)
-        
-    return sad.autodiff.AutoDiffVector(objects)
-
-def _arctanR(x):
-    """Returns the arctangent of the AutoDiffReverse object"""
-
-    der = {x.var : 1 / (1 + x.val * x.val)}
-    return sad.AutoDiffReverse(np.arctan(x.val), None, der)
+    return _dispatch('arctan', x)(x)
 
 def exp(x):
     """Returns the exp of the AutoDiff or AutoDiffVector or AutoDiffReverse object"""
-    
-    if (type(x).__name__) is 'AutoDiffVector':
-        return _expV(x)
-    elif (type(x).__name__) is 'AutoDiffReverse':
-        return _expR(x)
-
-    try:
-        var = x.var
-        val = np.exp(x.val)
-        der = {k: val * v for k, v in x.der.items()}
-        der = Counter(der)
-        return sad.AutoDiff(var, val, der)
-    except AttributeError:
-        # print("Warning: For AutoDiffVector objects, please use the corresponding mathematical function: expV(ADV) instead of exp(ADV)")
-        return np.exp(x)
-
-def _expV(x):
-    """Returns the exp of the AutoDiffVector object"""
-
-    objects = []
-    for i in range(len(x.objects)):
-        new_object = exp(x.objects[list(x.objects.keys())[i]])
-        objects.append(new_object)
-        
-    return sad.autodiff.AutoDiffVector(objects)
-
-def _expR(x):
-    """Returns the exp of the AutoDiffReverse object"""
-
-    der = {x.var : np.exp(x.val)}
-    return sad.AutoDiffReverse(np.exp(x.val), None, der)
+    return _dispatch('exp', x)(x)
 
 def log(x, base=math.e):
     """Returns the log of the AutoDiff or AutoDiffVector or AutoDiffReverse object"""
-
-    if (type(x).__name__) is 'AutoDiffVector':
-        return _logV(x, base=base)
-    elif (type(x).__name__) is 'AutoDiffReverse':
-        return _logR(x, base=base)
-
+    if base == math.e:
+        return _dispatch('log', x)(x)
     try:
-        var = x.var
-        val = math.log(x.val, base)
-        der = {k: (1 / (x.val * math.log(base))) * v for k, v in x.der.items()}
-        der = Counter(der)
-        return sad.AutoDiff(var, val, der)
-    except ValueError:
-        print("Invalid value for mathematical function")
-    except AttributeError:
-        # print("Warning: For AutoDiffVector objects, please use the corresponding mathematical function: logV(ADV) instead of log(ADV)")
-        return math.log(x, base)
-
-def _logV(x, base=math.e):
-    """Returns the log of the AutoDiffVector object"""
-
-    objects = []
-    for i in range(len(x.objects)):
-        new_object = log(x.objects[list(x.objects.keys())[i]], base=base)
-        objects.append(new_object)
-        
-    return sad.autodiff.AutoDiffVector(objects)
-
-def _logR(x, base=math.e):
-    """Returns the log of the AutoDiffReverse object"""
-
-    der = {x.var : 1 / (x.val * math.log(base))}
-    return sad.AutoDiffReverse(math.log(x.val, base), None, der)
+        name = _LOG_BASES[base]
+    except KeyError:
+        name = _log_base(base)
+    return _dispatch(name, x)(x)
+
+# Dispatch table names of the logarithms to bases other than e
+_LOG_BASES = {}
+
+def _log_base(base):
+    """Registers the implementations of the logarithm to the given base and returns their name"""
+    name = _LOG_BASES[base] = 'log' + repr(float(base))
+    c = math.log(base)
+    Primitive(name, 'np.log(u) / {!r}'.format(c), '1 / (u * {!r})'.format(c), lambda x: math.log(x) / c, None,
+              lambda x: -1 / (x * x * c), lambda a: _series_log(a) / c).register()
+    return name
 
 def sinh(x):
     """Returns the sine_h of the AutoDiff or AutoDiffVector or AutoDiffReverse object"""
-
-    if (type(x).__name__) is 'AutoDiffVector':
-        return _sinhV(x)
-    elif (type(x).__name__) is 'AutoDiffReverse':
-        return _sinhR(x)
-
-
-    try:
-        var = x.var
-        val = math.sinh(x.val)
-        der = {k: math.cosh(x.val) * v for k, v in x.der.items()}
-        der = Counter(der)
-        return sad.AutoDiff(var, val, der)
-    except ValueError:
-        print("Invalid value for mathematical function")
-    except AttributeError:
-        # print("Warning: For AutoDiffVector objects, please use the corresponding mathematical function: sinhV(ADV) instead of sinh(ADV)")
-        return math.sinh(x)
-
-
-def _sinhV(x):
-    """Returns the sine_h of the AutoDiffVector object"""
-
-    objects = []
-    for i in range(len(x.objects)):
-        new_object = sinh(x.objects[list(x.objects.keys())[i]])
-        objects.append(new_object)
-        
-    return sad.autodiff.AutoDiffVector(objects)
-
-def _sinhR(x):
-    """Returns the sin_h of the AutoDiffReverse object"""
-    der = {x.var : np.cosh(x.val)}
-    der = Counter(der)
-    return sad.AutoDiffReverse(np.sinh(x.val), None, der)
+    return _dispatch('sinh', x)(x)
 
 def cosh(x):
     """Returns the cosine_h of the AutoDiff or AutoDiffVector or AutoDiffReverse object"""
-    
-    if (type(x).__name__) is 'AutoDiffVector':
-        return _coshV(x)
-    elif (type(x).__name__) is 'AutoDiffReverse':
-        return _coshR(x)
-
-    try:
-        var = x.var
-        val = math.cosh(x.val)
-        der = {k: -math.sinh(x.val) * v for k, v in x.der.items()}
-        der = Counter(der)
-        return sad.AutoDiff(var, val, der)
-    except ValueError:
-        print("Invalid value for mathematical function")
-    except AttributeError:
-        print("Warning: For AutoDiffVector objects, please use the corresponding mathematical function: coshV(ADV) instead of cosh(ADV)")
-        return math.cosh(x)
-
-def _coshV(x):
-    """Returns the cosine_h of the AutoDiffVector object"""
-
-    objects = []
-    for i in range(len(x.objects)):
-        new_object = cosh(x.objects[list(x.objects.keys())[i]])
-        objects.append(new_object)
-        
-    return sad.autodiff.AutoDiffVector(objects)
-
-def _coshR(x):
-    """Returns the cos_h of the AutoDiffReverse object"""
-    der = {x.var : -np.sinh(x.val)}
-    der = Counter(der)
-    return sad.AutoDiffReverse(np.cosh(x.val), None, der)
+    return _dispatch('cosh', x)(x)
 
 def tanh(x):
     """Returns the tan_h of the AutoDiff or AutoDiffVector or AutoDiffReverse object"""
+    return _dispatch('tanh', x)(x)
 
-    if (type(x).__name__) is 'AutoDiffVector':
-        return _tanhV(x)
-    elif (type(x).__name__) is 'AutoDiffReverse':
-        return _tanhR(x)
-    
-    try:
-        var = x.var
-        val = math.tanh(x.val)
-        der = {k: (1 / (cosh(x.val) ** 2)) * v for k, v in x.der.items()}
-        der = Counter(der)
-        return sad.AutoDiff(var, val, der)
-    except ValueError:
-        print("Invalid value for mathematical function")
-    except AttributeError:
-        # print("Warning: For AutoDiffVector objects, please use the corresponding mathematical function: tanhV(ADV) instead of tanh(ADV)")
-        return np.tanh(x)
-
-def _tanhV(x):
-    """Returns the tan_h of the AutoDiffVector object"""
-
-    objects = []
-    for i in range(len(x.objects)):
-        new_object = tanh(x.objects[list(x.objects.keys())[i]])
-        objects.append(new_object)
-        
-    return sad.autodiff.AutoDiffVector(objects)
-
-def _tanhR(x):
-    """Returns the sin_h of the AutoDiffReverse object"""
-    der = {x.var : 1/(cosh(x.val) ** 2)}
-    der = Counter(der)
-    return sad.AutoDiffReverse(np.tanh(x.val), None, der)
-      
 def sqrt(x):
   """Returns the square root of the AutoDiff or AutoDiffVector or AutoDiffReverse object"""
   return x**0.5
@@ -434,3 +461,136 @@ def sqrt(x):
 def logistic(x):
   """Returns the AutoDiff or AutoDiffVector or AutoDiffReverse object passed through a sigmoid transformation"""
   return 1/(1+exp(-x))
+
+
+# NumPy dispatch protocols
+
+# Methods NumPy calls on the elements of object arrays, e.g. np.sin calls x.sin()
+UFUNC_METHODS = {name: globals()[name] for name in PRIMITIVES}
+UFUNC_METHODS.update({
+    'sqrt': sqrt, 'log10': lambda x: log(x, base=10), 'log2': lambda x: log(x, base=2),
+})
+
+# Unary ufuncs and the functions they are routed to
+UNARY_UFUNCS = {getattr(np, name): function for name, function in UFUNC_METHODS.items()}
+UNARY_UFUNCS.update({
+    np.negative: operator.neg,
+    np.positive: lambda x: x,
+    np.square: lambda x: x * x,
+    np.reciprocal: lambda x: 1 / x,
+})
+
+# Binary ufuncs and the operator methods they are routed to, with their reflections
+BINARY_UFUNCS = {
+    np.add: ('__add__', '__radd__'),
+    np.subtract: ('__sub__', '__rsub__'),
+    np.multiply: ('__mul__', '__rmul__'),
+    np.true_divide: ('__truediv__', '__rtruediv__'),
+    np.power: ('__pow__', '__rpow__'),
+    np.less: ('__lt__', '__gt__'),
+    np.less_equal: ('__le__', '__ge__'),
+    np.greater: ('__gt__', '__lt__'),
+    np.greater_equal: ('__ge__', '__le__'),
+}
+
+def _apply_ufunc(ufunc, inputs):
+    """Applies a supported ufunc to inputs containing at least one autodifferentiation object"""
+    if ufunc in UNARY_UFUNCS:
+        return UNARY_UFUNCS[ufunc](inputs[0])
+    method, reflected = BINARY_UFUNCS[ufunc]
+    if isinstance(inputs[0], sad.autodiff.ArrayDispatch):
+        result = getattr(inputs[0], method)(inputs[1])
+    else:
+        result = getattr(inputs[1], reflected)(inputs[0])
+    if result is NotImplemented:
+        raise TypeError("{} is not supported for these operands".format(ufunc.__name__))
+    return result
+
+def _object_array(x):
+    """Wraps autodifferentiation objects in 0-d object arrays so NumPy treats them as elements"""
+    if isinstance(x, sad.autodiff.ArrayDispatch):
+        wrapped = np.empty((), dtype=object)
+        wrapped[()] = x
+        return wrapped
+    return x
+
+def array_ufunc(obj, ufunc, method, inputs, kwargs):
+    """Implements __array_ufunc__ by routing supported ufuncs to the functions and operators"""
+    if method != '__call__' or kwargs or (ufunc not in UNARY_UFUNCS and ufunc not in BINARY_UFUNCS):
+        return NotImplemented
+
+    # Scalar objects combined with arrays are applied element by element
+    if not obj._array_operands and any(isinstance(x, np.ndarray) and x.ndim > 0 for x in inputs):
+        return np.frompyfunc(lambda *args: _apply_ufunc(ufunc, args), len(inputs), 1)(*map(_object_array, inputs))
+
+    return _apply_ufunc(ufunc, inputs)
+
+# Types of the objects holding a single value, which NumPy reductions leave as they are
+SCALAR_TYPES = (int, float, np.number, AutoDiff, Dual, Taylor, AutoDiffDense, AutoDiffReverse)
+
+def _sum(a, axis=None):
+    """Returns the sum of the elements of an AutoDiffVector object; single values are their own sum
+
+    Other objects, e.g. AutoDiffBatch objects, whose points are independent, are not
+    supported and NumPy raises a TypeError.
+    """
+    if type(a) is sad.AutoDiffVector:
+        if axis not in (None, 0):
+            raise ValueError("Only the sum over all elements is supported")
+        return a.sum()
+    if isinstance(a, SCALAR_TYPES) and axis is None:
+        return a
+    return NotImplemented
+
+def _mean(a, axis=None):
+    """Returns the mean of the elements of an AutoDiffVector object; single values are their own mean"""
+    if type(a) is sad.AutoDiffVector:
+        return _sum(a, axis) / len(a)
+    return _sum(a, axis)
+
+def _dot(a, b):
+    """Returns the dot product of two vectors, at least one of which is an AutoDiffVector object, or the product of a single value with a value or an array"""
+    if isinstance(a, sad.AutoDiffBatch) or isinstance(b, sad.AutoDiffBatch):
+        return NotImplemented
+    if type(a) is sad.AutoDiffVector or type(b) is sad.AutoDiffVector:
+        return _sum(a * b)
+    if isinstance(a, SCALAR_TYPES) and isinstance(b, SCALAR_TYPES):
+        return a * b
+    # The products of a single value with the elements of an array
+    if isinstance(a, SCALAR_TYPES) and isinstance(b, (list, tuple, np.ndarray)):
+        return np.asarray(b) * a
+    if isinstance(b, SCALAR_TYPES) and isinstance(a, (list, tuple, np.ndarray)):
+        return np.asarray(a) * b
+    return NotImplemented
+
+def _concatenate(arrays, axis=0):
+    """Returns the AutoDiffVector object joining AutoDiffVector objects and arrays of constants end to end"""
+    if axis != 0:
+        raise ValueError("Only one dimensional vectors can be concatenated")
+    first = next((a for a in arrays if type(a) is sad.AutoDiffVector), None)
+    if first is None:
+        return NotImplemented
+    registry = first.registry
+    variables, vals, ders = [], [], []
+    for a in arrays:
+        if type(a) is sad.AutoDiffVector:
+            _, _, val, der = first._operands(a)
+            variables.extend(a.variables)
+        else:
+            val, der = np.atleast_1d(np.asarray(a, dtype=float)), None
+            variables.extend('const[{}]'.format(len(variables) + i) for i in range(len(val)))
+        vals.append(val)
+        ders.append(der)
+    width = len(registry)
+    ders = [np.zeros((len(val), width)) if der is None else np.pad(der, ((0, 0), (0, width - der.shape[1])))
+            for val, der in zip(vals, ders)]
+    return sad.AutoDiffVector._make(variables, np.concatenate(vals), np.concatenate(ders), registry)
+
+ARRAY_FUNCTIONS = {np.sum: _sum, np.mean: _mean, np.dot: _dot, np.concatenate: _concatenate}
+
+def array_function(obj, func, types, args, kwargs):
+    """Implements __array_function__ for the NumPy functions in ARRAY_FUNCTIONS"""
+    if func not in ARRAY_FUNCTIONS:
+        return NotImplemented
+    return ARRAY_FUNCTIONS[func](*args, **kwargs)
+
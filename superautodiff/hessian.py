@@ -0,0 +1,124 @@
+import math
+import numpy as np
+from superautodiff.autodiffreverse import AutoDiffReverse, tape, _trace
+from superautodiff.functions import OP_PRIMITIVES
+from superautodiff.tapes import OP_CODES
+
+# Second derivatives (h11, h12, h22) of the nonlinear operators with respect to their
+# parent values u and w, given the constant c of the operation; every other operator is
+# linear in its parents
+_OPERATOR_HESSIANS = {
+    OP_CODES['mul']: lambda u, w, c: (0.0, 1.0, 0.0),
+    OP_CODES['div']: lambda u, w, c: (0.0, -1 / (w * w), 2 * u / (w * w * w)),
+    OP_CODES['rdivc']: lambda u, w, c: (2 * c / (u * u * u), 0.0, 0.0),
+    OP_CODES['powc']: lambda u, w, c: (c * (c - 1) * u ** (c - 2), 0.0, 0.0),
+    OP_CODES['rpowc']: lambda u, w, c: (c ** u * math.log(c) ** 2, 0.0, 0.0),
+}
+
+
+def _local_hessians(t, n):
+    """Returns the second derivatives h11, h12, h22 of the first n nodes of t with respect to their parents"""
+    ops = t.ops[:n].tolist()
+    constants = t.constants[:n].tolist()
+    values = t.values[:n].tolist()
+    parents1, parents2 = t.parents[:n, 0].tolist(), t.parents[:n, 1].tolist()
+    h11, h12, h22 = [0.0] * n, [0.0] * n, [0.0] * n
+    for i, op in enumerate(ops):
+        if op in _OPERATOR_HESSIANS:
+            p, q = parents1[i], parents2[i]
+            h11[i], h12[i], h22[i] = _OPERATOR_HESSIANS[op](values[p], values[q] if q >= 0 else 0.0, constants[i])
+        elif op in OP_PRIMITIVES:
+            h11[i] = OP_PRIMITIVES[op].second_derivative(values[parents1[i]])
+    return h11, h12, h22
+
+
+def _hvp_recorded(t, y, n, directions):
+    """Returns the Hessian-vector products of the node y with the rows of directions
+
+    The leaves of the tape are its first n nodes. Each direction is pushed forward
+    through the tape as the tangents of the node values; the reverse sweep then carries
+    the tangents of the adjoints, which end up as H . v on the leaves.
+    """
+    if t.checkpoints:
+        raise ValueError("Hessian-vector products of checkpointed computations are not supported")
+    m = y.id + 1
+    parents1, parents2 = t.parents[:m, 0].tolist(), t.parents[:m, 1].tolist()
+    partials1, partials2 = t.partials[:m, 0].tolist(), t.partials[:m, 1].tolist()
+    adjoints = t.sweep(y.id).tolist()
+    h11, h12, h22 = _local_hessians(t, m)
+
+    products = np.zeros((len(directions), n))
+    for r, v in enumerate(directions):
+        tangents = v[:m].tolist() + [0.0] * (m - min(n, m))
+        for i in range(n, m):
+            p = parents1[i]
+            if p >= 0:
+                s = partials1[i] * tangents[p]
+                q = parents2[i]
+                if q >= 0:
+                    s += partials2[i] * tangents[q]
+                tangents[i] = s
+
+        adjoint_tangents = [0.0] * m
+        for i in range(m - 1, -1, -1):
+            p = parents1[i]
+            if p < 0:
+                continue
+            a, b = adjoints[i], adjoint_tangents[i]
+            q = parents2[i]
+            tp = tangents[p]
+            tq = tangents[q] if q >= 0 else 0.0
+            adjoint_tangents[p] += b * partials1[i] + a * (h11[i] * tp + h12[i] * tq)
+            if q >= 0:
+                adjoint_tangents[q] += b * partials2[i] + a * (h12[i] * tp + h22[i] * tq)
+        products[r, :min(n, m)] = adjoint_tangents[:n]
+    return products
+
+
+def hvp(f, x, v):
+    """Returns the product of the Hessian matrix of the scalar function f at x with v
+
+    f is recorded once in reverse mode, as by value_and_grad, and forward mode tangents
+    along v are then pushed through the tape and back through a second order reverse
+    sweep (forward-over-reverse). v has the shape of x, or an extra leading axis holding
+    several directions, which then share the one recording.
+
+    EXAMPLES
+    ========
+    >>> f = lambda x: x[0] ** 2 * x[1]
+    >>> hvp(f, [1.0, 2.0], [1.0, 0.0])
+    array([4., 2.])
+    >>> hvp(f, [1.0, 2.0], [[1.0, 0.0], [0.0, 1.0]])
+    array([[4., 2.],
+           [2., 0.]])
+    """
+    x = np.asarray(x, dtype=float)
+    v = np.asarray(v, dtype=float)
+    if v.shape == x.shape:
+        directions = v.reshape(1, -1)
+    elif v.shape[1:] == x.shape:
+        directions = v.reshape(len(v), -1)
+    else:
+        raise ValueError("v must have the shape of x {} or a leading batch axis, not {}".format(x.shape, v.shape))
+
+    with tape() as t:
+        y = _trace(t, f, x)
+        if not isinstance(y, AutoDiffReverse):
+            return np.zeros(v.shape)
+        return _hvp_recorded(t, y, x.size, directions).reshape(v.shape)
+
+
+def hessian(f, x):
+    """Returns the Hessian matrix of the scalar function f at x
+
+    The columns are the Hessian-vector products with the unit vectors, computed from a
+    single recording of f. The result has shape x.shape + x.shape.
+
+    EXAMPLES
+    ========
+    >>> hessian(lambda x: x[0] ** 2 * x[1], [1.0, 2.0])
+    array([[4., 2.],
+           [2., 0.]])
+    """
+    x = np.asarray(x, dtype=float)
+    return hvp(f, x, np.eye(x.size).reshape((x.size,) + x.shape)).reshape(x.shape + x.shape)
@@ -0,0 +1,190 @@
+import numpy as np
+from superautodiff.tapes import Tape, OP_CODES
+
+_LEAF, _CUSTOM = OP_CODES['leaf'], OP_CODES['custom']
+_ADD, _SUB, _MUL, _DIV = OP_CODES['add'], OP_CODES['sub'], OP_CODES['mul'], OP_CODES['div']
+_ADDC, _SUBC, _RSUBC = OP_CODES['addc'], OP_CODES['subc'], OP_CODES['rsubc']
+_MULC, _DIVC, _RDIVC, _POWC = OP_CODES['mulc'], OP_CODES['divc'], OP_CODES['rdivc'], OP_CODES['powc']
+
+# Binary operators with a constant parent, as functions of its value K returning the
+# operator of the other parent and its constant, for K as the right and the left parent
+_CONSTANT_RIGHT = {
+    _ADD: lambda K: (_ADDC, K),
+    _SUB: lambda K: (_SUBC, K),
+    _MUL: lambda K: (_MULC, K),
+    _DIV: lambda K: (_DIVC, K),
+}
+_CONSTANT_LEFT = {
+    _ADD: lambda K: (_ADDC, K),
+    _SUB: lambda K: (_RSUBC, K),
+    _MUL: lambda K: (_MULC, K),
+    _DIV: lambda K: (_RDIVC, K),
+}
+
+# Unary operators that are affine in their parent, as functions of their constant c
+# returning a and b such that the node is a * parent + b
+_AFFINE = {
+    _ADDC: lambda c: (1.0, c),
+    _SUBC: lambda c: (1.0, -c),
+    _RSUBC: lambda c: (-1.0, c),
+    _MULC: lambda c: (c, 0.0),
+    _DIVC: lambda c: (1 / c, 0.0),
+}
+
+_COMMUTATIVE = (_ADD, _MUL)
+
+
+def _affine_node(a, b):
+    """Returns the single operator (op, partial, constant) computing a * x + b, or None if there is none"""
+    if b == 0.0:
+        return _MULC, a, a
+    if a == 1.0:
+        return _ADDC, 1.0, b
+    if a == -1.0:
+        return _RSUBC, -1.0, b
+    return None
+
+
+def optimize(t, outputs, inputs=None):
+    """Returns a smaller tape computing the nodes outputs of the tape t, with their new ids and statistics
+
+    The nodes are rewritten in order of recording by the following passes:
+
+    - constant folding: nodes whose parents are all constants become constant leaves,
+      and binary operators with one constant parent become the operators with a
+      constant, e.g. x * c is recorded as mulc;
+    - identity removal: chains of affine operators of a node (x + c, x - c, c - x, x * c
+      and x / c) are combined into one, and dropped when they reduce to the identity,
+      e.g. x * 1, x + 0 or -(-x); so is x ** 1;
+    - common subexpression elimination: a node with the same operation, parents and
+      constant as an earlier node is replaced by it;
+
+    and the nodes the outputs and the traced comparisons do not depend on are removed.
+    Values, partial derivatives, names and guards are carried over, so sweeping the new
+    tape gives the same adjoints, up to rounding, for the leaves.
+
+    The first inputs leaves are the inputs; the other leaves are constants. When inputs
+    is None every leaf is an input and is kept.
+
+    The statistics are a dictionary with the number of nodes 'before' and 'after' and
+    the number of nodes 'removed', as merged by 'cse', dropped as 'identities' or no
+    longer needed ('dead'), together with the number of nodes 'folded' into constants.
+
+    EXAMPLES
+    ========
+    >>> t = Tape()
+    >>> x = t.record(2.0, name='x')
+    >>> y = t.record(1.0, x, -1.0, op=OP_CODES['rsubc'], c=3.0)      # 3 - x
+    >>> z = t.record(-1.0, y, -1.0, op=OP_CODES['rsubc'], c=0.0)     # -(3 - x)
+    >>> w = t.record(1.0, z, 1.0, op=OP_CODES['addc'], c=3.0)        # -(3 - x) + 3
+    >>> s = t.record(4.0, w, 1.0, x, 1.0, op=OP_CODES['add'])        # x + x
+    >>> optimized, ids, stats = optimize(t, [s])
+    >>> len(optimized), stats['removed'], stats['identities'], stats['dead']
+    (2, 3, 1, 2)
+    >>> optimized.parents[ids[0]], optimized.sweep(ids)
+    (array([0, 0], dtype=int32), array([2., 1.]))
+    """
+    if t.checkpoints:
+        raise ValueError("Tapes with checkpointed computations cannot be optimized")
+    outputs = np.atleast_1d(np.asarray(outputs, dtype=np.intp))
+    n = t.span(outputs.tolist())
+    ops = t.ops[:n].tolist()
+    constants = t.constants[:n].tolist()
+    values = t.values[:n].tolist()
+    parents1, parents2 = t.parents[:n, 0].tolist(), t.parents[:n, 1].tolist()
+    partials1, partials2 = t.partials[:n, 0].tolist(), t.partials[:n, 1].tolist()
+
+    # Every node is replaced by its representative, an earlier or the same node; the
+    # kept nodes are rewritten in place in these lists
+    rep = list(range(n))
+    is_constant = [False] * n
+    affine = [None] * n
+    seen = {}
+    stats = {'before': n, 'cse': 0, 'identities': 0, 'folded': 0, 'dead': 0}
+    for i in range(n):
+        op, p = ops[i], parents1[i]
+        if p >= 0:
+            p, q = rep[p], rep[parents2[i]] if parents2[i] >= 0 else -1
+            if op == _CUSTOM:
+                parents1[i], parents2[i] = p, q
+                continue
+            if is_constant[p] and (q < 0 or is_constant[q]):
+                # Constant folding
+                ops[i], parents1[i], parents2[i], partials1[i], partials2[i] = _LEAF, -1, -1, 0.0, 0.0
+                stats['folded'] += 1
+        if parents1[i] < 0:
+            if inputs is not None and i >= inputs:
+                is_constant[i] = True
+                key = (_LEAF, values[i])
+                if key in seen:
+                    rep[i] = seen[key]
+                    stats['cse'] += 1
+                else:
+                    seen[key] = i
+            continue
+        d1, d2, c = partials1[i], partials2[i], constants[i]
+        if q >= 0 and is_constant[q] and op in _CONSTANT_RIGHT:
+            (op, c), q = _CONSTANT_RIGHT[op](values[q]), -1
+        elif q >= 0 and is_constant[p] and op in _CONSTANT_LEFT:
+            (op, c), p, d1, q = _CONSTANT_LEFT[op](values[p]), q, d2, -1
+
+        # Identity removal, combining chains of affine operators
+        if op in _AFFINE:
+            a, b = _AFFINE[op](c)
+            if affine[p] is not None:
+                source, a0, b0 = affine[p]
+                combined = _affine_node(a * a0, a * b0 + b)
+                if combined is not None:
+                    p, (a, b) = source, (a * a0, a * b0 + b)
+                    op, d1, c = combined
+            if a == 1.0 and b == 0.0:
+                rep[i] = p
+                stats['identities'] += 1
+                continue
+            affine[i] = (p, a, b)
+        elif op == _POWC and c == 1.0:
+            rep[i] = p
+            stats['identities'] += 1
+            continue
+
+        # Common subexpression elimination
+        key = (op, min(p, q), max(p, q), c) if op in _COMMUTATIVE else (op, p, q, c)
+        if key in seen:
+            rep[i] = seen[key]
+            stats['cse'] += 1
+            continue
+        seen[key] = i
+        ops[i], constants[i] = op, c
+        parents1[i], partials1[i], parents2[i] = p, d1, q
+        partials2[i] = d2 if q >= 0 else 0.0
+
+    # Nodes the outputs or a guard depend on, and every input
+    outputs = [rep[i] for i in outputs.tolist()]
+    guards = [(op, rep[left], rep[right] if right >= 0 else -1, c, outcome)
+              for op, left, right, c, outcome in t.guards]
+    needed = [False] * n
+    for i in outputs + [i for guard in guards for i in guard[1:3] if i >= 0]:
+        needed[i] = True
+    for i in range(n - 1, -1, -1):
+        if needed[i]:
+            for p in (parents1[i], parents2[i]):
+                if p >= 0:
+                    needed[p] = True
+        elif parents1[i] < 0 and not is_constant[i]:
+            needed[i] = True
+
+    kept = np.flatnonzero(np.array(needed) & (np.array(rep) == np.arange(n)))
+    # New ids of the kept nodes, with an extra -1 at the end for missing parents
+    new = np.full(n + 1, -1, dtype=np.int32)
+    new[kept] = np.arange(len(kept))
+    parents = np.stack([new[np.array(parents1)[kept]], new[np.array(parents2)[kept]]], axis=1)
+    partials = np.stack([np.array(partials1)[kept], np.array(partials2)[kept]], axis=1)
+    names = {int(new[i]): name for i, name in t.names.items() if i < n and new[i] >= 0}
+    optimized = Tape.from_arrays(t.values[kept], parents, partials, np.array(ops, dtype=np.int16)[kept],
+                                 np.array(constants)[kept], names)
+    new = new.tolist()
+    optimized.guards = [(op, new[left], new[right], c, outcome) for op, left, right, c, outcome in guards]
+    stats['after'] = len(optimized)
+    stats['removed'] = n - len(optimized)
+    stats['dead'] = stats['removed'] - stats['cse'] - stats['identities']
+    return optimized, np.array([new[i] for i in outputs], dtype=np.intp), stats
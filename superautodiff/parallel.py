@@ -0,0 +1,180 @@
+import math
+import os
+import numpy as np
+from superautodiff.autodiff import AutoDiffVector, VariableRegistry
+from superautodiff.sparse import _derivatives
+
+
+def _jacobians(f, X):
+    """Yields the Jacobian matrix of f at each row of X
+
+    f is called on an AutoDiffVector object seeded with the identity matrix; the
+    variables and the registry are shared by all rows.
+    """
+    n = X.shape[1]
+    names = ['x[{}]'.format(j) for j in range(n)]
+    registry = VariableRegistry()
+    for name in names:
+        registry.slot(name)
+    seed = np.eye(n)
+    for x in X:
+        inputs = AutoDiffVector._make(names, x.copy(), seed.copy(), registry)
+        yield _derivatives(f(inputs), names)
+
+
+# Largest number of tangent directions column_jacobian evaluates f with at once
+COLUMN_BLOCK = 512
+
+# Function and output array of the worker processes, set by _initialize
+_worker = {}
+
+def _initialize(f, name, shape):
+    """Stores f and attaches the shared output array in a worker process"""
+    from multiprocessing import shared_memory
+
+    # Workers share the resource tracker of the parent process, which unlinks the block
+    block = shared_memory.SharedMemory(name=name)
+    _worker['f'] = f
+    _worker['block'] = block
+    _worker['out'] = np.ndarray(shape, dtype=float, buffer=block.buf)
+
+def _evaluate(start, X):
+    """Writes the Jacobian matrices at the rows of X into the shared output from row start"""
+    out = _worker['out']
+    for k, jacobian in enumerate(_jacobians(_worker['f'], X)):
+        out[start + k] = jacobian
+    return len(X)
+
+def _evaluate_columns(x, columns):
+    """Writes the columns of the Jacobian matrix at x into the shared output"""
+    _worker['out'][:, columns] = _columns(_worker['f'], x, columns)
+    return len(columns)
+
+
+def _columns(f, x, columns):
+    """Returns the columns of the Jacobian matrix of f at x, from one evaluation seeded with those columns of the identity"""
+    n = len(x)
+    registry = VariableRegistry()
+    names = ['dx[{}]'.format(j) for j in columns]
+    for name in names:
+        registry.slot(name)
+    seed = np.zeros((n, len(columns)))
+    seed[columns, np.arange(len(columns))] = 1.0
+    inputs = AutoDiffVector._make(['x[{}]'.format(j) for j in range(n)], x.copy(), seed, registry)
+    return _derivatives(f(inputs), names)
+
+
+def _shared_map(f, shape, task, arguments, workers, first=None):
+    """Returns the array of the given shape filled by task(*args) for each args in arguments in a pool of worker processes
+
+    The array is allocated in shared memory, which the workers attach to when they
+    start, and its first row is set to first if it is given.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import shared_memory
+
+    block = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * 8))
+    try:
+        out = np.ndarray(shape, dtype=float, buffer=block.buf)
+        if first is not None:
+            out[0] = first
+        with ProcessPoolExecutor(workers, initializer=_initialize, initargs=(f, block.name, shape)) as executor:
+            futures = [executor.submit(task, *args) for args in arguments]
+            for future in futures:
+                future.result()
+        result = out.copy()
+        del out
+    finally:
+        block.close()
+        block.unlink()
+    return result
+
+
+def default_workers():
+    """Returns the number of processors the current process may run on"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def batch_jacobian(f, X, workers=None, chunksize=None):
+    """Returns the Jacobian matrices of the vector function f at each row of X, as an array of shape (points, m, n)
+
+    f takes a vector and returns a vector, as for sparse_jacobian: it is called on an
+    AutoDiffVector object with one derivative column per element of the row. The rows
+    of X are split into chunks of chunksize rows, by default about four per worker,
+    which are evaluated by a ProcessPoolExecutor of workers processes, by default one
+    per available processor. The workers write their results straight into an output
+    array in shared memory, so only the rows of X are sent to them and nothing is sent
+    back but the number of rows done.
+
+    f is passed to the workers when they start; with the default fork start method on
+    Linux it can be any function, including a lambda, while the spawn and forkserver
+    start methods need f to be importable. With workers=1 the rows are evaluated in the
+    current process.
+
+    EXAMPLES
+    ========
+    >>> f = lambda v: v * v[0]
+    >>> batch_jacobian(f, [[1.0, 2.0], [3.0, 1.0]], workers=1)
+    array([[[2., 0.],
+            [2., 1.]],
+    <BLANKLINE>
+           [[6., 0.],
+            [1., 3.]]])
+    """
+    X = np.asarray(X, dtype=float)
+    if X.ndim != 2:
+        raise ValueError("X must be a 2-D array with one point per row, not an array of shape {}".format(X.shape))
+    points, n = X.shape
+    workers = default_workers() if workers is None else workers
+    if workers < 1:
+        raise ValueError("workers must be at least 1, not {}".format(workers))
+    if points == 0:
+        return np.zeros((0, 0, n))
+
+    # The number of outputs is found by evaluating the first point here
+    first = next(_jacobians(f, X[:1]))
+    shape = (points, first.shape[0], n)
+    if workers == 1 or points == 1:
+        out = np.empty(shape)
+        for k, jacobian in enumerate(_jacobians(f, X[1:])):
+            out[k + 1] = jacobian
+        out[0] = first
+        return out
+
+    chunksize = chunksize or max(1, math.ceil((points - 1) / (4 * workers)))
+    chunks = [(start, X[start:start + chunksize]) for start in range(1, points, chunksize)]
+    return _shared_map(f, shape, _evaluate, chunks, workers, first)
+
+
+def column_jacobian(f, x, workers=None):
+    """Returns the Jacobian matrix of the vector function f at the point x, splitting its columns between workers
+
+    Every worker process evaluates f once on an AutoDiffVector object seeded with its
+    block of columns of the identity matrix, i.e. one tangent direction per column, and
+    writes the columns into a Jacobian matrix in shared memory. The number of outputs
+    is found first from an evaluation with no tangent directions. The blocks have at
+    most COLUMN_BLOCK columns, so the tangents of a large input fit in memory; with
+    workers=1 they are evaluated in turn in the current process. f is passed to the
+    workers as by batch_jacobian.
+
+    EXAMPLES
+    ========
+    >>> column_jacobian(lambda v: v[1:] * v[:-1], [1.0, 2.0, 3.0], workers=1)
+    array([[2., 1., 0.],
+           [0., 3., 2.]])
+    """
+    x = np.asarray(x, dtype=float).ravel()
+    n = len(x)
+    workers = default_workers() if workers is None else workers
+    if workers < 1:
+        raise ValueError("workers must be at least 1, not {}".format(workers))
+    # Blocks of at most COLUMN_BLOCK columns bound the size of the tangents of f
+    blocks = np.array_split(np.arange(n), max(min(workers, n), math.ceil(n / COLUMN_BLOCK), 1))
+    if workers == 1 or len(blocks) == 1:
+        return np.concatenate([_columns(f, x, columns) for columns in blocks], axis=1)
+    m = _columns(f, x, np.arange(0)).shape[0]
+    return _shared_map(f, (m, n), _evaluate_columns, [(x, columns) for columns in blocks], workers)
+
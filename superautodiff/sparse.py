@@ -0,0 +1,151 @@
+import numpy as np
+from superautodiff.autodiff import AutoDiff, AutoDiffVector, VariableRegistry
+from superautodiff.functions import jacobian, _scipy_sparse
+
+
+def color_columns(sparsity):
+    """Returns a colour for each column of a sparsity pattern such that columns sharing a row have different colours
+
+    Columns of the same colour are structurally orthogonal, so their derivatives can
+    be computed together from one seed direction. The columns are coloured greedily in
+    their natural order, which uses bandwidth + 1 colours for a banded pattern.
+
+    EXAMPLES
+    ========
+    >>> tridiagonal = np.eye(6) + np.eye(6, k=1) + np.eye(6, k=-1)
+    >>> color_columns(tridiagonal)
+    array([0, 1, 2, 0, 1, 2])
+    """
+    sparse = _scipy_sparse('csr')
+    rows = sparse.csr_matrix(sparsity, dtype=bool)
+    columns = rows.tocsc()
+    row_indptr, row_indices = rows.indptr.tolist(), rows.indices.tolist()
+    column_indptr, column_indices = columns.indptr.tolist(), columns.indices.tolist()
+
+    colors = [-1] * rows.shape[1]
+    # forbidden[c] == j when colour c is used by a column sharing a row with column j
+    forbidden = []
+    for j in range(rows.shape[1]):
+        for i in column_indices[column_indptr[j]:column_indptr[j + 1]]:
+            for k in row_indices[row_indptr[i]:row_indptr[i + 1]]:
+                if colors[k] >= 0:
+                    forbidden[colors[k]] = j
+        c = 0
+        while c < len(forbidden) and forbidden[c] == j:
+            c += 1
+        if c == len(forbidden):
+            forbidden.append(-1)
+        colors[j] = c
+    return np.array(colors, dtype=np.intp)
+
+
+def _as_functions(y):
+    """Returns the output of a function as an AutoDiffVector object or a list of its elements"""
+    if type(y) is AutoDiffVector:
+        return y
+    if isinstance(y, np.ndarray):
+        return list(y.ravel())
+    if isinstance(y, (list, tuple)):
+        return list(y)
+    return [y]
+
+
+def _derivatives(y, names):
+    """Returns the matrix of the derivatives of the outputs y with respect to the variables names
+
+    Outputs that are constants have rows of zeros.
+    """
+    y = _as_functions(y)
+    if type(y) is AutoDiffVector:
+        return jacobian(names, y)
+    columns = {name: j for j, name in enumerate(names)}
+    der = np.zeros((len(y), len(names)))
+    for i, function in enumerate(y):
+        for name, value in getattr(function, 'der', {}).items():
+            if name in columns:
+                der[i, columns[name]] = value
+    return der
+
+
+def jacobian_sparsity(f, x):
+    """Returns the sparsity pattern of the Jacobian matrix of f at x as a SciPy CSR matrix
+
+    f is evaluated once on a NumPy object array of AutoDiff objects, whose derivatives
+    are stored sparsely, so the cost is proportional to the number of nonzeros.
+
+    EXAMPLES
+    ========
+    >>> jacobian_sparsity(lambda x: x[1:] * x[:-1], [1.0, 2.0, 3.0]).toarray()
+    array([[ True,  True, False],
+           [False,  True,  True]])
+    """
+    x = np.asarray(x, dtype=float).ravel()
+    names = ['x[{}]'.format(j) for j in range(len(x))]
+    inputs = np.empty(len(x), dtype=object)
+    for j in range(len(x)):
+        inputs[j] = AutoDiff(names[j], x[j])
+    columns = {name: j for j, name in enumerate(names)}
+
+    outputs = _as_functions(f(inputs))
+    rows, cols = [], []
+    for i, function in enumerate(outputs):
+        for name in getattr(function, 'der', {}):
+            if name in columns:
+                rows.append(i)
+                cols.append(columns[name])
+    sparse = _scipy_sparse('csr')
+    data = np.ones(len(rows), dtype=bool)
+    return sparse.csr_matrix((data, (rows, cols)), shape=(len(outputs), len(x)))
+
+
+def sparse_jacobian(f, x, sparsity=None):
+    """Returns the Jacobian matrix of the vector function f at x as a SciPy CSR matrix
+
+    The columns of the sparsity pattern are coloured so that structurally orthogonal
+    columns share a seed direction. f is then evaluated once on an AutoDiffVector
+    object with one derivative column per colour, and the compressed derivatives are
+    scattered back into the nonzeros of the pattern. A banded Jacobian needs only
+    bandwidth + 1 colours instead of one column per variable.
+
+    f takes a vector and returns a vector; it is called on an AutoDiffVector object,
+    so it can use indexing, slicing, np.concatenate and the elementary functions. If
+    sparsity (an m x n array or SciPy sparse matrix) is not given it is detected with
+    jacobian_sparsity, which calls f on an object array of AutoDiff objects.
+
+    EXAMPLES
+    ========
+    >>> def residual(u):
+    ...     return np.concatenate([u[:1], u[:-2] - 2 * u[1:-1] + u[2:], u[-1:]])
+    >>> J = sparse_jacobian(residual, np.ones(5))
+    >>> J.toarray()
+    array([[ 1.,  0.,  0.,  0.,  0.],
+           [ 1., -2.,  1.,  0.,  0.],
+           [ 0.,  1., -2.,  1.,  0.],
+           [ 0.,  0.,  1., -2.,  1.],
+           [ 0.,  0.,  0.,  0.,  1.]])
+    """
+    sparse = _scipy_sparse('csr')
+    x = np.asarray(x, dtype=float).ravel()
+    n = len(x)
+    if sparsity is None:
+        sparsity = jacobian_sparsity(f, x)
+    pattern = sparse.csr_matrix(sparsity, dtype=bool)
+    if pattern.shape[1] != n:
+        raise ValueError("The sparsity pattern has {} columns but x has {} elements".format(pattern.shape[1], n))
+
+    # Seed matrix with a single one in the column of the colour of each variable
+    colors = color_columns(pattern)
+    registry = VariableRegistry()
+    names = ['color[{}]'.format(c) for c in range(colors.max() + 1 if n else 0)]
+    for name in names:
+        registry.slot(name)
+    seed = np.zeros((n, len(names)))
+    seed[np.arange(n), colors] = 1.0
+    inputs = AutoDiffVector._make(['x[{}]'.format(j) for j in range(n)], x.copy(), seed, registry)
+
+    compressed = _derivatives(f(inputs), names)
+    if compressed.shape[0] != pattern.shape[0]:
+        raise ValueError("The sparsity pattern has {} rows but f returned {} elements".format(pattern.shape[0], compressed.shape[0]))
+
+    rows, cols = pattern.nonzero()
+    return sparse.csr_matrix((compressed[rows, colors[cols]], (rows, cols)), shape=pattern.shape)
@@ -0,0 +1,664 @@
+import os
+import struct
+import weakref
+import numpy as np
+
+TABLE_COLUMNS = ['Node', 'd1', 'd1value', 'd2', 'd2value']
+
+# Version of the files written by Tape.save; load_tape reads this version and older ones
+TAPE_FORMAT_VERSION = 1
+
+# Operations recorded on tapes; the position of a name in OPS is its op code. Names
+# ending in c combine a node with the constant recorded next to it, e.g. subc is
+# x - c and rsubc is c - x. Elementary functions are added by op_code.
+OPS = ['leaf', 'custom', 'add', 'sub', 'mul', 'div', 'addc', 'subc', 'rsubc', 'mulc', 'divc', 'rdivc',
+       'powc', 'rpowc']
+OP_CODES = {name: i for i, name in enumerate(OPS)}
+
+
+def op_code(name):
+    """Returns the op code of the operation name, adding it to OPS if it is new"""
+    try:
+        return OP_CODES[name]
+    except KeyError:
+        OPS.append(name)
+        OP_CODES[name] = len(OPS) - 1
+        return OP_CODES[name]
+
+
+class Tape():
+    """Records the nodes of a reverse mode computation in growable arrays
+
+    Every node gets an integer id (its position on the tape) and stores at most two
+    parent ids together with the local partial derivatives with respect to them, and
+    the op code and constant of the operation that produced it.
+    Appending doubles the capacity of the arrays when they are full, so recording
+    N nodes costs amortised O(N).
+
+    ATTRIBUTES
+    ==========
+    parents : (n, 2) array of parent ids, -1 where a node has fewer than two parents
+    partials : (n, 2) array of the local partial derivatives with respect to the parents
+    values : (n,) array of the node values
+    ops : (n,) array of the op codes of the nodes, indexing OPS
+    constants : (n,) array of the constants of the operations, 0 where there is none
+    guards : list of the comparisons made on nodes, as tuples (op, left id, right id or -1,
+             right constant, outcome)
+    tracing : whether comparisons are recorded as guards, which is only the case while
+              a function is traced to be compiled
+    checkpoints : dictionary mapping the first id of the outputs of each checkpoint to
+                  the tuple (end id, input ids, backward); see record_checkpoint
+    names : dictionary mapping the ids of named nodes to their names
+
+    EXAMPLES
+    ========
+    >>> t = Tape()
+    >>> x = t.record(4.0, name='x')
+    >>> y = t.record(8.0, x, 2.0)
+    >>> len(t)
+    2
+    >>> t.parents[y]
+    array([ 0, -1], dtype=int32)
+    >>> t.name(y)
+    'y2'
+    """
+
+    def __init__(self, capacity=64):
+        self._n = 0
+        self._parents = np.full((capacity, 2), -1, dtype=np.int32)
+        self._partials = np.zeros((capacity, 2))
+        self._values = np.zeros(capacity)
+        self._ops = np.zeros(capacity, dtype=np.int16)
+        self._constants = np.zeros(capacity)
+        self.guards = []
+        self.tracing = False
+        self.checkpoints = {}
+        self.names = {}
+        self._ids = {}
+
+    @classmethod
+    def from_arrays(cls, values, parents, partials, ops=None, constants=None, names=None):
+        """Returns a tape holding the nodes given by the arrays of their attributes
+
+        EXAMPLES
+        ========
+        >>> t = Tape.from_arrays([4.0, 8.0], [[-1, -1], [0, -1]], [[0.0, 0.0], [2.0, 0.0]], names={0: 'x'})
+        >>> t.sweep(1)
+        array([2., 1.])
+        """
+        values = np.asarray(values, dtype=float)
+        n = len(values)
+        t = cls(capacity=max(n, 1))
+        t._values[:n] = values
+        t._parents[:n] = parents
+        t._partials[:n] = partials
+        if ops is not None:
+            t._ops[:n] = ops
+        if constants is not None:
+            t._constants[:n] = constants
+        t._n = n
+        for i, name in (names or {}).items():
+            t.names[i] = name
+            t._ids[name] = i
+        return t
+
+    def __len__(self):
+        return self._n
+
+    @property
+    def parents(self):
+        return self._parents[:self._n]
+
+    @property
+    def partials(self):
+        return self._partials[:self._n]
+
+    @property
+    def values(self):
+        return self._values[:self._n]
+
+    @property
+    def ops(self):
+        return self._ops[:self._n]
+
+    @property
+    def constants(self):
+        return self._constants[:self._n]
+
+    def _grow(self):
+        """Doubles the capacity of the tape arrays"""
+        capacity = max(2 * len(self._values), 64)
+        parents = np.full((capacity, 2), -1, dtype=np.int32)
+        partials = np.zeros((capacity, 2))
+        values = np.zeros(capacity)
+        ops = np.zeros(capacity, dtype=np.int16)
+        constants = np.zeros(capacity)
+        parents[:self._n] = self._parents[:self._n]
+        partials[:self._n] = self._partials[:self._n]
+        values[:self._n] = self._values[:self._n]
+        ops[:self._n] = self._ops[:self._n]
+        constants[:self._n] = self._constants[:self._n]
+        self._parents, self._partials, self._values = parents, partials, values
+        self._ops, self._constants = ops, constants
+
+    def record(self, val, p1=-1, d1=0.0, p2=-1, d2=0.0, name=None, op=0, c=0.0):
+        """Appends a node to the tape and returns its id"""
+        i = self._n
+        if i == len(self._values):
+            self._grow()
+        self._values[i] = val
+        if op:
+            self._ops[i] = op
+            self._constants[i] = c
+        if p1 >= 0:
+            self._parents[i, 0] = p1
+            self._partials[i, 0] = d1
+            if p2 >= 0:
+                self._parents[i, 1] = p2
+                self._partials[i, 1] = d2
+        if name is not None:
+            self.names[i] = name
+            self._ids[name] = i
+        self._n = i + 1
+        return i
+
+    def record_leaves(self, values, op=0):
+        """Appends one node without parents per value and returns the id of the first one"""
+        values = np.asarray(values, dtype=float).ravel()
+        i, n = self._n, len(values)
+        while i + n > len(self._values):
+            self._grow()
+        self._values[i:i + n] = values
+        if op:
+            self._ops[i:i + n] = op
+        self._n = i + n
+        return i
+
+    def record_checkpoint(self, values, inputs, backward):
+        """Appends the outputs of a checkpointed computation of the nodes inputs and returns the id of the first one
+
+        The outputs are recorded as nodes without parents, so nothing of the computation
+        itself is kept on the tape. When a sweep reaches them, backward is called with
+        the array of their adjoints and returns the adjoints of the inputs, typically by
+        recording the computation again on a tape of its own. Inputs with id -1 are
+        constants and get no adjoint.
+        """
+        first = self.record_leaves(values, op_code('checkpoint'))
+        self.checkpoints[first] = (self._n, np.asarray(inputs, dtype=np.intp), backward)
+        return first
+
+    def name(self, i):
+        """Returns the name of node i; unnamed nodes are called 'y' + str(i + 1)"""
+        try:
+            return self.names[i]
+        except KeyError:
+            return 'y' + str(i + 1)
+
+    def lookup(self, name):
+        """Returns the id of the node with the given name"""
+        try:
+            return self._ids[name]
+        except KeyError:
+            if name[:1] == 'y' and name[1:].isdigit() and 0 < int(name[1:]) <= self._n:
+                return int(name[1:]) - 1
+            raise KeyError("No node named {} on the tape".format(name))
+
+    def edges(self, i):
+        """Returns the parent ids and the partial derivatives of node i, as lists of two"""
+        return self._parents[i].tolist(), self._partials[i].tolist()
+
+    def span(self, outputs):
+        """Returns the number of first nodes holding the nodes outputs and the operands of every guard
+
+        Comparisons can be made on nodes recorded after the outputs, e.g. on a branch
+        that is not taken, so a program computing the outputs has to reach them too.
+        """
+        ids = [int(i) for i in outputs] + [i for guard in self.guards for i in guard[1:3]]
+        return max(ids, default=-1) + 1
+
+    def sweep(self, outputs, seeds=1.0):
+        """Returns the adjoint of every node given the seed adjoints of the output nodes
+
+        The nodes are visited once in reverse order of recording, which is a reverse
+        topological order, so the cost is O(nodes + edges).
+        """
+        outputs = np.atleast_1d(np.asarray(outputs, dtype=np.int64))
+        n = int(outputs.max()) + 1
+        adjoints = np.zeros(n)
+        np.add.at(adjoints, outputs, np.broadcast_to(seeds, outputs.shape))
+        # Flat lists are much cheaper to build and index than nested (n, 2) lists
+        parents1, parents2 = self._parents[:n, 0].tolist(), self._parents[:n, 1].tolist()
+        partials1, partials2 = self._partials[:n, 0].tolist(), self._partials[:n, 1].tolist()
+        adj = adjoints.tolist()
+        # The nodes between checkpoints are swept by the plain loop
+        stop = n
+        for first in sorted({i for i in self.checkpoints if i < n} | {0}, reverse=True):
+            for i in range(stop - 1, first - 1, -1):
+                a = adj[i]
+                if a:
+                    p = parents1[i]
+                    if p >= 0:
+                        adj[p] += a * partials1[i]
+                        p = parents2[i]
+                        if p >= 0:
+                            adj[p] += a * partials2[i]
+            if first in self.checkpoints:
+                end, inputs, backward = self.checkpoints[first]
+                # Outputs after the last swept node have no adjoint
+                outputs = np.zeros(end - first)
+                outputs[:min(end, n) - first] = adj[first:end]
+                if outputs.any():
+                    for p, a in zip(inputs.tolist(), backward(outputs).tolist()):
+                        if p >= 0:
+                            adj[p] += a
+            stop = first
+        return np.array(adj)
+
+    def leaves(self, n=None):
+        """Returns the ids of the named leaf nodes among the first n nodes, in order of recording"""
+        n = self._n if n is None else n
+        return [i for i in sorted(self.names) if i < n and self._parents[i, 0] < 0]
+
+    def clear(self):
+        """Removes every node from the tape"""
+        self._n = 0
+        self._parents[:] = -1
+        self._partials[:] = 0.0
+        self._ops[:] = 0
+        self._constants[:] = 0.0
+        self.guards = []
+        self.checkpoints = {}
+        self.names = {}
+        self._ids = {}
+
+    def release(self):
+        """Removes every node from the tape and frees its arrays"""
+        self._n = 0
+        self._parents = np.full((0, 2), -1, dtype=np.int32)
+        self._partials = np.zeros((0, 2))
+        self._values = np.zeros(0)
+        self._ops = np.zeros(0, dtype=np.int16)
+        self._constants = np.zeros(0)
+        self.guards = []
+        self.checkpoints = {}
+        self.names = {}
+        self._ids = {}
+
+    def save(self, path):
+        """Writes the tape to path as an uncompressed npz file, which load_tape maps back
+
+        The file holds the arrays of the node attributes, the names of the op codes, so
+        they can be renumbered by a process that assigned them in another order, the
+        named nodes, the guards and the format version. Checkpoints refer to functions
+        of the current process and cannot be saved.
+        """
+        if self.checkpoints:
+            raise ValueError("Tapes with checkpointed computations cannot be saved")
+        ids = sorted(self.names)
+        guards = self.guards
+        # Saving to a file object keeps numpy from adding an .npz extension to path
+        with open(path, 'wb') as f:
+            np.savez(f, version=np.array(TAPE_FORMAT_VERSION), op_names=np.array(OPS),
+                     parents=self.parents, partials=self.partials, values=self.values,
+                     ops=self.ops, constants=self.constants,
+                     name_ids=np.array(ids, dtype=np.int64), names=np.array([self.names[i] for i in ids], dtype=str),
+                     guard_ops=np.array([g[0] for g in guards], dtype=str),
+                     guard_ids=np.array([g[1:3] for g in guards], dtype=np.int64).reshape(-1, 2),
+                     guard_constants=np.array([g[3] for g in guards], dtype=float),
+                     guard_outcomes=np.array([g[4] for g in guards], dtype=bool))
+
+    def table(self):
+        """Returns the forward pass as a pandas DataFrame with one row per node
+
+        pandas is only imported here, so it is needed for tables but not for the rest of
+        the package.
+        """
+        try:
+            import pandas as pd
+        except ImportError:
+            raise ImportError("pass_table() and Tape.table() require pandas")
+
+        rows = []
+        parents = self.parents.tolist()
+        partials = self.partials.tolist()
+        for i in range(self._n):
+            node = self.name(i)
+            (p1, p2), (d1, d2) = parents[i], partials[i]
+            if p1 < 0:
+                rows.append([node, node, 1, '-', '-'])
+            elif p2 < 0:
+                rows.append([node, self.name(p1), d1, '-', '-'])
+            else:
+                rows.append([node, self.name(p1), d1, self.name(p2), d2])
+        return pd.DataFrame(rows, columns=TABLE_COLUMNS)
+
+
+# Layout of the node records in the segment files of a MappedTape
+NODE = np.dtype([('parent1', '<i4'), ('parent2', '<i4'), ('partial1', '<f8'), ('partial2', '<f8'),
+                 ('value', '<f8'), ('op', '<i2'), ('constant', '<f8')])
+
+
+def _remove(paths, directory=None):
+    """Removes the files at paths, then the directory if it is given"""
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    del paths[:]
+    if directory is not None:
+        import shutil
+
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+class MappedTape(Tape):
+    """A Tape that spills its nodes to segment files, for graphs larger than memory
+
+    Nodes are recorded in memory as on a Tape until segment_size of them are held; they
+    are then written sequentially as node records (see NODE) to a new segment file in
+    directory, and recording starts over in the same arrays. The reverse sweep reads
+    the segments back one at a time from the last and keeps the adjoints in a
+    memory-mapped file, so the memory used is about that of one segment whatever the
+    number of nodes. The attributes parents, partials, values, ops and constants read
+    every segment and so hold the whole tape in memory; edges reads a single node.
+
+    directory defaults to a new temporary directory. The files are removed by clear and
+    release, and when the tape is garbage collected.
+
+    ATTRIBUTES
+    ==========
+    directory : directory of the segment files
+    segment_size : number of nodes per segment file
+    segments : number of segment files written
+
+    EXAMPLES
+    ========
+    >>> t = MappedTape(segment_size=2)
+    >>> y = t.record(3.0, name='x')
+    >>> for k in range(4):
+    ...     y = t.record(3.0 ** (k + 2), y, 3.0)
+    >>> len(t), t.segments
+    (5, 2)
+    >>> t.sweep(y)
+    array([81., 27.,  9.,  3.,  1.])
+    >>> t.release()
+    """
+
+    def __init__(self, directory=None, segment_size=2 ** 18):
+        super().__init__(capacity=segment_size)
+        self.segment_size = segment_size
+        self._files = []
+        if directory is None:
+            import tempfile
+
+            directory = tempfile.mkdtemp(prefix='superautodiff-')
+            weakref.finalize(self, _remove, self._files, directory)
+        else:
+            os.makedirs(directory, exist_ok=True)
+            weakref.finalize(self, _remove, self._files)
+        self.directory = directory
+        self.segments = 0
+        self._offset = 0
+        self._prefix = 'tape-{}-{:x}'.format(os.getpid(), id(self))
+
+    def _grow(self):
+        """Spills the full arrays to a new segment file, or allocates them after release"""
+        if len(self._values) < self.segment_size:
+            self._parents = np.full((self.segment_size, 2), -1, dtype=np.int32)
+            self._partials = np.zeros((self.segment_size, 2))
+            self._values = np.zeros(self.segment_size)
+            self._ops = np.zeros(self.segment_size, dtype=np.int16)
+            self._constants = np.zeros(self.segment_size)
+            return
+        path = os.path.join(self.directory, '{}-{:06d}.nodes'.format(self._prefix, self.segments))
+        self._files.append(path)
+        self._memory_records(0, self.segment_size).tofile(path)
+        self.segments += 1
+        self._offset += self.segment_size
+        self._parents[:] = -1
+        self._partials[:] = 0.0
+        self._ops[:] = 0
+        self._constants[:] = 0.0
+
+    def record(self, val, p1=-1, d1=0.0, p2=-1, d2=0.0, name=None, op=0, c=0.0):
+        """Appends a node to the tape and returns its id"""
+        k = self._n - self._offset
+        if k == len(self._values):
+            self._grow()
+            k = self._n - self._offset
+        self._values[k] = val
+        if op:
+            self._ops[k] = op
+            self._constants[k] = c
+        if p1 >= 0:
+            self._parents[k, 0] = p1
+            self._partials[k, 0] = d1
+            if p2 >= 0:
+                self._parents[k, 1] = p2
+                self._partials[k, 1] = d2
+        i = self._n
+        if name is not None:
+            self.names[i] = name
+            self._ids[name] = i
+        self._n = i + 1
+        return i
+
+    def record_leaves(self, values, op=0):
+        """Appends one node without parents per value and returns the id of the first one"""
+        values = np.asarray(values, dtype=float).ravel()
+        first, done = self._n, 0
+        while done < len(values):
+            k = self._n - self._offset
+            if k == len(self._values):
+                self._grow()
+                k = self._n - self._offset
+            m = min(len(values) - done, len(self._values) - k)
+            self._values[k:k + m] = values[done:done + m]
+            if op:
+                self._ops[k:k + m] = op
+            self._n += m
+            done += m
+        return first
+
+    def _memory_records(self, start, stop):
+        """Returns the node records of the positions start to stop of the arrays in memory"""
+        records = np.empty(stop - start, dtype=NODE)
+        records['parent1'], records['parent2'] = self._parents[start:stop, 0], self._parents[start:stop, 1]
+        records['partial1'], records['partial2'] = self._partials[start:stop, 0], self._partials[start:stop, 1]
+        records['value'] = self._values[start:stop]
+        records['op'] = self._ops[start:stop]
+        records['constant'] = self._constants[start:stop]
+        return records
+
+    def _records(self, start, stop):
+        """Returns the node records of the nodes start to stop, which are in a single segment"""
+        k = start // self.segment_size
+        if k == self.segments:
+            return self._memory_records(start - self._offset, stop - self._offset)
+        return np.fromfile(self._files[k], dtype=NODE, count=stop - start,
+                           offset=(start - k * self.segment_size) * NODE.itemsize)
+
+    def edges(self, i):
+        """Returns the parent ids and the partial derivatives of node i, reading only its record"""
+        record = self._records(i, i + 1)[0]
+        return [int(record['parent1']), int(record['parent2'])], [float(record['partial1']), float(record['partial2'])]
+
+    def _all_records(self):
+        """Returns the node records of the whole tape"""
+        segments = [np.fromfile(path, dtype=NODE) for path in self._files]
+        return np.concatenate(segments + [self._memory_records(0, self._n - self._offset)])
+
+    @property
+    def parents(self):
+        records = self._all_records()
+        return np.stack([records['parent1'], records['parent2']], axis=1)
+
+    @property
+    def partials(self):
+        records = self._all_records()
+        return np.stack([records['partial1'], records['partial2']], axis=1)
+
+    @property
+    def values(self):
+        return self._all_records()['value']
+
+    @property
+    def ops(self):
+        return self._all_records()['op']
+
+    @property
+    def constants(self):
+        return self._all_records()['constant']
+
+    def _adjoints(self, n):
+        """Returns a zero array of n adjoints, memory-mapped when they do not fit in a segment"""
+        if n <= self.segment_size:
+            return np.zeros(n)
+        import tempfile
+
+        fd, path = tempfile.mkstemp(prefix=self._prefix + '-', suffix='.adjoints', dir=self.directory)
+        os.close(fd)
+        adjoints = np.memmap(path, dtype=float, mode='w+', shape=(n,))
+        # The mapping stays valid once the file is unlinked, where that is allowed
+        try:
+            os.remove(path)
+        except OSError:
+            self._files.append(path)
+        return adjoints
+
+    def sweep(self, outputs, seeds=1.0):
+        """Returns the adjoint of every node given the seed adjoints of the output nodes
+
+        The segments are read back one at a time in reverse order. Adjoints propagated to
+        parents in earlier segments are collected and added once the segment is done.
+        """
+        outputs = np.atleast_1d(np.asarray(outputs, dtype=np.int64))
+        n = int(outputs.max()) + 1
+        adjoints = self._adjoints(n)
+        np.add.at(adjoints, outputs, np.broadcast_to(seeds, outputs.shape))
+        starts = set(range(0, n, self.segment_size)) | {i for i in self.checkpoints if i < n}
+        stop = n
+        for start in sorted(starts, reverse=True):
+            records = self._records(start, stop)
+            parents1, parents2 = records['parent1'].tolist(), records['parent2'].tolist()
+            partials1, partials2 = records['partial1'].tolist(), records['partial2'].tolist()
+            adj = adjoints[start:stop].tolist()
+            earlier, contributions = [], []
+            for k in range(stop - start - 1, -1, -1):
+                a = adj[k]
+                if a:
+                    p = parents1[k]
+                    if p >= 0:
+                        if p >= start:
+                            adj[p - start] += a * partials1[k]
+                        else:
+                            earlier.append(p)
+                            contributions.append(a * partials1[k])
+                        p = parents2[k]
+                        if p >= start:
+                            adj[p - start] += a * partials2[k]
+                        elif p >= 0:
+                            earlier.append(p)
+                            contributions.append(a * partials2[k])
+            adjoints[start:stop] = adj
+            if earlier:
+                np.add.at(adjoints, earlier, contributions)
+            if start in self.checkpoints:
+                end, inputs, backward = self.checkpoints[start]
+                outputs = np.zeros(end - start)
+                outputs[:min(end, n) - start] = adjoints[start:min(end, n)]
+                if outputs.any():
+                    constant = inputs < 0
+                    np.add.at(adjoints, inputs[~constant], backward(outputs)[~constant])
+            stop = start
+        return np.asarray(adjoints)
+
+    def leaves(self, n=None):
+        """Returns the ids of the named leaf nodes among the first n nodes, in order of recording"""
+        n = self._n if n is None else n
+        return [i for i in sorted(self.names) if i < n and self._records(i, i + 1)['parent1'][0] < 0]
+
+    def clear(self):
+        """Removes every node from the tape and its segment files"""
+        super().clear()
+        _remove(self._files)
+        self.segments = 0
+        self._offset = 0
+
+    def release(self):
+        """Removes every node from the tape, frees its arrays and removes its segment files"""
+        super().release()
+        _remove(self._files)
+        self.segments = 0
+        self._offset = 0
+
+
+def _npz_arrays(path):
+    """Returns the arrays of the npz file at path, memory-mapped copy-on-write where they are stored uncompressed"""
+    import zipfile
+
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as f:
+        for info in archive.infolist():
+            name = info.filename[:-4] if info.filename.endswith('.npy') else info.filename
+            if info.compress_type != zipfile.ZIP_STORED:
+                with archive.open(info) as member:
+                    arrays[name] = np.lib.format.read_array(member)
+                continue
+            # The array follows the local file header and the .npy header
+            f.seek(info.header_offset + 26)
+            name_length, extra_length = struct.unpack('<HH', f.read(4))
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            read_header = getattr(np.lib.format, 'read_array_header_{}_{}'.format(*version))
+            shape, fortran_order, dtype = read_header(f)
+            if dtype.hasobject or np.prod(shape) == 0:
+                f.seek(info.header_offset + 30 + name_length + extra_length)
+                arrays[name] = np.lib.format.read_array(f)
+            else:
+                arrays[name] = np.memmap(path, dtype=dtype, mode='c', offset=f.tell(), shape=shape,
+                                         order='F' if fortran_order else 'C')
+    return arrays
+
+
+def load_tape(path):
+    """Returns the tape saved to path by Tape.save
+
+    The node arrays are memory-mapped copy-on-write rather than read, so loading takes
+    about the same time for any number of nodes, and the pages are only read from disk
+    when the tape is used. Recording new nodes on the tape copies the arrays into memory
+    first; nothing is ever written back to the file.
+
+    EXAMPLES
+    ========
+    >>> import os, tempfile
+    >>> t = Tape()
+    >>> x = t.record(3.0, name='x')
+    >>> y = t.record(9.0, x, 6.0, op=OP_CODES['powc'], c=2.0)
+    >>> path = os.path.join(tempfile.mkdtemp(), 'tape.npz')
+    >>> t.save(path)
+    >>> loaded = load_tape(path)
+    >>> len(loaded), loaded.name(0), OPS[loaded.ops[1]], loaded.sweep(1)
+    (2, 'x', 'powc', array([6., 1.]))
+    """
+    arrays = _npz_arrays(path)
+    version = int(arrays['version'])
+    if version > TAPE_FORMAT_VERSION:
+        raise ValueError("{} was saved in tape format version {}, newer than version {}".format(
+            path, version, TAPE_FORMAT_VERSION))
+    t = Tape(capacity=0)
+    t._parents, t._partials, t._values = arrays['parents'], arrays['partials'], arrays['values']
+    t._constants = arrays['constants']
+    # Op codes are assigned in order of use, so they are renumbered where they differ
+    codes = np.array([op_code(name) for name in arrays['op_names'].tolist()], dtype=np.int16)
+    ops = arrays['ops']
+    t._ops = ops if np.array_equal(codes, np.arange(len(codes))) else codes[ops]
+    t._n = len(t._values)
+    for i, name in zip(arrays['name_ids'].tolist(), arrays['names'].tolist()):
+        t.names[i] = name
+        t._ids[name] = i
+    t.guards = [(op, left, right, c, outcome) for op, (left, right), c, outcome in zip(
+        arrays['guard_ops'].tolist(), arrays['guard_ids'].tolist(), arrays['guard_constants'].tolist(),
+        arrays['guard_outcomes'].tolist())]
+    return t
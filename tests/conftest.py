@@ -0,0 +1,24 @@
+import sys
+import numpy as np
+import pytest
+
+sys.path.append('..')
+import superautodiff as sad
+
+# Scalar functions of three inputs covering every operation and elementary function,
+# shared by the tests comparing compiled, generated and second order derivatives with
+# reverse mode
+FUNCTIONS = [
+    lambda x: np.sum(sad.sin(x) * x ** 2) + np.dot(x[1:], x[:-1]),
+    lambda x: sad.exp(x[0] / x[1]) + sad.log(x[2] ** 3, 10) + 2 ** x[0] + 1 / x[1] + sad.tanh(x[2]) * sad.arctan(x[0]),
+    lambda x: sad.sqrt(x[0] * x[1]) + sad.logistic(x[2] - x[0]) - 3 * (x[1] - 2) / 4 + (1 - x[2]) * (x[0] + x[0]),
+    lambda x: (x[0] - x[1]) * (x[0] - x[1]) + sad.cosh(x[2]) * sad.AutoDiffReverse(2.0),
+    lambda x: sad.cosh(x[2]) * sad.AutoDiffReverse(2.0) + sad.arcsin(x[0] / 4) * sad.arccos(x[1] / 4) + sad.tan(x[2]),
+    lambda x: sad.sqrt(x[0] * x[1]) + sad.logistic(x[2] - x[0]) + sad.cosh(x[1]) - sad.arcsin(x[0] / 3)
+              + sad.arccos(x[2] / 4) + sad.tan(x[1]) + sad.sinh(x[0]) * sad.cos(x[2]) - sad.log(x[1]),
+]
+
+@pytest.fixture(params=range(len(FUNCTIONS)))
+def f(request):
+    """Each of FUNCTIONS, or the one whose index is given by indirect parametrization"""
+    return FUNCTIONS[request.param]
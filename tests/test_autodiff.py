@@ -170,15 +170,18 @@ def test_sub_str():
         x1 = sad.AutoDiff('x', 2)
         f = x1 - '2'
 
-# f(x) = 1 - x; f(2) = 1; f'(x) = 1; f'(2) = 1
+# f(x) = 1 - x; f(2) = -1; f'(x) = -1; f'(2) = -1
 def test_rsub_constant():
     x1 = sad.AutoDiff('x', 2)
     f = 1 - x1
-    assert f.der['x'] == pytest.approx(1.0)
+    assert f.der['x'] == pytest.approx(-1.0)
     #Test other attributes
     assert next(iter(f.der)) == 'x'
     #assert f.var == 'x - 1'
-    assert f.val == 1.0
+    assert f.val == -1.0
+    g = np.subtract(1, sad.AutoDiff('x', .5))
+    assert g.val == 0.5
+    assert g.der['x'] == -1.0
 
 # f(x) = x - x; f(2) = 0; f'(x) = 0; f'(2) = 0
 def test_sub_autodiff_self():
@@ -450,7 +453,7 @@ def test_sinh():
 def test_cosh():
     x1 = sad.AutoDiff('x', 0.5)
     f = sad.cosh(x1)
-    assert f.der['x'] == pytest.approx(-np.sinh(0.5))
+    assert f.der['x'] == pytest.approx(np.sinh(0.5))
     #Test other attributes
     assert next(iter(f.der)) == 'x'
     assert f.var == 'x'
@@ -579,6 +582,369 @@ def test_jacobian():
     with pytest.raises(ValueError):
         sad.jacobian('incorrect', 'input')
 
+def test_jacobian_formats():
+    g = sad.AutoDiff('g', 3)
+    h = sad.AutoDiff('h', -4)
+    functions = [g + 4, h**2 + 2*h - 12, g * h]
+    variables = ['g', 'h', 'i']
+    test = np.array([[1., 0., 0.], [0., -6., 0.], [-4., 3., 0.]])
+
+    csr = sad.jacobian(variables, functions, format='csr')
+    assert csr.format == 'csr'
+    assert csr.nnz == 4
+    assert csr.toarray() == pytest.approx(test)
+    coo = sad.jacobian(variables, functions, format='coo')
+    assert coo.format == 'coo'
+    assert coo.toarray() == pytest.approx(test)
+    assert sad.jacobian(variables, sad.AutoDiffVector(functions[:2]), format='csr').toarray() == pytest.approx(test[:2])
+
+    out = np.full((3, 3), np.nan)
+    assert sad.jacobian(variables, functions, out=out) is out
+    assert out == pytest.approx(test)
+    out = np.full((2, 3), np.nan)
+    assert sad.jacobian(variables, sad.AutoDiffVector(functions[:2]), out=out) is out
+    assert out == pytest.approx(test[:2])
+
+    # A variable listed twice fills both of its columns
+    assert sad.jacobian(['h', 'h'], functions)[:, 1] == pytest.approx([0., -6., 3.])
+
+def test_jacobian_errors():
+    g = sad.AutoDiff('g', 3)
+    with pytest.raises(ValueError, match='format'):
+        sad.jacobian(['g'], [g], format='dok')
+    with pytest.raises(ValueError, match='out'):
+        sad.jacobian(['g'], [g], format='csr', out=np.zeros((1, 1)))
+    with pytest.raises(ValueError, match='shape'):
+        sad.jacobian(['g'], [g], out=np.zeros((2, 1)))
+    with pytest.raises(ValueError, match='empty'):
+        sad.jacobian(['g'], [])
+    with pytest.raises(ValueError, match='Element 1'):
+        sad.jacobian(['g'], [g, 2.0])
+    with pytest.raises(ValueError, match='string'):
+        sad.jacobian('g', [g])
+
     
     
 
+
+
+#### Batched forward mode
+
+def test_batch_init():
+    x = sad.AutoDiffBatch('x', [1, 2, 3])
+    assert isinstance(x.val, np.ndarray)
+    assert x.val.shape == (3,)
+    assert x.der['x'].tolist() == [1.0, 1.0, 1.0]
+    with pytest.raises(ValueError):
+        sad.AutoDiffBatch(1, [1, 2])
+    with pytest.raises(ValueError):
+        sad.AutoDiffBatch('x', [[1, 2]])
+
+def test_batch_operations():
+    points = [0.5, 1.5, 2.5]
+    x = sad.AutoDiffBatch('x', points)
+    y = sad.AutoDiffBatch('y', [2.0, 3.0, 4.0])
+    f = (x * y + 3 * x - y / x) ** 2 - 2 ** x + 1 / y
+    for i, p in enumerate(points):
+        xs = sad.AutoDiff('x', p)
+        ys = sad.AutoDiff('y', [2.0, 3.0, 4.0][i])
+        fs = (xs * ys + 3 * xs - ys / xs) ** 2 - 2 ** xs + 1 / ys
+        assert f.val[i] == pytest.approx(fs.val)
+        assert f.der['x'][i] == pytest.approx(fs.der['x'])
+        assert f.der['y'][i] == pytest.approx(fs.der['y'])
+
+def test_batch_functions():
+    points = [0.1, 0.4, 0.7]
+    x = sad.AutoDiffBatch('x', points)
+    for function in [sad.sin, sad.cos, sad.tan, sad.arcsin, sad.arccos, sad.arctan,
+                     sad.exp, sad.log, sad.sinh, sad.cosh, sad.tanh, sad.sqrt, sad.logistic]:
+        f = function(x)
+        for i, p in enumerate(points):
+            fs = function(sad.AutoDiff('x', p))
+            assert f.val[i] == pytest.approx(fs.val)
+            assert f.der['x'][i] == pytest.approx(fs.der['x'])
+    f = sad.log(x, base=10)
+    assert f.der['x'] == pytest.approx(1 / (np.array(points) * math.log(10)))
+
+def test_batch_array_operands():
+    x = sad.AutoDiffBatch('x', [1.0, 2.0])
+    f = np.array([3.0, 4.0]) * x
+    assert isinstance(f, sad.AutoDiffBatch)
+    assert f.der['x'].tolist() == [3.0, 4.0]
+    assert (x < 1.5).tolist() == [True, False]
+
+
+#### Dense forward mode
+
+def test_registry():
+    r = sad.VariableRegistry()
+    assert r.slot('x') == 0
+    assert r.slot('y') == 1
+    assert r.slot('x') == 0
+    assert r.names == ['x', 'y']
+
+def test_dense_operations():
+    r = sad.VariableRegistry()
+    x = sad.AutoDiffDense('x', 0.5, registry=r)
+    y = sad.AutoDiffDense('y', 2.0, registry=r)
+    f = (x * y + 3 * x - y / x) ** 2 - 2 ** x + 1 / y
+    xs = sad.AutoDiff('x', 0.5)
+    ys = sad.AutoDiff('y', 2.0)
+    fs = (xs * ys + 3 * xs - ys / xs) ** 2 - 2 ** xs + 1 / ys
+    assert f.val == pytest.approx(fs.val)
+    assert f.tangent == pytest.approx([fs.der['x'], fs.der['y']])
+    assert f.der['y'] == pytest.approx(fs.der['y'])
+    f = 1 - x
+    assert f.val == pytest.approx(0.5)
+    assert f.der['x'] == pytest.approx(-1.0)
+    assert f.der['y'] == 0
+
+def test_dense_registry_grows():
+    r = sad.VariableRegistry()
+    x = sad.AutoDiffDense('x', 2.0, registry=r)
+    y = sad.AutoDiffDense('y', 3.0, registry=r)
+    f = x * 2 + y
+    assert len(x.tangent) == 1
+    assert f.tangent.tolist() == [2.0, 1.0]
+    with pytest.raises(ValueError):
+        x + sad.AutoDiffDense('x', 2.0, registry=sad.VariableRegistry())
+
+def test_dense_functions():
+    r = sad.VariableRegistry()
+    x = sad.AutoDiffDense('x', 0.4, registry=r)
+    for function in [sad.sin, sad.cos, sad.tan, sad.arcsin, sad.arccos, sad.arctan,
+                     sad.exp, sad.log, sad.sinh, sad.cosh, sad.tanh, sad.sqrt, sad.logistic]:
+        f = function(x)
+        fs = function(sad.AutoDiff('x', 0.4))
+        assert f.val == pytest.approx(fs.val)
+        assert f.der['x'] == pytest.approx(fs.der['x'])
+
+def test_dense_jacobian():
+    r = sad.VariableRegistry()
+    g = sad.AutoDiffDense('g', 3, registry=r)
+    h = sad.AutoDiffDense('h', -4, registry=r)
+    f1 = g + 4
+    f2 = h**2 + 2*h - 12
+    jacob = sad.jacobian(['g', 'h', 'i'], [f1, f2])
+    assert jacob.tolist() == [[1.0, 0.0, 0.0], [0.0, -6.0, 0.0]]
+
+
+#### Single variable dual numbers
+
+def test_dual_slots():
+    x = sad.Dual(2)
+    assert x.val == 2.0
+    assert x.der == 1.0
+    with pytest.raises(AttributeError):
+        x.other = 1
+    with pytest.raises(ValueError):
+        sad.Dual('2')
+
+def test_dual_operations():
+    x = sad.Dual(0.5)
+    xs = sad.AutoDiff('x', 0.5)
+    f = (x * x + 3 * x - 2 / x) ** 2 - 2 ** x + x / (x + 1) - (1 - x) + (x - 4) * 2
+    fs = (xs * xs + 3 * xs - 2 / xs) ** 2 - 2 ** xs + xs / (xs + 1) - (-xs + 1) + (xs - 4) * 2
+    assert f.val == pytest.approx(fs.val)
+    assert f.der == pytest.approx(fs.der['x'])
+    assert -x == sad.Dual(-0.5, -1.0)
+    assert x < 1 and x <= x and x > 0 and x >= sad.Dual(0.5)
+
+def test_dual_functions():
+    x = sad.Dual(0.4)
+    for function in [sad.sin, sad.cos, sad.tan, sad.arcsin, sad.arccos, sad.arctan,
+                     sad.exp, sad.log, sad.sinh, sad.cosh, sad.tanh, sad.sqrt, sad.logistic]:
+        f = function(x)
+        fs = function(sad.AutoDiff('x', 0.4))
+        assert isinstance(f, sad.Dual)
+        assert f.val == pytest.approx(fs.val)
+        assert f.der == pytest.approx(fs.der['x'])
+    assert sad.log(x, base=10).der == pytest.approx(1 / (0.4 * math.log(10)))
+
+
+#### NumPy dispatch protocols
+
+def test_numpy_ufuncs():
+    x = sad.AutoDiff('x', 0.5)
+    for ufunc, function in [(np.sin, sad.sin), (np.cos, sad.cos), (np.tan, sad.tan), (np.exp, sad.exp),
+                            (np.log, sad.log), (np.arctan, sad.arctan), (np.tanh, sad.tanh), (np.sqrt, sad.sqrt)]:
+        assert ufunc(x) == function(x)
+    f = np.multiply(x, 3) + np.power(x, 2)
+    assert f.der['x'] == pytest.approx(4.0)
+    assert np.log10(x).der['x'] == pytest.approx(1 / (0.5 * math.log(10)))
+
+def test_numpy_object_arrays():
+    x = sad.AutoDiff('x', 0.5)
+    y = sad.AutoDiff('y', 2.0)
+    f = np.exp(np.array([x, y])) * np.array([1.0, 2.0])
+    assert f[0].der['x'] == pytest.approx(np.exp(0.5))
+    assert f[1].der['y'] == pytest.approx(2 * np.exp(2.0))
+    g = np.array([1.0, 2.0]) * x
+    assert isinstance(g, np.ndarray)
+    assert g[1].der['x'] == pytest.approx(2.0)
+
+def test_numpy_dual_and_batch():
+    assert np.sin(sad.Dual(0.5)).der == pytest.approx(np.cos(0.5))
+    b = np.sin(sad.AutoDiffBatch('x', [0.5, 1.0])) * np.array([1.0, 2.0])
+    assert isinstance(b, sad.AutoDiffBatch)
+    assert b.der['x'] == pytest.approx(np.cos([0.5, 1.0]) * [1.0, 2.0])
+
+def test_register_dispatch():
+    class Scaled(sad.AutoDiff):
+        pass
+    x = Scaled('x', 0.5)
+    assert type(sad.sin(x)) is sad.AutoDiff
+    assert sad.sin(x).der['x'] == pytest.approx(np.cos(0.5))
+
+    @sad.functions.register('sin', Scaled)
+    def _sinScaled(x):
+        return 'scaled'
+    try:
+        assert sad.sin(x) == 'scaled'
+        assert sad.sin(sad.AutoDiff('x', 0.5)).val == pytest.approx(np.sin(0.5))
+    finally:
+        del sad.functions._DISPATCH['sin'][Scaled]
+
+def test_primitive_table():
+    x = 0.3
+    for name, p in sad.functions.PRIMITIVES.items():
+        function = getattr(sad, name)
+        expected_val, expected_der = p.value(x), p.derivative(x)
+        assert p.scalar(x) == pytest.approx(expected_val)
+        assert p.scalar_derivative(x) == pytest.approx(expected_der)
+        assert function(x) == pytest.approx(expected_val)
+        assert function(np.array([x, x])) == pytest.approx([expected_val] * 2)
+        assert function(sad.AutoDiff('x', x)).der['x'] == pytest.approx(expected_der)
+        assert function(sad.Dual(x)).der == pytest.approx(expected_der)
+        assert function(sad.AutoDiffBatch('x', [x, x])).der['x'] == pytest.approx([expected_der] * 2)
+        assert function(sad.vectorize(['x', 'y'], [x, x])).der == pytest.approx(np.eye(2) * expected_der)
+        with sad.tape():
+            assert function(sad.AutoDiffReverse(x, 'x')).der['x'] == pytest.approx(expected_der)
+
+def test_primitive_definition():
+    p = sad.functions.primitive('cube', lambda x: x ** 3, lambda x: 3 * x ** 2)
+    try:
+        assert sad.functions._DISPATCH['cube'][sad.AutoDiffBatch].__name__ == '_cubeB'
+        y = sad.functions._dispatch('cube', sad.AutoDiff('x', 2.0))(sad.AutoDiff('x', 2.0))
+        assert y.val == 8.0 and y.der['x'] == 12.0
+        y = sad.functions._dispatch('cube', sad.Dual(2.0))(sad.Dual(2.0))
+        assert y.val == 8.0 and y.der == 12.0
+    finally:
+        del sad.functions.PRIMITIVES['cube'], sad.functions._DISPATCH['cube']
+
+def test_taylor_arithmetic():
+    x = sad.Taylor(2.0, order=3)
+    assert (x * x * x).coef.tolist() == [8.0, 12.0, 6.0, 1.0]
+    assert (x * x * x).derivatives().tolist() == [8.0, 12.0, 12.0, 6.0]
+    assert ((x + 1) - x * 2 + 3).coef.tolist() == [2.0, -1.0, 0.0, 0.0]
+    assert (1 - x).coef.tolist() == [-1.0, -1.0, 0.0, 0.0]
+    assert (-x).val == -2.0 and x.der == 1.0 and x.order == 3
+    # 1 / (1 - t) = 1 + t + t^2 + ...
+    t = sad.Taylor(0.0, order=6)
+    assert (1 / (1 - t)).coef.tolist() == [1.0] * 7
+    assert ((1 + t) / (1 - t)).coef.tolist() == [1.0] + [2.0] * 6
+    assert (t ** 3).coef.tolist() == [0, 0, 0, 1, 0, 0, 0]
+    assert (x ** 2.5).coef == pytest.approx(sad.exp(2.5 * sad.log(x)).coef)
+    assert (2 ** x).coef == pytest.approx(sad.exp(x * math.log(2)).coef)
+    assert x < 3 and x >= 2 and x == sad.Taylor(2.0, order=3) and x != sad.Taylor(2.0, order=2)
+    with pytest.raises(ValueError):
+        x + sad.Taylor(2.0, order=2)
+    with pytest.raises(ValueError):
+        t ** 0.5
+    with pytest.raises(ValueError):
+        sad.Taylor(1.0, order=-1)
+
+def test_taylor_functions():
+    x = sad.Taylor(0.3, order=6)
+    zero = np.zeros(6)
+    assert (sad.sin(x) ** 2 + sad.cos(x) ** 2).coef == pytest.approx(np.r_[1.0, zero])
+    assert (sad.cosh(x) ** 2 - sad.sinh(x) ** 2).coef == pytest.approx(np.r_[1.0, zero])
+    assert sad.tan(x).coef == pytest.approx((sad.sin(x) / sad.cos(x)).coef)
+    assert sad.tanh(x).coef == pytest.approx((sad.sinh(x) / sad.cosh(x)).coef)
+    assert sad.exp(sad.log(x)).coef == pytest.approx(x.coef)
+    assert sad.arcsin(sad.sin(x)).coef == pytest.approx(x.coef)
+    assert sad.arctan(sad.tan(x)).coef == pytest.approx(x.coef)
+    assert (sad.arccos(x) + sad.arcsin(x)).coef == pytest.approx(np.r_[math.pi / 2, zero])
+    assert sad.log(x, 10).coef == pytest.approx((sad.log(x) / math.log(10)).coef)
+    assert sad.sqrt(x).coef == pytest.approx(sad.exp(0.5 * sad.log(x)).coef)
+    assert np.sin(x).coef == pytest.approx(sad.sin(x).coef)
+
+def test_taylor_derivatives():
+    f = lambda x: sad.exp(sad.sin(x)) * sad.logistic(x) / (1 + x * x)
+    derivatives = sad.Taylor._make(sad.taylor(f, 0.7, order=5)).derivatives()
+    assert derivatives[0] == pytest.approx(f(0.7))
+    assert derivatives[1] == pytest.approx(f(sad.Dual(0.7)).der)
+    assert derivatives[2] == pytest.approx(sad.hessian(f, 0.7))
+    # Derivatives of exp(2x) at 0 are powers of 2
+    assert sad.taylor(lambda x: sad.exp(2 * x), 0.0, order=6) * np.cumprod([1, 1, 2, 3, 4, 5, 6]) == pytest.approx(2.0 ** np.arange(7))
+    assert sad.taylor(lambda x: 3.0, 1.0, order=2).tolist() == [3.0, 0.0, 0.0]
+
+# Out-of-domain and overflowing inputs give NumPy's nan and inf in every engine
+DOMAIN_EDGES = [
+    (sad.arcsin, 2.0, math.nan, math.nan),
+    (sad.arccos, -2.0, math.nan, math.nan),
+    (sad.arcsin, 1.0, math.pi / 2, math.inf),
+    (sad.log, -1.0, math.nan, -1.0),
+    (sad.log, 0.0, -math.inf, math.inf),
+    (sad.exp, 1000.0, math.inf, math.inf),
+    (sad.cosh, 1000.0, math.inf, math.inf),
+]
+
+@pytest.mark.filterwarnings('ignore::RuntimeWarning')
+@pytest.mark.parametrize('f, x, value, derivative', DOMAIN_EDGES)
+def test_domain_edges(f, x, value, derivative):
+    approx = lambda v: pytest.approx(v, nan_ok=True)
+    assert f(x) == approx(value)
+    assert f(np.array([x]))[0] == approx(value)
+    forward = f(sad.AutoDiff('x', x))
+    assert forward.val == approx(value) and forward.der['x'] == approx(derivative)
+    dual = f(sad.Dual(x, 1.0))
+    assert dual.val == approx(value) and dual.der == approx(derivative)
+    assert sad.value_and_grad(f)(x) == (approx(value), approx(derivative))
+    vector = f(sad.vectorize(['x'], [x]))
+    assert vector.val[0] == approx(value) and vector.der[0, 0] == approx(derivative)
+    batch = f(sad.AutoDiffBatch('x', [x, x]))
+    assert batch.val == approx([value] * 2) and batch.der['x'] == approx([derivative] * 2)
+
+def test_domain_edges_warn():
+    with pytest.warns(RuntimeWarning):
+        assert math.isnan(sad.arcsin(sad.AutoDiff('x', 2.0)).val)
+    with pytest.warns(RuntimeWarning):
+        assert sad.log(0.0, 10) == -math.inf
+
+def single_values():
+    return [sad.AutoDiff('x', 2.0), sad.Dual(2.0), sad.Taylor(2.0, order=2),
+            sad.AutoDiffDense('x', 2.0, registry=sad.VariableRegistry()), sad.AutoDiffReverse(2.0, 'x')]
+
+def test_array_functions_single_values():
+    with sad.tape():
+        for x in single_values():
+            assert np.sum(x) is x and np.mean(x) is x
+            assert np.dot(x, 3.0).val == pytest.approx(6.0)
+            assert np.dot(3.0, x).val == pytest.approx(6.0)
+            products = np.dot(x, np.array([1.0, 2.0]))
+            assert [y.val for y in products] == pytest.approx([2.0, 4.0])
+            assert [y.val for y in np.dot([1.0, 2.0], x)] == pytest.approx([2.0, 4.0])
+            with pytest.raises(TypeError):
+                np.sum(x, axis=0)
+
+def test_array_functions_batch():
+    x = sad.AutoDiffBatch('x', [1.0, 2.0, 3.0])
+    with pytest.raises(TypeError):
+        np.sum(x)
+    with pytest.raises(TypeError):
+        np.mean(x)
+    with pytest.raises(TypeError):
+        np.dot(x, np.ones(3))
+    with pytest.raises(TypeError):
+        np.dot(np.ones(3), x)
+    with pytest.raises(TypeError):
+        np.concatenate([x, x])
+
+def test_array_functions_vector():
+    v = sad.vectorize(['x', 'y'], [1.0, 3.0])
+    mean = np.mean(v)
+    assert mean.val == pytest.approx(2.0) and mean.der['y'] == pytest.approx(0.5)
+    assert np.dot(v, v).der['x'] == pytest.approx(2.0)
+    with pytest.raises(TypeError):
+        np.dot(v, sad.AutoDiffBatch('x', [1.0, 2.0]))
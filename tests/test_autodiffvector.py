@@ -464,3 +464,86 @@ def test_vector_tanh():
 
 
 
+### 8. Array-backed storage
+
+def test_vector_arrays():
+    vec = sad.vectorize(['x', 'y', 'z'], [1, 2, 3])
+    assert isinstance(vec.val, np.ndarray)
+    assert vec.der.shape == (3, 3)
+    assert vec.registry.names == ['x', 'y', 'z']
+    f = vec * vec + 2 * vec
+    assert f.val.tolist() == [3.0, 8.0, 15.0]
+    assert np.diag(f.der).tolist() == [4.0, 6.0, 8.0]
+    assert f.objects['y'].der == Counter({'y': 6.0})
+
+def test_vector_vector_operations():
+    v = sad.vectorize(['x', 'y'], [1.0, 2.0])
+    w = sad.vectorize(['a', 'b'], [3.0, 4.0])
+    f = v * w - v / w + w ** 2
+    x, y, a, b = sad.AutoDiff('x', 1.0), sad.AutoDiff('y', 2.0), sad.AutoDiff('a', 3.0), sad.AutoDiff('b', 4.0)
+    f1 = x * a - x / a + a ** 2
+    f2 = y * b - y / b + b ** 2
+    assert f.val == pytest.approx([f1.val, f2.val])
+    jacob = sad.jacobian(['x', 'y', 'a', 'b'], f)
+    assert jacob[0] == pytest.approx([f1.der['x'], 0.0, f1.der['a'], 0.0])
+    assert jacob[1] == pytest.approx([0.0, f2.der['y'], 0.0, f2.der['b']])
+    with pytest.raises(ValueError):
+        v + sad.vectorize(['x', 'y', 'z'], [1, 2, 3])
+
+def test_vector_broadcast():
+    v = sad.vectorize(['x', 'y', 'z'], [1.0, 2.0, 3.0])
+    s = sad.AutoDiffVector([sad.AutoDiff('s', 2.0)])
+    f = v * s + np.array([1.0, 2.0, 3.0])
+    assert f.val.tolist() == [3.0, 6.0, 9.0]
+    assert sad.jacobian(['s'], f)[:, 0].tolist() == [1.0, 2.0, 3.0]
+    assert f.variables == ['x', 'y', 'z']
+
+def test_vector_jacobian_no_copy():
+    v = sad.vectorize(['x', 'y'], [1.0, 2.0])
+    f = sad.exp(v) * 3
+    assert sad.jacobian(['x', 'y'], f) is f.der
+
+def test_vector_large():
+    n = 10000
+    grid = sad.AutoDiffVector([sad.AutoDiff('x', 1.0)]) * np.linspace(0, 1, n)
+    f = sad.sin(grid) * 2.0 + grid * grid
+    assert len(f) == n
+    assert f.variables[1] == 'x[1]'
+    assert sad.jacobian(['x'], f)[:, 0] == pytest.approx(2 * np.cos(np.linspace(0, 1, n)) * np.linspace(0, 1, n) + 2 * np.linspace(0, 1, n) ** 2)
+    assert f.val.shape == (n,)
+
+def test_vector_numpy():
+    v = sad.vectorize(['x', 'y'], [0.5, 1.0])
+    f = np.sin(v) * np.array([2.0, 3.0])
+    assert isinstance(f, sad.AutoDiffVector)
+    assert np.diag(f.der) == pytest.approx([2 * np.cos(0.5), 3 * np.cos(1.0)])
+    total = np.sum(f)
+    assert total.val == pytest.approx(2 * np.sin(0.5) + 3 * np.sin(1.0))
+    assert total.der['y'] == pytest.approx(3 * np.cos(1.0))
+    d = np.dot(v, np.array([1.0, 4.0]))
+    assert d.der['x'] == pytest.approx(1.0)
+    assert d.der['y'] == pytest.approx(4.0)
+
+def test_vector_getitem():
+    v = sad.vectorize(['a', 'b', 'c'], [1.0, 2.0, 3.0])
+    b = v[1]
+    assert type(b) is sad.AutoDiff
+    assert b.val == 2.0 and b.der == Counter({'b': 1.0})
+    assert v[-1].var == 'c'
+    w = v[1:]
+    assert w.variables == ['b', 'c']
+    assert w.registry is v.registry
+    assert v[[0, 2]].val.tolist() == [1.0, 3.0]
+    assert v[np.array([False, True, False])].variables == ['b']
+    d = v[1:] - v[:-1]
+    assert d.der.tolist() == [[-1.0, 1.0, 0.0], [0.0, -1.0, 1.0]]
+    assert [x.var for x in v] == ['a', 'b', 'c']
+
+def test_vector_concatenate():
+    v = sad.vectorize(['a', 'b'], [1.0, 2.0])
+    w = np.concatenate([v * 2, [5.0], sad.vectorize(['c'], [3.0])])
+    assert type(w) is sad.AutoDiffVector
+    assert w.val.tolist() == [2.0, 4.0, 5.0, 3.0]
+    assert sad.jacobian(['a', 'b', 'c'], w).tolist() == [[2, 0, 0], [0, 2, 0], [0, 0, 0], [0, 0, 1]]
+    with pytest.raises(ValueError):
+        np.concatenate([v, v], axis=1)
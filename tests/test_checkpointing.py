@@ -0,0 +1,76 @@
+import sys
+import numpy as np
+import pytest
+
+sys.path.append('..')
+import superautodiff as sad
+
+
+def step(x):
+    return np.array([0.99 * x[0] + 0.01 * sad.sin(x[1]), x[1] + 0.01 * x[0] * x[1]])
+
+def unrolled(x, n):
+    for _ in range(n):
+        x = step(x)
+    return x[0] * x[1]
+
+def test_checkpoint_matches_plain_gradient():
+    f = lambda x: sad.exp(x[0]) * x[1] + x[2] / x[0]
+    g = sad.checkpoint(f)
+    x = np.array([0.5, 2.0, 3.0])
+    value, gradient = sad.value_and_grad(lambda x: g(x) * x[1])(x)
+    expected = sad.value_and_grad(lambda x: f(x) * x[1])(x)
+    assert value == pytest.approx(expected[0])
+    assert gradient == pytest.approx(expected[1])
+
+def test_checkpoint_keeps_only_outputs_on_tape():
+    g = sad.checkpoint(lambda x, k: x * k + sad.sin(x) ** 2)
+    with sad.tape() as t:
+        x = sad.AutoDiffReverse(1.5, 'x')
+        y = g(np.array([x, 2.0]), 3.0)
+        assert y.shape == (2,)
+        assert len(t) == 3
+        assert y[1].val == pytest.approx(6.0 + np.sin(2.0) ** 2)
+        assert y[0].backward(['x']) == pytest.approx([3.0 + np.sin(3.0)])
+        # Constant outputs and nested checkpoints
+        z = sad.checkpoint(lambda x: [sad.checkpoint(lambda u: u * u)(x), 1.0])(x)
+        assert z[0].backward(['x']) == pytest.approx([3.0])
+
+def test_checkpoint_rejects_other_tapes():
+    with sad.tape():
+        y = sad.AutoDiffReverse(2.0, 'y')
+        with pytest.raises(ValueError):
+            sad.value_and_grad(sad.checkpoint(lambda x: x * y))(1.0)
+
+@pytest.mark.parametrize('n, snapshots', [(0, None), (1, None), (2, 1), (7, 0), (50, 2), (300, None)])
+def test_checkpoint_loop_matches_unrolled_loop(n, snapshots):
+    x = np.array([0.5, 1.0])
+    f = lambda x: np.prod(sad.checkpoint_loop(step, x, n, snapshots))
+    value, gradient = sad.value_and_grad(f)(x)
+    expected = sad.value_and_grad(lambda x: unrolled(x, n))(x)
+    assert value == pytest.approx(expected[0])
+    assert gradient == pytest.approx(expected[1])
+
+def test_checkpoint_loop_schedule():
+    calls = [0]
+    def counted(x):
+        calls[0] += 1
+        return step(x)
+    with sad.tape() as t:
+        x = sad.AutoDiffReverse._leaves(t, [0.5, 1.0])
+        y = sad.checkpoint_loop(counted, x, 1000, snapshots=10)
+        assert len(t) == 4
+        t.sweep([y[0].id, y[1].id])
+    # binomial(10 + 4, 10) >= 1000, so at most 4 + 2 evaluations per step
+    assert 1000 < calls[0] <= 6 * 1000
+
+def test_checkpoint_errors():
+    with pytest.raises(ValueError):
+        sad.value_and_grad(lambda x: sad.checkpoint_loop(lambda s: s[:1], x, 3)[0])(np.ones(2))
+    with pytest.raises(ValueError):
+        sad.value_and_grad(lambda x: sad.checkpoint_loop(step, x, -1)[0])(np.ones(2))
+    f = lambda x: sad.checkpoint(lambda u: u * u)(x)[0]
+    with pytest.raises(ValueError):
+        sad.compile(f, np.ones(2))
+    with pytest.raises(ValueError):
+        sad.hessian(f, np.ones(2))
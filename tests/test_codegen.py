@@ -0,0 +1,72 @@
+import os
+import subprocess
+import sys
+import numpy as np
+import pytest
+
+sys.path.append('..')
+import superautodiff as sad
+from superautodiff.codegen import generate, generate_source, load_generated
+
+
+def test_generated_gradients(f, tmp_path):
+    module = generate(f, np.array([0.5, 1.5, 2.5]), str(tmp_path))
+    for x in [np.array([0.7, 1.3, 2.1]), np.array([1.2, 0.4, 0.9])]:
+        value, gradient = sad.value_and_grad(f)(x)
+        assert module.value(x) == pytest.approx(value)
+        assert module.value_and_grad(x)[0] == pytest.approx(value)
+        assert module.grad(x) == pytest.approx(gradient)
+    X = np.random.RandomState(0).uniform(0.5, 2.0, (10, 3))
+    values, gradients = module.value_and_grad(X)
+    for x, value, gradient in zip(X, values, gradients):
+        expected = sad.value_and_grad(f)(x)
+        assert value == pytest.approx(expected[0])
+        assert gradient == pytest.approx(expected[1])
+
+def test_generated_jacobian(tmp_path):
+    def f(x):
+        return [x[0] * x[1], sad.sin(x[1]) + 2.0, 3.0, x[0]]
+    module = generate(f, np.ones(2), str(tmp_path))
+    x = np.array([2.0, 0.5])
+    value, jacobian = module.value_and_jacobian(x)
+    assert value == pytest.approx([1.0, np.sin(0.5) + 2.0, 3.0, 2.0])
+    assert jacobian == pytest.approx(np.array([[0.5, 2.0], [0.0, np.cos(0.5)], [0.0, 0.0], [1.0, 0.0]]))
+    assert module.jacobian(np.stack([x, x])).shape == (2, 4, 2)
+
+def test_generated_guards(tmp_path):
+    module = generate(lambda x: x[0] * x[1] if x[0] > 0 else x[1], np.ones(2), str(tmp_path))
+    assert module.value(np.array([3.0, 2.0])) == 6.0
+    with pytest.raises(sad.ControlFlowError):
+        module.value(np.array([-3.0, 2.0]))
+
+@pytest.mark.parametrize('optimize', [True, False])
+def test_generated_guards_after_output_and_constant(optimize, tmp_path):
+    # The comparison is made on a node recorded after the output
+    module = generate(lambda x: x[0] * x[0] if x[0] + 1 > 3 else x[0] + 1, np.array([5.0]), str(tmp_path), optimize)
+    assert module.value(np.array([4.0])) == 16.0
+    with pytest.raises(sad.ControlFlowError):
+        module.value(np.array([0.0]))
+    constant = generate(lambda x: 0.0 if x[0] > 0 else x[0] * 2, np.array([1.0]), str(tmp_path), optimize)
+    assert constant.value_and_grad(np.array([3.0])) == (0.0, pytest.approx(np.zeros(1)))
+    with pytest.raises(sad.ControlFlowError):
+        constant.value(np.array([-3.0]))
+
+@pytest.mark.parametrize('f', [0], indirect=True)
+def test_generated_cache(f, tmp_path):
+    module = generate(f, np.ones(3), str(tmp_path))
+    # The key depends on the structure of the graph, not on the traced values
+    assert generate_source(f, np.full(3, 2.0))[1] == module.KEY
+    assert generate_source(f, np.ones(4))[1] != module.KEY
+    assert generate_source(lambda x: f(x) + 1.0, np.ones(3))[1] != module.KEY
+    assert generate(f, np.full(3, 2.0), str(tmp_path)) is module
+    assert load_generated(module.KEY, str(tmp_path)) is module
+    assert os.listdir(str(tmp_path)) == ["sad_{}.py".format(module.KEY)]
+    with pytest.raises(KeyError):
+        load_generated('0' * 32, str(tmp_path))
+
+    # Another process imports the module without tracing f
+    script = ('import numpy as np\nfrom superautodiff.codegen import load_generated\n'
+              'print(load_generated({!r}, {!r}).value(np.array([1.0, 2.0, 3.0])))'.format(module.KEY, str(tmp_path)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([os.path.dirname(os.path.dirname(sad.__file__))] + sys.path))
+    output = subprocess.run([sys.executable, '-c', script], env=env, stdout=subprocess.PIPE, check=True).stdout
+    assert float(output) == pytest.approx(module.value(np.array([1.0, 2.0, 3.0])))
@@ -0,0 +1,147 @@
+import sys
+import numpy as np
+import pytest
+
+sys.path.append('..')
+import superautodiff as sad
+
+
+def test_compiled_matches_reverse_mode(f):
+    compiled = sad.compile(f, np.array([0.5, 1.5, 2.5]))
+    for x in [np.array([0.7, 1.3, 2.1]), np.array([1.2, 0.4, 0.9])]:
+        value, gradient = sad.value_and_grad(f)(x)
+        assert compiled(x) == pytest.approx(value)
+        assert compiled.value_and_grad(x)[0] == pytest.approx(value)
+        assert compiled.grad(x) == pytest.approx(gradient)
+
+@pytest.mark.parametrize('f', [1], indirect=True)
+def test_compiled_batch(f):
+    compiled = sad.compile(f, np.ones(3))
+    X = np.random.RandomState(0).uniform(0.5, 2.0, (20, 3))
+    values, gradients = compiled.value_and_grad(X)
+    assert values.shape == (20,)
+    assert gradients.shape == (20, 3)
+    for x, value, gradient in zip(X, values, gradients):
+        expected = sad.value_and_grad(f)(x)
+        assert value == pytest.approx(expected[0])
+        assert gradient == pytest.approx(expected[1])
+    assert compiled(X) == pytest.approx(values)
+    with pytest.raises(ValueError):
+        compiled(np.ones(4))
+
+def test_compiled_fuses_linear_chains():
+    n = 1000
+    compiled = sad.compile(lambda x: np.sum(x * x), np.ones(n))
+    # One multiplication step and one fused sum instead of a chain of n additions
+    assert compiled.n_steps == 2
+    x = np.linspace(0, 1, n)
+    assert compiled(x) == pytest.approx(np.sum(x * x))
+    assert compiled.grad(x) == pytest.approx(2 * x)
+
+def test_compiled_guards():
+    def f(x):
+        if x[0] > 0:
+            return x[0] * x[1]
+        return x[1] * x[1]
+    compiled = sad.compile(f, np.array([1.0, 2.0]))
+    assert compiled(np.array([3.0, 2.0])) == 6.0
+    with pytest.raises(sad.ControlFlowError):
+        compiled(np.array([-1.0, 2.0]))
+    with pytest.raises(sad.ControlFlowError):
+        compiled.value_and_grad(np.array([[1.0, 2.0], [-1.0, 2.0]]))
+
+def test_compiled_guards_after_output():
+    # The comparison is made on a node recorded after the output
+    compiled = sad.compile(lambda x: x[0] * x[0] if x[0] + 1 > 3 else x[0] + 1, np.array([5.0]))
+    assert compiled(np.array([4.0])) == 16.0
+    with pytest.raises(sad.ControlFlowError):
+        compiled(np.array([0.0]))
+    unoptimized = sad.compile(lambda x: x[0] * x[0] if x[0] + 1 > 3 else x[0] + 1, np.array([5.0]), optimize=False)
+    with pytest.raises(sad.ControlFlowError):
+        unoptimized(np.array([0.0]))
+
+def test_compiled_guards_constant_output():
+    compiled = sad.compile(lambda x: 0.0 if x[0] > 0 else x[0] * 2, np.array([1.0]))
+    assert compiled.value_and_grad(np.array([3.0])) == (0.0, pytest.approx(np.zeros(1)))
+    with pytest.raises(sad.ControlFlowError):
+        compiled(np.array([-3.0]))
+    with pytest.raises(sad.ControlFlowError):
+        compiled.value_and_grad(np.array([[1.0], [-3.0]]))
+
+def test_compiled_special_outputs():
+    constant = sad.compile(lambda x: 3.0, np.ones(2))
+    assert constant(np.zeros(2)) == 3.0
+    assert constant.value_and_grad(np.zeros((4, 2)))[1].shape == (4, 2)
+    leaf = sad.compile(lambda x: x[1], np.ones(3))
+    assert leaf.value_and_grad(np.array([1.0, 2.0, 3.0])) == (2.0, pytest.approx(np.array([0.0, 1.0, 0.0])))
+    scalar = sad.compile(lambda x: x ** 3, 1.0)
+    assert scalar.value_and_grad(2.0) == (8.0, pytest.approx(12.0))
+
+def test_compiled_custom_nodes():
+    def f(x):
+        return sad.AutoDiffReverse(1.0, 'z', der={x[0].var: 2.0}) * x[1]
+    with pytest.raises(ValueError):
+        sad.compile(f, np.ones(2))
+
+def test_differentiable_cache():
+    calls = []
+
+    @sad.differentiable(cache_size=2)
+    def f(x, scale=1.0):
+        calls.append(1)
+        return scale * np.sum(sad.sin(x) * x)
+
+    x = np.array([0.5, 1.5])
+    value, gradient = f.value_and_grad(x)
+    expected = sad.value_and_grad(lambda x: np.sum(sad.sin(x) * x))(x)
+    assert value == pytest.approx(expected[0])
+    assert gradient == pytest.approx(expected[1])
+    assert f(x + 1) == pytest.approx(np.sum(np.sin(x + 1) * (x + 1)))
+    assert f.grad(x, scale=2.0) == pytest.approx(2 * gradient)
+    assert f.cache_info() == sad.compiled.CacheInfo(hits=1, misses=2, invalidations=0, maxsize=2, currsize=2)
+    assert len(calls) == 2
+
+    # The least recently used traces, of x with either scale, are evicted
+    f(np.ones(3))
+    f(np.ones(3, dtype=int))
+    assert f.cache_info().currsize == 2
+    assert f.cache_info().misses == 4
+    f(x)
+    assert f.cache_info().misses == 5
+
+    # Arguments that cannot be hashed are traced on every call
+    assert f(x, scale=np.array(2.0)) == pytest.approx(2 * value)
+    assert f(x, scale=np.array(2.0)) == pytest.approx(2 * value)
+    assert f.cache_info().misses == 7
+    assert f.cache_info().currsize == 2
+    f.cache_clear()
+    assert f.cache_info() == sad.compiled.CacheInfo(0, 0, 0, 2, 0)
+
+def test_differentiable_invalidation():
+    @sad.differentiable
+    def f(x):
+        return x[0] * x[1] if x[0] > 0 else x[1] * x[1]
+
+    assert f(np.array([2.0, 3.0])) == 6.0
+    assert f.value_and_grad(np.array([-2.0, 3.0])) == (9.0, pytest.approx(np.array([0.0, 6.0])))
+    assert f(np.array([-1.0, 3.0])) == 9.0
+    info = f.cache_info()
+    assert (info.hits, info.misses, info.invalidations, info.maxsize, info.currsize) == (2, 2, 1, 128, 1)
+
+def test_differentiable_invalidation_after_output():
+    @sad.differentiable
+    def f(x):
+        return x[0] * x[0] if x[0] + 1 > 3 else x[0] + 1
+
+    assert f(np.array([5.0])) == 25.0
+    assert f(np.array([0.0])) == 1.0
+    assert f.value_and_grad(np.array([4.0])) == (16.0, pytest.approx(np.array([8.0])))
+    assert f.cache_info().invalidations == 2
+
+    @sad.differentiable
+    def g(x):
+        return 0.0 if x[0] > 0 else x[0] * 2
+
+    assert g(np.array([1.0])) == 0.0
+    assert g.value_and_grad(np.array([-3.0])) == (-6.0, pytest.approx(np.array([2.0])))
+    assert g.cache_info().invalidations == 1
@@ -0,0 +1,51 @@
+import sys
+import numpy as np
+import pytest
+
+sys.path.append('..')
+import superautodiff as sad
+
+
+def finite_difference_hessian(f, x, h=1e-6):
+    gradient = sad.grad(f)
+    columns = []
+    for i in range(len(x)):
+        e = np.zeros(len(x))
+        e[i] = h
+        columns.append((gradient(x + e) - gradient(x - e)) / (2 * h))
+    return np.array(columns).T
+
+def test_hessian_matches_finite_differences(f):
+    x = np.array([0.7, 1.3, 2.1])
+    H = sad.hessian(f, x)
+    assert H == pytest.approx(finite_difference_hessian(f, x), rel=1e-6, abs=1e-6)
+    assert H == pytest.approx(H.T)
+
+def test_hvp():
+    f = lambda x: x[0] ** 3 * x[1] + x[1] * x[1]
+    x = np.array([2.0, 3.0])
+    H = np.array([[6 * 2 * 3, 3 * 4], [3 * 4, 2]])
+    assert sad.hvp(f, x, [1.0, -1.0]) == pytest.approx(H @ np.array([1.0, -1.0]))
+    V = np.array([[1.0, 0.0], [0.5, 2.0], [-1.0, 1.0]])
+    assert sad.hvp(f, x, V) == pytest.approx(V @ H)
+    with pytest.raises(ValueError):
+        sad.hvp(f, x, [1.0, 2.0, 3.0])
+
+def test_hessian_shapes():
+    assert sad.hessian(lambda x: x ** 3, 2.0) == pytest.approx(12.0)
+    H = sad.hessian(lambda x: x[0, 0] * x[1, 1], np.ones((2, 2)))
+    assert H.shape == (2, 2, 2, 2)
+    assert H[0, 0, 1, 1] == 1.0 and H[1, 1, 0, 0] == 1.0
+    assert np.count_nonzero(H) == 2
+    # Linear and constant functions have a zero Hessian
+    assert sad.hessian(lambda x: 2 * x[0] - x[1] + 3, [1.0, 2.0]).tolist() == [[0.0, 0.0], [0.0, 0.0]]
+    assert sad.hessian(lambda x: 3.0, [1.0, 2.0]).tolist() == [[0.0, 0.0], [0.0, 0.0]]
+    assert sad.hvp(lambda x: x[0] * x[0], [1.0, 2.0, 3.0], [1.0, 1.0, 1.0]).tolist() == [2.0, 0.0, 0.0]
+
+def test_tape_op_codes():
+    from superautodiff.tapes import OPS
+    with sad.tape() as t:
+        x = sad.AutoDiffReverse(2.0, 'x')
+        y = sad.sin(x * 3.0) / x - 1.0
+        assert [OPS[op] for op in t.ops] == ['leaf', 'mulc', 'sin', 'div', 'subc']
+        assert t.constants.tolist() == [0.0, 3.0, 0.0, 0.0, 1.0]
@@ -0,0 +1,44 @@
+import os
+import subprocess
+import sys
+
+sys.path.append('..')
+import superautodiff as sad
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that only some features need, and that import superautodiff must not load
+LAZY = ['pandas', 'scipy', 'concurrent.futures', 'multiprocessing', 'zipfile', 'hashlib']
+
+
+def run(code):
+    return subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=ROOT,
+                          capture_output=True, text=True, check=True)
+
+def import_time():
+    """Returns the microseconds import superautodiff takes beyond importing numpy, and the modules it loaded"""
+    result = run('import sys, superautodiff; print(" ".join(sys.modules))')
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        fields = line.split('|')
+        if line.startswith('import time:') and fields[1].strip().isdigit():
+            cumulative.setdefault(fields[2].strip(), int(fields[1]))
+    return cumulative['superautodiff'] - cumulative['numpy'], result.stdout.split()
+
+def test_import_is_fast_and_lazy():
+    # The fastest of a few runs, to leave out the noise of a busy machine
+    times, modules = zip(*(import_time() for _ in range(3)))
+    for name in LAZY:
+        assert name not in modules[0]
+    assert min(times) < 100000
+
+def test_pass_table_without_pandas():
+    code = ('import sys; sys.modules["pandas"] = None\n'
+            'import superautodiff as sad\n'
+            'x = sad.AutoDiffReverse(2.0, "x")\n'
+            'print((x * x).backward())\n'
+            'try:\n'
+            '    x.pass_table()\n'
+            'except ImportError as error:\n'
+            '    print(error)\n')
+    assert run(code).stdout.splitlines() == ['[4.]', 'pass_table() and Tape.table() require pandas']
@@ -0,0 +1,73 @@
+import sys
+import numpy as np
+import pytest
+
+sys.path.append('..')
+import superautodiff as sad
+from superautodiff.optimize import optimize
+from superautodiff.tapes import OP_CODES
+
+
+FUNCTIONS = [
+    lambda x: sad.sin(x[0]) * sad.sin(x[0]) + sad.sin(x[0]) * x[1],
+    lambda x: -(-x[0]) * 1 + 0 + (x[1] ** 1 - 0) / 1 * (x[0] + x[1]) * (x[1] + x[0]),
+    lambda x: sad.AutoDiffReverse(2.0) * 3 * x[0] + sad.exp(sad.AutoDiffReverse(0.5)) - (2 - (3 - x[1])),
+    lambda x: np.sum(sad.sqrt(x) * sad.sqrt(x)) + sad.log(x[0] * x[1]) + sad.log(x[1] * x[0]),
+]
+
+@pytest.mark.parametrize('f', FUNCTIONS)
+def test_optimize_preserves_gradients(f):
+    x = np.array([0.7, 1.9])
+    with sad.tape() as t:
+        y = f(sad.AutoDiffReverse._leaves(t, x))
+        expected = t.sweep(y.id)[:2]
+        optimized, (output,), stats = optimize(t, [y.id], 2)
+        assert optimized.values[output] == pytest.approx(y.val)
+        assert optimized.sweep(output)[:2] == pytest.approx(expected)
+        assert len(optimized) < len(t)
+        assert stats['removed'] == len(t) - len(optimized)
+        assert stats['removed'] == stats['cse'] + stats['identities'] + stats['dead']
+
+def test_optimize_passes():
+    with sad.tape() as t:
+        x = sad.AutoDiffReverse._leaves(t, np.array([0.5, 2.0]))
+        # sin(x[0]) is recorded twice
+        y = sad.sin(x[0]) * sad.sin(x[0])
+        assert optimize(t, [y.id], 2)[2]['cse'] == 1
+        # x[0] * 1 + 0 and -(-x[1]) are x[0] and x[1]
+        z = (x[0] * 1 + 0) * -(-x[1])
+        optimized, (output,), stats = optimize(t, [z.id], 2)
+        assert stats['identities'] == 3
+        assert len(optimized) == 3
+        assert optimized.parents[output].tolist() == [0, 1]
+        # Constants created inside the function are folded into a single leaf
+        c = sad.AutoDiffReverse(2.0) * 3 + 1
+        w = c * x[0]
+        optimized, (output,), stats = optimize(t, [w.id], 2)
+        assert stats['folded'] == 2
+        assert len(optimized) == 3
+        assert optimized.ops[output] == OP_CODES['mulc']
+        assert optimized.constants[output] == 7.0
+
+def test_optimize_keeps_named_leaves_and_guards():
+    with sad.tape() as t:
+        x = sad.AutoDiffReverse(2.0, 'x')
+        unused = sad.AutoDiffReverse(3.0, 'unused')
+        t.tracing = True
+        assert x > 1
+        y = x * 1 * x
+        optimized, (output,), stats = optimize(t, [y.id])
+        assert [optimized.name(i) for i in optimized.leaves()] == ['x', 'unused']
+        assert optimized.guards == [('gt', 0, -1, 1.0, True)]
+        assert optimized.sweep(output)[0] == 4.0
+
+def test_compiled_functions_are_optimized():
+    f = lambda x: np.sum(sad.sin(x) * sad.sin(x)) * 1 - -x[0]
+    compiled = sad.compile(f, np.ones(3))
+    assert compiled.optimization['cse'] == 3
+    assert compiled.optimization['identities'] == 1
+    unoptimized = sad.compile(f, np.ones(3), optimize=False)
+    assert unoptimized.optimization is None
+    assert compiled.n_nodes < unoptimized.n_nodes
+    x = np.array([0.3, 0.6, 0.9])
+    assert compiled.value_and_grad(x)[1] == pytest.approx(unoptimized.value_and_grad(x)[1])
@@ -0,0 +1,47 @@
+import sys
+import numpy as np
+import pytest
+
+sys.path.append('..')
+import superautodiff as sad
+
+
+def residual(u):
+    return np.concatenate([u[:1], u[:-2] - 2 * u[1:-1] + u[2:] + sad.sin(u[1:-1]), u[-1:] * u[0]])
+
+def test_batch_jacobian_matches_sparse_jacobian():
+    X = np.random.RandomState(0).uniform(-1, 1, (9, 6))
+    expected = np.array([sad.sparse_jacobian(residual, x).toarray() for x in X])
+    assert sad.batch_jacobian(residual, X, workers=1) == pytest.approx(expected)
+    assert sad.batch_jacobian(residual, X, workers=2, chunksize=3) == pytest.approx(expected)
+
+def test_batch_jacobian_outputs():
+    X = np.array([[1.0, 2.0], [3.0, -1.0], [0.5, 0.5]])
+    # Lists of elements, including constants, are accepted as outputs
+    J = sad.batch_jacobian(lambda v: [v[0] * v[1], 2.0, sad.exp(v[1])], X, workers=2)
+    assert J.shape == (3, 3, 2)
+    assert J[1] == pytest.approx(np.array([[-1.0, 3.0], [0.0, 0.0], [0.0, np.exp(-1.0)]]))
+    assert sad.batch_jacobian(residual, X[:1]).shape == (1, 2, 2)
+    assert sad.batch_jacobian(residual, np.zeros((0, 3))).shape == (0, 0, 3)
+
+def test_batch_jacobian_errors():
+    with pytest.raises(ValueError):
+        sad.batch_jacobian(residual, np.ones(3))
+    with pytest.raises(ValueError):
+        sad.batch_jacobian(residual, np.ones((2, 3)), workers=0)
+
+def test_jacobian_of_function(monkeypatch):
+    x = np.random.RandomState(1).uniform(-1, 1, 7)
+    expected = sad.sparse_jacobian(residual, x).toarray()
+    assert sad.jacobian(residual, x) == pytest.approx(expected)
+    assert sad.jacobian(residual, x, workers=3) == pytest.approx(expected)
+    # Columns are evaluated in blocks of at most COLUMN_BLOCK tangent directions
+    monkeypatch.setattr(sad.parallel, 'COLUMN_BLOCK', 2)
+    assert sad.jacobian(residual, x) == pytest.approx(expected)
+    assert sad.jacobian(residual, x, workers=2) == pytest.approx(expected)
+    out = np.zeros((7, 7))
+    assert sad.jacobian(residual, x, out=out) is out
+    assert out == pytest.approx(expected)
+    assert sad.jacobian(lambda v: [v[0] * v[1], 1.0], [2.0, 3.0]) == pytest.approx(np.array([[3.0, 2.0], [0.0, 0.0]]))
+    with pytest.raises(ValueError):
+        sad.jacobian(residual, x, workers=0)
@@ -0,0 +1,63 @@
+import sys
+import numpy as np
+import pytest
+
+sys.path.append('..')
+import superautodiff as sad
+
+
+def residual(u):
+    """Discretised u'' + u^2 = sin(u) with Dirichlet boundary rows"""
+    interior = u[:-2] - 2 * u[1:-1] + u[2:] + u[1:-1] ** 2 - sad.sin(u[1:-1])
+    return np.concatenate([u[:1] - 1.0, interior, u[-1:]])
+
+def dense_jacobian(f, x):
+    names = ['x[{}]'.format(j) for j in range(len(x))]
+    return sad.jacobian(names, f(sad.vectorize(names, list(x))))
+
+def test_color_columns():
+    colors = sad.color_columns(np.eye(8) + np.eye(8, k=1) + np.eye(8, k=-1) + np.eye(8, k=2))
+    assert colors.max() + 1 == 4
+    pattern = np.eye(8) + np.eye(8, k=1) + np.eye(8, k=-1) + np.eye(8, k=2)
+    for i in range(8):
+        used = colors[pattern[i] != 0]
+        assert len(used) == len(set(used))
+    assert sad.color_columns(np.eye(5)).tolist() == [0] * 5
+    assert sad.color_columns(np.ones((2, 4))).tolist() == [0, 1, 2, 3]
+
+def test_jacobian_sparsity():
+    pattern = sad.jacobian_sparsity(residual, np.linspace(0, 1, 6))
+    assert pattern.shape == (6, 6)
+    assert pattern.nnz == 2 + 3 * 4
+
+def test_sparse_jacobian_banded():
+    x = np.linspace(0, 1, 50)
+    J = sad.sparse_jacobian(residual, x)
+    assert J.format == 'csr'
+    assert J.toarray() == pytest.approx(dense_jacobian(residual, x))
+    # Three colours for a tridiagonal pattern, whatever the size
+    assert sad.color_columns(sad.jacobian_sparsity(residual, x)).max() + 1 == 3
+
+def test_sparse_jacobian_given_sparsity():
+    x = np.linspace(0, 1, 20)
+    pattern = sad.jacobian_sparsity(residual, x).toarray()
+    J = sad.sparse_jacobian(residual, x, sparsity=pattern)
+    assert J.toarray() == pytest.approx(dense_jacobian(residual, x))
+    with pytest.raises(ValueError):
+        sad.sparse_jacobian(residual, x, sparsity=pattern[:, 1:])
+    with pytest.raises(ValueError):
+        sad.sparse_jacobian(residual, x, sparsity=pattern[1:])
+
+def test_sparse_jacobian_list_output():
+    def f(x):
+        return [x[0] * x[1], 3.0, sad.exp(x[2])]
+    x = np.array([1.0, 2.0, 0.5])
+    J = sad.sparse_jacobian(f, x)
+    assert J.toarray() == pytest.approx(np.array([[2.0, 1.0, 0.0], [0.0, 0.0, 0.0], [0.0, 0.0, np.exp(0.5)]]))
+
+def test_sparse_jacobian_large():
+    n = 20000
+    x = np.linspace(0, 1, n)
+    J = sad.sparse_jacobian(residual, x)
+    assert J.nnz == 2 + 3 * (n - 2)
+    assert J[n // 2, n // 2] == pytest.approx(-2 + 2 * x[n // 2] - np.cos(x[n // 2]))